@@ -0,0 +1,119 @@
+"""Animation level of detail by the distance from the camera."""
+
+import bisect
+import sys
+
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    sys.stderr.write("NumPy not found.\n")
+    exit()
+
+
+# Name, max. distance and animation update interval in frames. Zero
+# interval freezes the pose.
+DEFAULT_BANDS = (("near", 20.0, 1),
+                 ("mid", 50.0, 4),
+                 ("far", float("inf"), 0))
+
+
+class ActorLOD:
+    """Sorts the animated actors into the distance bands.
+
+    An actor leaves its band only when it is farther or nearer than the
+    band's limit by the hysteresis, so an actor walking along a limit
+    doesn't switch every frame. Actors sorted in the current frame are
+    counted per band.
+    """
+
+    def __init__(self, bands: tuple = DEFAULT_BANDS,
+                 hysteresis_m: float = 2.0):
+        """Set the bands.
+
+        Parameters:
+        bands -- (name, max. distance, update interval) from the
+                 nearest, the last one without a limit.
+        hysteresis_m -- distance past a limit that switches the band.
+        """
+
+        self.band_names = [name for name, _, _ in bands]
+        self.update_intervals = [interval for _, _, interval in bands]
+        self.counts = dict.fromkeys(self.band_names, 0)
+
+        self.__base_intervals = list(self.update_intervals)
+        self.__limits_m = [limit_m for _, limit_m, _ in bands[:-1]]
+        self.__hysteresis_m = hysteresis_m
+        self.__counted_frame = -1
+
+    def classify(self, distances_m: np.ndarray,
+                 bands: np.ndarray) -> np.ndarray:
+        """Return the band indices of many actors.
+
+        Parameters:
+        distances_m -- distances of the actors from the camera.
+        bands -- their bands from the last frame, -1 if none yet.
+        """
+
+        nearer = np.searchsorted(self.__limits_m,
+                                 distances_m - self.__hysteresis_m)
+        farther = np.searchsorted(self.__limits_m,
+                                  distances_m + self.__hysteresis_m)
+        new_bands = np.clip(bands, nearer, farther)
+
+        unknown = bands < 0
+        new_bands[unknown] = np.searchsorted(self.__limits_m,
+                                             distances_m[unknown])
+
+        self.__count(np.bincount(new_bands,
+                                 minlength=len(self.band_names)).tolist())
+        return new_bands
+
+    def classify_one(self, distance_m: float, band: int) -> int:
+        """Return the band index of a single actor.
+
+        Parameters:
+        distance_m -- distance of the actor from the camera.
+        band -- its band from the last frame, -1 if none yet.
+        """
+
+        if band < 0:
+            new_band = bisect.bisect_left(self.__limits_m, distance_m)
+        else:
+            new_band = min(max(band, bisect.bisect_left(
+                self.__limits_m, distance_m - self.__hysteresis_m)),
+                bisect.bisect_left(self.__limits_m,
+                                   distance_m + self.__hysteresis_m))
+
+        counts = [0] * len(self.band_names)
+        counts[new_band] = 1
+        self.__count(counts)
+
+        return new_band
+
+    def scale_intervals(self, factor: int):
+        """Multiply the update intervals of the bands, e.g. under load.
+
+        Frozen bands stay frozen.
+
+        Parameters:
+        factor -- multiple of the intervals given to the constructor.
+        """
+
+        self.update_intervals = [interval * factor
+                                 for interval in self.__base_intervals]
+
+    def __count(self, counts: list):
+        """Add the actors to the counters of the current frame.
+
+        Parameters:
+        counts -- number of the actors per band.
+        """
+
+        frame = globalClock.getFrameCount()
+
+        if frame != self.__counted_frame:
+            self.__counted_frame = frame
+            self.counts = dict.fromkeys(self.band_names, 0)
+
+        for name, count in zip(self.band_names, counts):
+            self.counts[name] += count
@@ -0,0 +1,237 @@
+"""Actor animation driven by the Panda3D anim controls."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:  # Annotations only, imported by the animated actors.
+    from direct.actor.Actor import Actor
+
+
+class AnimationDriver:
+    """Loops the movement clips natively and crossfades between them.
+
+    The frames are advanced by the Panda3D clock, not by the driver, so
+    a clip that plays steadily or an idle pose costs no Python work per
+    frame. The driver only changes something when the clip or the speed
+    does and while a crossfade lasts.
+
+    Distant actors can be animated less often, the driver poses their
+    clip manually every few frames then, without crossfades, or keeps
+    their pose frozen.
+    """
+
+    BLEND_S = 0.2  # Crossfade duration between the clips.
+    PLAY_RATE_EPSILON = 0.01  # Smaller changes keep the current rate.
+
+    def __init__(self, actor: Actor, clip_speeds_m_per_s: dict,
+                 idle_pose: tuple):
+        """Enable the blending and pose the idle frame.
+
+        Parameters:
+        actor -- animated model with the clips loaded.
+        clip_speeds_m_per_s -- clip name: ground speed that the clip
+                               shows at its native frame rate.
+        idle_pose -- (clip name, frame) held while standing still.
+        """
+
+        self.__actor = actor
+        self.__clip_speeds_m_per_s = dict(clip_speeds_m_per_s)
+        self.__idle_pose = idle_pose
+
+        self.__clip = None  # Looped clip, None while idle.
+        self.__fading_out = {}  # Clip name: remaining weight.
+        self.__play_rate = 0.0
+        self.__update_interval = 1  # Frames, 1 loops natively.
+        self.__frames_to_pose = 0
+        self.__manual_frame = 0.0
+
+        self.__actor.enableBlend()
+        self.__hold_idle_pose()
+
+    def load_state(self, clip: str, frame: float):
+        """Jump to a saved clip frame, without a crossfade.
+
+        Parameters:
+        clip -- looped clip, None to stand still.
+        frame -- frame of the clip.
+        """
+
+        self.__hold_idle_pose()
+
+        if clip is None:
+            return
+
+        self.__start(clip)
+        control = self.__actor.getAnimControl(clip)
+        control.pose(frame)
+
+        if self.__update_interval == 1:
+            control.loop(False)
+        else:
+            self.__take_over()
+            self.__manual_frame = frame
+
+    def save_state(self) -> tuple:
+        """Return the looped clip, None while idle, and its frame."""
+
+        if self.__clip is None:
+            return None, 0.0
+
+        if self.__update_interval == 1:
+            control = self.__actor.getAnimControl(self.__clip)
+            return self.__clip, \
+                control.getFullFframe() % control.getNumFrames()
+        return self.__clip, self.__manual_frame
+
+    def set_update_interval(self, frames: int):
+        """Animate every frame, every n-th one or freeze the pose.
+
+        Parameters:
+        frames -- 1 loops the clip natively, more poses it every that
+                  many frames, 0 freezes it.
+        """
+
+        if frames == self.__update_interval:
+            return
+
+        was_native = self.__update_interval == 1
+        self.__update_interval = frames
+
+        if self.__clip is None:  # The idle pose is frozen anyway.
+            return
+
+        if frames == 1:
+            self.__actor.getAnimControl(self.__clip).loop(False)
+        elif was_native:
+            self.__take_over()
+
+    def update(self, clip: str, speed_m_per_s: float, dt_s: float):
+        """Follow the movement of the actor.
+
+        Parameters:
+        clip -- clip to loop, None to stand still.
+        speed_m_per_s -- ground speed of the actor.
+        dt_s -- duration of the frame, advances the crossfade.
+        """
+
+        if clip != self.__clip:
+            if clip is None:
+                self.__hold_idle_pose()
+                return
+            self.__start(clip)
+
+            if self.__update_interval != 1:
+                self.__take_over()
+
+        if self.__fading_out:
+            self.__fade(dt_s)
+
+        if clip is None:
+            return
+
+        play_rate = speed_m_per_s / self.__clip_speeds_m_per_s[clip]
+
+        if abs(play_rate - self.__play_rate) > self.PLAY_RATE_EPSILON:
+            self.__play_rate = play_rate
+            self.__actor.setPlayRate(play_rate, clip)
+
+        if self.__update_interval > 1:
+            self.__pose_manually(dt_s)
+
+    def __fade(self, dt_s: float):
+        """Move the weight from the fading clips to the looped one.
+
+        Parameters:
+        dt_s -- duration of the frame.
+        """
+
+        step = dt_s / self.BLEND_S
+
+        for faded_clip in list(self.__fading_out):
+            weight = self.__fading_out[faded_clip] - step
+
+            if weight <= 0.0:
+                del self.__fading_out[faded_clip]
+                self.__actor.stop(faded_clip)
+                self.__actor.setControlEffect(faded_clip, 0.0)
+            else:
+                self.__fading_out[faded_clip] = weight
+                self.__actor.setControlEffect(faded_clip, weight)
+
+        self.__actor.setControlEffect(
+            self.__clip, 1.0 - sum(self.__fading_out.values()))
+
+    def __hold_idle_pose(self):
+        """Stop every clip and pose the idle frame once."""
+
+        clip, frame = self.__idle_pose
+
+        for name in self.__clip_speeds_m_per_s:
+            self.__actor.setControlEffect(name, 0.0)
+        self.__actor.stop()
+
+        self.__actor.setControlEffect(clip, 1.0)
+        self.__actor.pose(clip, frame)
+
+        self.__clip = None
+        self.__fading_out.clear()
+        self.__play_rate = 0.0
+
+    def __pose_manually(self, dt_s: float):
+        """Advance the clip and pose it every update interval.
+
+        Parameters:
+        dt_s -- duration of the frame.
+        """
+
+        control = self.__actor.getAnimControl(self.__clip)
+        self.__manual_frame = (self.__manual_frame
+                               + dt_s * control.getFrameRate()) \
+            % control.getNumFrames()
+        self.__frames_to_pose -= 1
+
+        if self.__frames_to_pose <= 0:
+            self.__frames_to_pose = self.__update_interval
+            control.pose(self.__manual_frame)
+
+    def __start(self, clip: str):
+        """Loop the clip and fade out the previous one.
+
+        Parameters:
+        clip -- clip to loop.
+        """
+
+        was_fading_out = self.__fading_out.pop(clip, None) is not None
+
+        if self.__clip is not None:
+            self.__fading_out[self.__clip] = 1.0 - sum(
+                self.__fading_out.values())
+        self.__actor.setControlEffect(clip, 1.0 - sum(
+            self.__fading_out.values()))
+
+        control = self.__actor.getAnimControl(clip)
+
+        # Continue from the same phase of the step, e.g. walk to run.
+        if self.__clip is not None and not was_fading_out:
+            phase = self.__actor.getCurrentFrame(self.__clip) \
+                / self.__actor.getNumFrames(self.__clip)
+            control.pose(phase * control.getNumFrames())
+        control.loop(False)
+
+        self.__clip = clip
+        self.__play_rate = 0.0
+
+    def __take_over(self):
+        """Stop the native loop and the crossfade of the current clip."""
+
+        for faded_clip in self.__fading_out:
+            self.__actor.stop(faded_clip)
+            self.__actor.setControlEffect(faded_clip, 0.0)
+        self.__fading_out.clear()
+
+        control = self.__actor.getAnimControl(self.__clip)
+        self.__actor.setControlEffect(self.__clip, 1.0)
+        self.__manual_frame = control.getFrame()
+        self.__frames_to_pose = 0
+        control.stop()
@@ -0,0 +1,446 @@
+"""The game loop shared by the windowed app and the benchmarks."""
+
+import atexit
+import os
+import sys
+import time
+
+try:
+    from direct.gui.OnscreenText import OnscreenText
+    from direct.showbase.ShowBase import ShowBase
+    from direct.task.Task import Task
+    from panda3d.core import PerspectiveLens
+    from panda3d.core import loadPrcFileData
+except ModuleNotFoundError:
+    sys.stderr.write("Panda3d not found.\n")
+    exit()
+
+
+from collisions import Collisions
+from fixed_step import FixedStep
+import controls
+from input_record import Recorder
+from profiler import FrameProfiler
+from physics import Physics
+import snapshot
+from tpp_camera import TPPCamera
+from world import World
+
+
+class Application(ShowBase):
+    """Start the app using the Panda3D API."""
+
+    def __init__(self, headless: bool = False, record_path: str = None,
+                 profile: bool = False, frame_budget_ms: float = 0.0,
+                 crowd_size: int = 0, sim_rate_hz: float = 60.0,
+                 tiles_dir: str = None, sim_workers: int = 0,
+                 snapshots: bool = False, snapshots_dir: str = ".",
+                 movable_area_path: str = None,
+                 navigation: bool = False,
+                 collision_tolerance_m: float = 0.1,
+                 quality_budget_ms: float = 0.0,
+                 quality_log_path: str = None, telemetry_path: str = None):
+        """Create the window and start loading the world.
+
+        The main loop starts when the world is ready.
+
+        Parameters:
+        headless -- run without a window and a GPU, e.g. on a CI box.
+                    The input has to be provided by the
+                    controls.input_source then.
+        record_path -- file to append the per-frame input to.
+        profile -- time the frame stages for the PStats and JSON dumps.
+        frame_budget_ms -- dump the profile when a frame takes longer.
+        crowd_size -- number of the wandering NPCs.
+        sim_rate_hz -- simulation steps per second, whatever the FPS.
+        tiles_dir -- terrain tile set streamed around the player instead
+                     of the terrain model.
+        sim_workers -- processes moving the NPCs, zero for none.
+        snapshots -- keep the world state of every simulation step for
+                     rewinding and saving.
+        snapshots_dir -- directory the saved snapshots are written to.
+        movable_area_path -- JSON file of the walkable polygons replacing
+                             the rectangular movable area.
+        navigation -- the NPCs walk to the random goals along the paths
+                      found over the terrain model.
+        collision_tolerance_m -- max. height error of the simplified
+                                 terrain collision mesh.
+        quality_budget_ms -- frame time kept by lowering the simulation
+                             rate and the details, zero keeps them.
+        quality_log_path -- file to append the quality changes to.
+        telemetry_path -- file to append the per-frame metrics to, the
+                          stages are timed as with the profile.
+        """
+
+        self.__start_s = time.perf_counter()
+
+        # Load the models in parallel.
+        loadPrcFileData("", "loader-num-threads 4")
+
+        if headless:
+            loadPrcFileData("", "window-type none\naudio-library-name null")
+        ShowBase.__init__(self)
+
+        if headless:
+            self.__setup_headless_camera()
+        else:
+            controls.setup_keyboard()
+            controls.setup_mouse()
+
+        self.collisions = None
+        self.tpp_camera = None
+        self.physics = None
+        self.actor_lod = None
+        self.fixed_step = None
+        self.simulation_stages = ()
+        self.crowd = None
+        self.stages = ()
+        self.profiler = None
+        self.snapshots = None
+        self.movable_area = None
+        self.path_planner = None
+        self.quality_governor = None
+        self.telemetry = None
+        self.input_recorder = None
+        self.ready = False
+        self.first_frame_time_s = None
+
+        self.__record_path = record_path
+        self.__profile = profile
+        self.__frame_budget_ms = frame_budget_ms
+        self.__crowd_size = crowd_size
+        self.__sim_rate_hz = sim_rate_hz
+        self.__sim_workers = sim_workers
+        self.__keep_snapshots = snapshots
+        self.__snapshots_dir = snapshots_dir
+        self.__movable_area_path = movable_area_path
+        self.__navigation = navigation
+        self.__quality_budget_ms = quality_budget_ms
+        self.__quality_log_path = quality_log_path
+        self.__telemetry_path = telemetry_path
+        self.__rewound_index = None  # Shown snapshot while rewinding.
+        self.__loading_text = None
+
+        if not headless:
+            self.__loading_text = OnscreenText("Loading...", fg=(1, 1, 1, 1))
+
+        self.world = World(self.__start, self.__show_loading_progress,
+                           tiles_dir, collision_tolerance_m)
+
+    def wait_until_ready(self):
+        """Step the task manager until the world is loaded."""
+
+        while not self.ready:
+            self.taskMgr.step()
+
+    def __del__(self):
+        """Clean resources."""
+
+        del self.crowd
+        del self.physics
+        del self.tpp_camera
+        del self.collisions
+        del self.world
+
+    def __main_loop(self, task: Task) -> Task:
+        """Refresh between frames.
+
+        Parameters:
+        task -- task form a task manager that is also returned to loop
+                the function.
+        """
+
+        if self.profiler is None:
+            for _, stage in self.stages:
+                stage()
+        else:
+            self.profiler.run(self.stages)
+
+        if self.telemetry is not None:
+            self.telemetry(globalClock.getDt(), self.profiler.last_frame_s,
+                           snapshot.capture(self.world.player,
+                                            self.tpp_camera))
+
+        if self.first_frame_time_s is None:
+            self.first_frame_time_s = time.perf_counter() - self.__start_s
+            sys.stdout.write(
+                "World loaded in {:.2f} s, first frame after {:.2f} s.\n"
+                .format(self.world.load_time_s, self.first_frame_time_s))
+
+        return Task.cont
+
+    def __animate_player(self):
+        """Animate the player as detailed as its distance allows."""
+
+        self.world.player.animate(self.actor_lod)
+
+    def __avoid_camera_occlusion(self):
+        """Keep the terrain from coming between the player and the camera."""
+
+        self.tpp_camera.avoid_occlusion(self.world.player.getPos(
+            base.render))
+
+    def __capture_snapshot(self):
+        """Save the world state of the simulation step."""
+
+        self.snapshots.capture(snapshot.capture(self.world.player,
+                                                self.tpp_camera))
+
+    def __control_player(self):
+        """Move the player and the camera following the input."""
+
+        self.world.player.control(self.tpp_camera, self.fixed_step.step_s)
+
+    def __fly_over_terrain(self):
+        """Keep the camera above the terrain."""
+
+        self.tpp_camera.fly_over_terrain(self.world.player,
+                                         self.world.terrain,
+                                         self.world.height_map)
+
+    def __follow_player(self):
+        """Place the camera around the rendered player."""
+
+        self.tpp_camera.follow(self.world.player.getPos())
+
+    def __govern_quality(self):
+        """Trade the quality for the frame time if over budget."""
+
+        self.quality_governor.update(globalClock.getDt())
+
+    def __handle_input(self):
+        """Read the keys and the mouse, unless rewound."""
+
+        if self.__rewound_index is None:
+            controls.handle_events()
+
+    def __record_input(self):
+        """Save the input that the frame is going to use."""
+
+        self.input_recorder(controls.key_mask, controls.mouse_pos,
+                            globalClock.getDt())
+
+    def __resume(self):
+        """Continue the simulation from the rewound snapshot."""
+
+        if self.__rewound_index is None:
+            return
+
+        self.snapshots.truncate(self.__rewound_index + 1)
+        self.__rewound_index = None
+
+    def __rewind(self, steps: int = 1):
+        """Show an older snapshot and pause the simulation.
+
+        Parameters:
+        steps -- snapshots to go back, negative go forward.
+        """
+
+        if not len(self.snapshots):
+            return
+
+        if self.__rewound_index is None:
+            self.__rewound_index = len(self.snapshots) - 1
+
+        self.__rewound_index = min(max(self.__rewound_index - steps,
+                                       self.snapshots.first_index),
+                                   len(self.snapshots) - 1)
+        snapshot.restore(self.world.player, self.tpp_camera,
+                         self.snapshots.state_at(self.__rewound_index))
+        self.fixed_step.reset_interpolated()
+
+    def __rotate_camera(self):
+        """Look around following the mouse, the rewound view is kept."""
+
+        if self.__rewound_index is None:
+            self.tpp_camera.rotate()
+
+    def __save_snapshots(self):
+        """Write the kept snapshots to a file named after the time and
+        the newest one, so the earlier saves are kept.
+        """
+
+        path = os.path.join(self.__snapshots_dir, "snapshots-{}-{}.bin".format(
+            time.strftime("%Y%m%d-%H%M%S"), len(self.snapshots)))
+
+        self.snapshots.save(path)
+        sys.stdout.write("Snapshots saved to {}.\n".format(path))
+
+    def __setup_headless_camera(self):
+        """Create the camera node that a window would normally provide."""
+
+        self.camera = self.render.attachNewNode("camera")
+        self.camLens = PerspectiveLens()
+
+    def __setup_quality_governor(self):
+        """Add the quality levers, the least visible lowered first."""
+
+        from quality_governor import QualityGovernor
+
+        self.quality_governor = QualityGovernor(
+            self.__quality_budget_ms, log_path=self.__quality_log_path)
+        atexit.register(self.quality_governor.close)
+
+        self.quality_governor.add_lever("animation_interval_scale",
+                                        (1, 2, 4),
+                                        self.actor_lod.scale_intervals)
+        self.quality_governor.add_lever(
+            "camera_boom_interval", (1, 2, 4),
+            lambda frames: setattr(self.tpp_camera, "boom_test_interval",
+                                   frames))
+
+        if self.world.streamed_terrain is not None:
+            self.quality_governor.add_lever(
+                "terrain_lod_shift", (0, 1, 2),
+                self.world.streamed_terrain.set_lod_shift)
+
+        # Interpolated, so only the motion gets coarser, not the frames.
+        self.quality_governor.add_lever(
+            "simulation_rate_hz", (self.__sim_rate_hz,
+                                   self.__sim_rate_hz * 0.75,
+                                   self.__sim_rate_hz * 0.5),
+            self.fixed_step.set_rate)
+        self.stages += (("quality", self.__govern_quality),)
+
+    def __show_crowd(self):
+        """Show the NPCs nearest to the camera."""
+
+        self.crowd.show(base.camera.getPos(self.world.terrain),
+                        self.actor_lod, self.fixed_step.alpha)
+
+    def __show_loading_progress(self, fraction: float, step: str):
+        """Update the loading text.
+
+        Parameters:
+        fraction -- loaded part of the world.
+        step -- name of the finished loading step.
+        """
+
+        if self.__loading_text is not None:
+            self.__loading_text.setText("Loading... {:.0%}".format(fraction))
+
+    def __simulate(self):
+        """Run the simulation steps that the frame time has accumulated."""
+
+        if self.__rewound_index is not None:
+            return
+
+        self.fixed_step.run(self.simulation_stages, globalClock.getDt())
+
+    def __start(self):
+        """Create the world-dependent objects and start the main loop."""
+
+        if self.__loading_text is not None:
+            self.__loading_text.destroy()
+            self.__loading_text = None
+
+        self.collisions = Collisions(self.world.terrain_collision)
+        self.tpp_camera = TPPCamera(self.collisions)
+        self.physics = Physics(self.world.player, self.collisions)
+
+        from actor_lod import ActorLOD  # NumPy is imported by now.
+
+        self.actor_lod = ActorLOD()
+
+        if self.__movable_area_path is not None:
+            import invisible_border
+            from movable_area import MovableArea
+
+            self.movable_area = MovableArea.load(self.__movable_area_path)
+            invisible_border.movable_area = self.movable_area
+        self.fixed_step = FixedStep(self.__sim_rate_hz)
+        self.fixed_step.add_interpolated(self.world.player)
+
+        # Work of every simulation step, at a constant rate.
+        self.simulation_stages = (
+            ("collisions", self.collisions.invalidate),
+            ("physics", self.__walk_on_terrain),
+            ("camera_terrain", self.__fly_over_terrain),
+            ("player", self.__control_player))
+
+        # Ordered per-frame work, also timed one by one by the benchmarks.
+        self.stages = (("input", self.__handle_input),
+                       ("camera_rotate", self.__rotate_camera),
+                       ("simulation", self.__simulate),
+                       ("camera_follow", self.__follow_player),
+                       ("camera_boom", self.__avoid_camera_occlusion),
+                       ("animation", self.__animate_player))
+
+        if self.__keep_snapshots:
+            self.snapshots = snapshot.SnapshotHistory()
+            self.simulation_stages += (("snapshot",
+                                        self.__capture_snapshot),)
+            self.accept(controls.Keymap.Debug.save_snapshots,
+                        self.__save_snapshots)
+            self.accept(controls.Keymap.Debug.rewind, self.__rewind)
+            self.accept(controls.Keymap.Debug.step_forward, self.__rewind,
+                        [-1])
+            self.accept(controls.Keymap.Debug.resume, self.__resume)
+
+        if self.world.streamed_terrain is not None:
+            atexit.register(self.world.streamed_terrain.close)
+            self.stages = self.stages[:3] \
+                + (("terrain_stream", self.__stream_terrain),) \
+                + self.stages[3:]
+
+        if self.__crowd_size:
+            from crowd import Crowd
+
+            if self.__navigation:
+                from navigation import NavigationGrid, PathPlanner
+
+                self.path_planner = PathPlanner(NavigationGrid(
+                    self.world.height_map, movable_area=self.movable_area))
+
+            self.crowd = Crowd(self.__crowd_size, self.world.height_map,
+                               self.world.terrain, self.world.create_actor,
+                               workers=self.__sim_workers,
+                               planner=self.path_planner)
+            self.simulation_stages += (("crowd", self.__step_crowd),)
+            self.stages += (("crowd", self.__show_crowd),)
+
+        if self.__record_path is not None:
+            self.input_recorder = Recorder(self.__record_path,
+                                           controls.KEYS)
+            atexit.register(self.input_recorder.close)
+            self.stages = self.stages[:1] \
+                + (("record", self.__record_input),) + self.stages[1:]
+
+        if self.__quality_budget_ms:
+            self.__setup_quality_governor()
+
+        if self.__profile or self.__telemetry_path is not None:
+            self.profiler = FrameProfiler([name for name, _ in self.stages],
+                                          budget_ms=self.__frame_budget_ms)
+            self.accept(controls.Keymap.Debug.dump_profile,
+                        self.profiler.dump)
+
+        if self.__telemetry_path is not None:
+            from telemetry import TelemetryRecorder
+
+            self.telemetry = TelemetryRecorder(self.__telemetry_path,
+                                               self.profiler.stage_names)
+            atexit.register(self.telemetry.close)
+
+        self.ready = True
+
+        # Delayed to the next frame, the one that has finished the loading
+        # isn't simulated.
+        base.taskMgr.add(self.__main_loop, "__main_loop", delay=0)
+
+    def __step_crowd(self):
+        """Move the NPCs."""
+
+        self.crowd.step(self.fixed_step.step_s)
+
+    def __stream_terrain(self):
+        """Load and show the terrain tiles around the player."""
+
+        self.world.streamed_terrain.update(self.world.player.getX(),
+                                           self.world.player.getY())
+
+    def __walk_on_terrain(self):
+        """Put the player on the ground."""
+
+        self.physics(self.world.player, self.world.terrain,
+                     self.world.height_map)
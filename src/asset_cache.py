@@ -0,0 +1,152 @@
+"""Content-hashed cache of the assets converted to the .bam format.
+
+Eggs are parsed on every load, the .bam files are just deserialized.
+A cached file is named after the source contents and the Panda3D
+version, so editing an asset or upgrading the engine never reuses a
+stale conversion.
+"""
+
+import hashlib
+import os
+import sys
+
+try:
+    from panda3d.core import NodePath
+    from panda3d.core import PandaSystem
+except ModuleNotFoundError:
+    sys.stderr.write("Panda3d not found.\n")
+    exit()
+
+
+CACHE_DIR = "../cache"
+
+# Tried in the order of the Panda3D loader, if the path has no extension.
+SOURCE_EXTENSIONS = (".egg", ".egg.pz", ".bam")
+
+
+def lookup(path: str) -> tuple:
+    """Return the file to load and the .bam file to store it to.
+
+    The second one is None if the asset is already cached or can't be.
+
+    Parameters:
+    path -- asset as passed to the loader, e.g. "../assets/ralph".
+    """
+
+    source = __find_source(path)
+
+    if source is None or source.endswith(".bam"):
+        return path, None
+
+    cached = os.path.join(CACHE_DIR, "{}-{}.bam".format(
+        __asset_name(source), __hash_contents(source)))
+
+    if os.path.isfile(cached):
+        return cached, None
+    return source, cached
+
+
+def derived_path(path: str, kind: str, extension: str,
+                 key: str = "") -> str:
+    """Return the cache file of data computed from an asset.
+
+    Named like the .bam files, so it is outdated by the same changes.
+    None if the asset has no source file.
+
+    Parameters:
+    path -- asset as passed to the loader, e.g. "../assets/terrain".
+    kind -- name of the data, e.g. "collision".
+    extension -- file extension with the dot.
+    key -- parameters of the computation, another key is another file.
+    """
+
+    source = __find_source(path)
+
+    if source is None:
+        return None
+
+    return os.path.join(CACHE_DIR, "{}-{}-{}{}".format(
+        __asset_name(source), kind, __hash_contents(source, key),
+        extension))
+
+
+def remove_outdated(cached: str):
+    """Remove the other versions of a cache file, e.g. before writing.
+
+    Parameters:
+    cached -- file returned by the lookup or the derived_path.
+    """
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    prefix, extension = os.path.splitext(os.path.basename(cached))
+    prefix = prefix.rsplit('-', 1)[0]
+
+    for outdated in os.listdir(CACHE_DIR):
+        if outdated.endswith(extension) \
+                and outdated[:-len(extension)].rsplit('-', 1)[0] == prefix:
+            os.remove(os.path.join(CACHE_DIR, outdated))
+
+
+def store(model: NodePath, cached: str):
+    """Write the loaded model and remove its outdated conversions.
+
+    Parameters:
+    model -- model loaded from the source.
+    cached -- .bam file returned by the lookup.
+    """
+
+    remove_outdated(cached)
+
+    # Renamed when complete, so a crash never leaves a truncated file.
+    partial = cached + ".part"
+
+    if model.writeBamFile(partial):
+        os.replace(partial, cached)
+
+
+def __asset_name(source: str) -> str:
+    """Return the file name without the directory and extensions.
+
+    Parameters:
+    source -- existing asset file.
+    """
+
+    name = os.path.basename(source)
+
+    for extension in SOURCE_EXTENSIONS:
+        if name.endswith(extension):
+            return name[:-len(extension)]
+    return name
+
+
+def __hash_contents(source: str, key: str = "") -> str:
+    """Return the hash of a file, the Panda3D version and a key.
+
+    Parameters:
+    source -- existing asset file.
+    key -- anything else the cached data depends on.
+    """
+
+    hasher = hashlib.sha1(PandaSystem.getVersionString().encode("ascii"))
+
+    with open(source, "rb") as source_file:
+        hasher.update(source_file.read())
+    hasher.update(key.encode())
+
+    return hasher.hexdigest()
+
+
+def __find_source(path: str) -> str:
+    """Return the existing file of the asset or None.
+
+    Parameters:
+    path -- asset path with or without an extension.
+    """
+
+    if os.path.isfile(path):
+        return path
+
+    for extension in SOURCE_EXTENSIONS:
+        if os.path.isfile(path + extension):
+            return path + extension
+    return None
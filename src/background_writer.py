@@ -0,0 +1,86 @@
+"""File appending that never blocks the frame loop."""
+
+import collections
+import threading
+
+
+class BackgroundWriter:
+    """Append chunks of bytes to a file in a separate thread.
+
+    The frame loop only appends to a deque, which is thread-safe
+    without locks. The thread drains it periodically and writes whole
+    batches at once. When the disk can't keep up and the queue is full,
+    new chunks are dropped and counted instead of blocking.
+    """
+
+    FLUSH_INTERVAL_S = 0.25
+
+    def __init__(self, path: str, max_queued: int = 65536,
+                 batch_size: int = 1024):
+        """Open the file and start the writer thread.
+
+        Parameters:
+        path -- file to append to, created if needed.
+        max_queued -- max. number of chunks waiting for the disk.
+        batch_size -- chunks count that wakes the thread up earlier.
+        """
+
+        self.dropped = 0
+
+        self.__file = open(path, "ab")
+        self.__queue = collections.deque()
+        self.__max_queued = max_queued
+        self.__batch_size = batch_size
+        self.__wakeup = threading.Event()
+        self.__closed = False
+
+        self.__thread = threading.Thread(target=self.__drain,
+                                         name="background_writer",
+                                         daemon=True)
+        self.__thread.start()
+
+    def close(self):
+        """Write everything that is queued and close the file."""
+
+        if self.__closed:
+            return
+
+        self.__closed = True
+        self.__wakeup.set()
+        self.__thread.join()
+        self.__file.close()
+
+    def write(self, chunk: bytes):
+        """Queue the chunk, drop it if the queue is full.
+
+        Parameters:
+        chunk -- bytes to append.
+        """
+
+        if len(self.__queue) >= self.__max_queued:
+            self.dropped += 1
+            return
+
+        self.__queue.append(chunk)
+
+        if len(self.__queue) >= self.__batch_size:
+            self.__wakeup.set()
+
+    def __drain(self):
+        """Write the queued chunks in batches until closed."""
+
+        while True:
+            self.__wakeup.wait(self.FLUSH_INTERVAL_S)
+            self.__wakeup.clear()
+            closed = self.__closed  # Read before the final drain.
+
+            batch = []
+            while self.__queue:
+                batch.append(self.__queue.popleft())
+
+            if batch:
+                self.__file.write(b"".join(batch))
+                self.__file.flush()
+
+            if closed:
+                break
@@ -0,0 +1,1464 @@
+#! /usr/bin/env python3
+
+"""Windowless performance measurements of the game subsystems."""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import shutil
+import signal
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    sys.stderr.write("NumPy not found.\n")
+    exit()
+
+try:
+    from direct.showbase.ShowBase import ShowBase
+    from panda3d.core import ClockObject
+    from panda3d.core import CollideMask
+    from panda3d.core import CollisionHandlerQueue
+    from panda3d.core import CollisionNode
+    from panda3d.core import CollisionRay
+    from panda3d.core import CollisionTraverser
+    from panda3d.core import Geom
+    from panda3d.core import GeomNode
+    from panda3d.core import GeomTriangles
+    from panda3d.core import GeomVertexData
+    from panda3d.core import GeomVertexFormat
+    from panda3d.core import GeomVertexWriter
+    from panda3d.core import NodePath
+    from panda3d.core import loadPrcFileData
+except ModuleNotFoundError:
+    sys.stderr.write("Panda3d not found.\n")
+    exit()
+
+
+from application import Application
+import collision_mesh
+import collisions
+import controls
+from crowd import Crowd
+from height_map import HeightMap
+from input_record import Replay
+import invisible_border
+from movable_area import MovableArea
+from navigation import NavigationGrid, PathPlanner
+import rotation
+import sim_server
+import snapshot
+import telemetry
+import terrain_chunks
+import terrain_geometry
+import terrain_streaming
+
+
+def main():
+    """Parse the command line and run the chosen benchmark."""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    benchmarks = parser.add_subparsers(dest="benchmark")
+    benchmarks.required = True
+
+    ground = benchmarks.add_parser(
+        "ground", help="height map vs ray traversal ground queries")
+    ground.add_argument("--quads", type=int, nargs="+", default=[32, 96, 256],
+                        help="synthetic terrain quads per side")
+    ground.add_argument("--terrain", help="also measure a model file")
+    ground.add_argument("--queries", type=int, default=200)
+    ground.set_defaults(run=benchmark_ground)
+
+    shared = benchmarks.add_parser(
+        "collisions", help="per-consumer vs shared collision traversal")
+    shared.add_argument("--quads", type=int, default=96,
+                        help="synthetic terrain quads per side")
+    shared.add_argument("--terrain", help="model file instead of the grid")
+    shared.add_argument("--frames", type=int, default=200)
+    shared.set_defaults(run=benchmark_collisions)
+
+    frame = benchmarks.add_parser(
+        "frame", help="whole frame loop with a scripted input")
+    frame.add_argument("--frames", type=int, default=1200)
+    frame.add_argument("--dt", type=float, default=1 / 60,
+                       help="fixed frame time in seconds")
+    frame.add_argument("--json", help="write the percentiles to a file")
+    frame.add_argument("--record", help="append the input to a file")
+    frame.add_argument("--replay",
+                       help="recorded input instead of the scripted one")
+    frame.add_argument("--trajectory",
+                       help="write the player and camera poses to a CSV")
+    frame.add_argument("--crowd", type=int, default=0,
+                       help="number of the wandering NPCs")
+    frame.add_argument("--sim-rate", type=float, default=60.0,
+                       help="simulation steps per second")
+    frame.add_argument("--sim-workers", type=int, default=0,
+                       help="processes moving the NPCs")
+    frame.add_argument("--terrain-tiles", metavar="DIR",
+                       help="stream the terrain from a tile set")
+    frame.add_argument("--movable-area", metavar="FILE",
+                       help="walkable polygons instead of the rectangle")
+    frame.add_argument("--navigation", action="store_true",
+                       help="the NPCs walk to random goals along paths")
+    frame.add_argument("--max-p95-ms", type=float,
+                       help="fail if the frame's p95 exceeds the budget")
+    frame.set_defaults(run=benchmark_frame)
+
+    crowd = benchmarks.add_parser(
+        "crowd", help="batched NPC updates for different crowd sizes")
+    crowd.add_argument("--agents", type=int, nargs="+",
+                       default=[100, 1000, 10000])
+    crowd.add_argument("--frames", type=int, default=600)
+    crowd.add_argument("--pool", type=int, default=16,
+                       help="max. number of the shown agents")
+    crowd.add_argument("--no-lod", action="store_true",
+                       help="pose all the shown agents every frame")
+    crowd.add_argument("--dt", type=float, default=1 / 60,
+                       help="fixed frame time in seconds")
+    crowd.set_defaults(run=benchmark_crowd)
+
+    startup = benchmarks.add_parser(
+        "startup", help="cold vs warm start of the game process")
+    startup.add_argument("--warm-runs", type=int, default=3)
+    startup.set_defaults(run=benchmark_startup)
+
+    streaming = benchmarks.add_parser(
+        "streaming", help="terrain tiles streamed along a walk")
+    streaming.add_argument("--tiles", type=int, nargs="+", default=[8, 32],
+                           help="generated world size in tiles per side")
+    streaming.add_argument("--tile-samples", type=int, default=65,
+                           help="height samples per tile side")
+    streaming.add_argument("--distance", type=float, default=400.0,
+                           help="max. length of the walk in meters")
+    streaming.add_argument("--speed", type=float, default=60.0,
+                           help="walking speed in meters per second")
+    streaming.add_argument("--dt", type=float, default=1 / 60,
+                           help="real frame time in seconds")
+    streaming.add_argument("--keep", metavar="DIR",
+                           help="write the tile sets here and keep them")
+    streaming.set_defaults(run=benchmark_streaming)
+
+    workers = benchmarks.add_parser(
+        "workers", help="NPC steps in 1 to N worker processes")
+    workers.add_argument("--agents", type=int, default=200000)
+    workers.add_argument("--workers", type=int, nargs="+",
+                         default=[0, 1, 2, 4],
+                         help="process counts, 0 steps in the main one")
+    workers.add_argument("--steps", type=int, default=200)
+    workers.add_argument("--main-work-ms", type=float, default=0.0,
+                         help="main process work overlapping every step")
+    workers.set_defaults(run=benchmark_workers)
+
+    snapshots = benchmarks.add_parser(
+        "snapshots", help="world state capture, encoding and rewind")
+    snapshots.add_argument("--frames", type=int, default=1200)
+    snapshots.add_argument("--dt", type=float, default=1 / 60,
+                           help="fixed frame time in seconds")
+    snapshots.set_defaults(run=benchmark_snapshots)
+
+    replay = benchmarks.add_parser(
+        "replay", help="input recorded by the game loop, replayed apart")
+    replay.add_argument("--frames", type=int, default=600)
+    replay.add_argument("--max-difference-m", type=float, default=1e-4,
+                        help="fail if a replayed position differs more")
+    replay.set_defaults(run=benchmark_replay)
+
+    area = benchmarks.add_parser(
+        "movable_area", help="polygonal movable area tests and clamping")
+    area.add_argument("--file", default="../assets/movable_area.json",
+                      help="walkable polygons")
+    area.add_argument("--agents", type=int, nargs="+",
+                      default=[1000, 10000, 100000])
+    area.add_argument("--steps", type=int, default=300)
+    area.add_argument("--dt", type=float, default=1 / 60,
+                      help="simulation step in seconds")
+    area.set_defaults(run=benchmark_movable_area)
+
+    paths = benchmarks.add_parser(
+        "navigation", help="batched path requests over the terrain")
+    paths.add_argument("--agents", type=int, nargs="+", default=[100, 500])
+    paths.add_argument("--cell-size", type=float, default=2.0,
+                       help="navigation grid cell size in meters")
+    paths.add_argument("--budget-ms", type=float, default=2.0,
+                       help="search time per tick")
+    paths.set_defaults(run=benchmark_navigation)
+
+    mesh = benchmarks.add_parser(
+        "collision_mesh", help="baked collision mesh vs render density")
+    mesh.add_argument("--quads", type=int, nargs="+", default=[32, 96, 256],
+                      help="synthetic terrain quads per side")
+    mesh.add_argument("--terrain", help="also measure a model file")
+    mesh.add_argument("--tolerances", type=float, nargs="+",
+                      default=[0.05, 0.1, 0.2], help="in meters")
+    mesh.add_argument("--queries", type=int, default=500)
+    mesh.set_defaults(run=benchmark_collision_mesh)
+
+    quality = benchmarks.add_parser(
+        "quality", help="quality governor under a temporary extra load")
+    quality.add_argument("--frames", type=int, default=1800)
+    quality.add_argument("--budget-ms", type=float, default=4.0,
+                         help="target frame time")
+    quality.add_argument("--load-ms", type=float, default=6.0,
+                         help="extra work per frame in the middle third")
+    quality.add_argument("--crowd", type=int, default=2000,
+                         help="number of the wandering NPCs")
+    quality.set_defaults(run=benchmark_quality)
+
+    server = benchmarks.add_parser(
+        "server", help="player sessions of the headless simulation server")
+    server.add_argument("--sessions", type=int, nargs="+",
+                        default=[100, 500, 1000, 2000])
+    server.add_argument("--rate", type=float, default=30.0,
+                        help="simulation ticks per second")
+    server.add_argument("--duration", type=float, default=10.0,
+                        help="seconds of every measurement")
+    server.add_argument("--unix", action="store_true",
+                        help="Unix socket instead of the local TCP")
+    server.set_defaults(run=benchmark_server)
+
+    parity = benchmarks.add_parser(
+        "parity", help="server's batched players vs the game's player")
+    parity.add_argument("--frames", type=int, default=6000)
+    parity.add_argument("--dt", type=float, default=1 / 60,
+                        help="fixed frame time in seconds")
+    parity.add_argument("--max-position-m", type=float, default=1e-3,
+                        help="fail if a position differs more")
+    parity.add_argument("--max-heading-deg", type=float, default=0.2,
+                        help="fail if a heading differs more")
+    parity.set_defaults(run=benchmark_parity)
+
+    telemetry = benchmarks.add_parser(
+        "telemetry", help="per-frame metrics logging and its summary")
+    telemetry.add_argument("--frames", type=int, default=3600)
+    telemetry.add_argument("--crowd", type=int, default=0,
+                           help="number of the wandering NPCs")
+    telemetry.add_argument("--keep", metavar="FILE",
+                           help="write the log here and keep it")
+    telemetry.set_defaults(run=benchmark_telemetry)
+
+    kernels = benchmarks.add_parser(
+        "kernels", help="scalar vs batch angle and border functions")
+    kernels.add_argument("--sizes", type=int, nargs="+",
+                         default=[1, 100, 100000])
+    kernels.add_argument("--elements", type=int, default=300000,
+                         help="elements processed per measurement")
+    kernels.set_defaults(run=benchmark_kernels)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+def benchmark_ground(args: argparse.Namespace):
+    """Compare the ground query cost for different triangle counts."""
+
+    terrains = [("grid {}x{}".format(quads, quads), make_grid_terrain(quads))
+                for quads in args.quads]
+
+    if args.terrain:
+        base = start_headless()
+        terrains.append((args.terrain, base.loader.loadModel(args.terrain)))
+
+    print("{:>24} {:>10} {:>10} {:>12} {:>12} {:>10}".format(
+        "terrain", "triangles", "build s", "ray us", "height us",
+        "max diff"))
+
+    for name, terrain in terrains:
+        build_start_s = time.perf_counter()
+        triangles = terrain_geometry.read_triangles(terrain)
+        height_map = HeightMap.from_triangles(triangles)
+        build_s = time.perf_counter() - build_start_s
+
+        points = random_points(triangles, args.queries)
+        ray_z, ray_s = query_rays(terrain, points)
+
+        query_start_s = time.perf_counter()
+        map_z = [height_map.height_at(x, y) for x, y in points]
+        map_s = time.perf_counter() - query_start_s
+
+        diffs = [abs(ray - height) for ray, height in zip(ray_z, map_z)
+                 if ray is not None and height is not None]
+
+        print("{:>24} {:>10} {:>10.2f} {:>12.2f} {:>12.2f} {:>10.4f}".format(
+            name, len(triangles), build_s, ray_s / len(points) * 1e6,
+            map_s / len(points) * 1e6, max(diffs, default=math.nan)))
+
+
+def benchmark_collision_mesh(args: argparse.Namespace):
+    """Compare the ground rays against the render and baked triangles.
+
+    The synthetic terrains have the same shape in different densities,
+    the baked meshes should have about the same size and ray cost.
+    """
+
+    terrains = [("grid {}x{}".format(quads, quads), make_grid_terrain(quads))
+                for quads in args.quads]
+
+    if args.terrain:
+        base = start_headless()
+        terrains.append((args.terrain, base.loader.loadModel(args.terrain)))
+
+    print("{:>24} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10}".format(
+        "terrain", "tolerance", "triangles", "bake s", "ray us",
+        "max diff", "ray diff"))
+
+    for name, terrain in terrains:
+        triangles = terrain_geometry.read_triangles(terrain)
+        height_map = HeightMap.from_triangles(triangles)
+        points = random_points(triangles, args.queries)
+
+        chunks = terrain_chunks.build(triangles)
+        render_z, render_s = query_rays(chunks, points,
+                                        collisions.TERRAIN_MASK)
+        print("{:>24} {:>10} {:>10} {:>10} {:>10.2f}".format(
+            name, "render", len(triangles), "",
+            render_s / len(points) * 1e6))
+        chunks.removeNode()
+
+        for tolerance_m in args.tolerances:
+            start_s = time.perf_counter()
+            baked = collision_mesh.bake(triangles, height_map, tolerance_m)
+            bake_s = time.perf_counter() - start_s
+
+            chunks = terrain_chunks.build(baked)
+            baked_z, baked_s = query_rays(chunks, points,
+                                          collisions.TERRAIN_MASK)
+            chunks.removeNode()
+
+            # Error at the height samples and along the rays.
+            rows, columns = np.indices(height_map.heights.shape)
+            baked_heights = HeightMap.from_triangles(baked).heights_at(
+                height_map.origin_x_m + columns * height_map.cell_size_m,
+                height_map.origin_y_m + rows * height_map.cell_size_m)
+            ray_diffs = [abs(render - baked) for render, baked
+                         in zip(render_z, baked_z)
+                         if render is not None and baked is not None]
+
+            print("{:>24} {:>10} {:>10} {:>10.2f} {:>10.2f} {:>10.4f} "
+                  "{:>10.4f}".format(
+                      name, tolerance_m, len(baked), bake_s,
+                      baked_s / len(points) * 1e6,
+                      np.nanmax(np.abs(baked_heights - height_map.heights)),
+                      max(ray_diffs, default=math.nan)))
+
+
+def benchmark_collisions(args: argparse.Namespace):
+    """Compare the ray traversals of the player and the camera per frame.
+
+    Both modes run on the single terrain mesh and on its chunks. The
+    mesh is one node, so a traversal tests every collider against all
+    of its triangles and sharing it saves only the walk down to the
+    node. The chunks' bounds cull most triangles once for all the
+    colliders of a shared traversal.
+    """
+
+    base = start_headless()
+
+    if args.terrain:
+        terrain = base.loader.loadModel(args.terrain)
+    else:
+        terrain = make_grid_terrain(args.quads)
+    terrain.setCollideMask(collisions.TERRAIN_MASK)
+    terrain.reparentTo(base.render)
+
+    triangles = terrain_geometry.read_triangles(terrain)
+    chunks = terrain_chunks.build(triangles)
+    chunks.reparentTo(terrain)
+
+    rays = []
+
+    for name, origin_z_m in (("player_coll_node", 5), ("camera_coll_node", 0)):
+        ray = base.render.attachNewNode(CollisionNode(name))
+        ray.node().addSolid(CollisionRay(0, 0, origin_z_m, 0, 0, -1))
+        ray.node().setFromCollideMask(collisions.TERRAIN_MASK)
+        rays.append(ray)
+
+    path = random_points(triangles, args.frames)
+
+    print("{:>8} {:>14} {:>18} {:>12}".format(
+        "terrain", "mode", "traversals/frame", "ms/frame"))
+
+    for terrain_name, root in (("mesh", terrain), ("chunked", chunks)):
+        if root is chunks:
+            terrain.setCollideMask(CollideMask.allOff())
+            chunks.setCollideMask(collisions.TERRAIN_MASK)
+
+        # Every consumer with its own traverser, rebuilt each frame.
+        coll_checkers = [CollisionTraverser() for _ in rays]
+        coll_handlers = [CollisionHandlerQueue() for _ in rays]
+        per_consumer_s = []
+
+        for x, y in path:
+            globalClock.tick()
+            start_s = time.perf_counter()
+
+            for ray, coll_checker, coll_handler in zip(rays, coll_checkers,
+                                                       coll_handlers):
+                ray.setPos(x, y, 2)
+                coll_checker.addCollider(ray, coll_handler)
+                coll_checker.traverse(root)
+                list(coll_handler.getEntries())
+                coll_checker.clearColliders()
+            per_consumer_s.append(time.perf_counter() - start_s)
+
+        print("{:>8} {:>14} {:>18.2f} {:>12.3f}".format(
+            terrain_name, "per consumer", len(rays),
+            sum(per_consumer_s) / len(path) * 1e3))
+
+        service = collisions.Collisions(root)
+
+        for ray in rays:
+            service.add_collider(ray)
+        shared_s = []
+        traversals = 0
+
+        for x, y in path:
+            globalClock.tick()
+            start_s = time.perf_counter()
+
+            for ray in rays:
+                ray.setPos(x, y, 2)
+            for ray in rays:
+                service.entries(ray)
+            shared_s.append(time.perf_counter() - start_s)
+            traversals += service.frame_stats()[0]
+
+        for ray in rays:
+            service.remove_collider(ray)
+
+        print("{:>8} {:>14} {:>18.2f} {:>12.3f}".format(
+            terrain_name, "shared", traversals / len(path),
+            sum(shared_s) / len(path) * 1e3))
+
+
+def benchmark_crowd(args: argparse.Namespace):
+    """Time the crowd update, including the pooled actors binding."""
+
+    controls.input_source = ScriptedInput(SCRIPT)
+    app = Application(headless=True)
+    app.wait_until_ready()
+
+    actor_lod = None if args.no_lod else app.actor_lod
+
+    print("{:>10} {:>12} {:>12} {:>16}  {}".format(
+        "agents", "p50 [ms]", "p95 [ms]", "frame budget [%]", "LOD bands"))
+
+    for agents in args.agents:
+        crowd = Crowd(agents, app.world.height_map, app.world.terrain,
+                      app.world.create_actor, args.pool)
+        frames_s = []
+
+        for frame in range(args.frames):
+            # Walk the viewer around, so the nearest agents change.
+            viewer_pos_m = (math.cos(frame / 100) * 50,
+                            math.sin(frame / 100) * 50)
+
+            start_s = time.perf_counter()
+            crowd.update(viewer_pos_m, args.dt, actor_lod)
+            frames_s.append(time.perf_counter() - start_s)
+            globalClock.tick()
+
+        del crowd
+        print("{:>10} {:>12.3f} {:>12.3f} {:>16.1f}  {}".format(
+            agents, percentile(frames_s, 50) * 1e3,
+            percentile(frames_s, 95) * 1e3,
+            percentile(frames_s, 95) / args.dt * 100,
+            "" if actor_lod is None else actor_lod.counts))
+
+
+def benchmark_frame(args: argparse.Namespace):
+    """Run the game loop stage by stage with a fixed dt and input."""
+
+    replay = None
+
+    if args.replay:
+        replay = controls.input_source = Replay(args.replay, controls.KEYS)
+    else:
+        controls.input_source = ScriptedInput(SCRIPT)
+    app = Application(headless=True, record_path=args.record,
+                      crowd_size=args.crowd, sim_rate_hz=args.sim_rate,
+                      tiles_dir=args.terrain_tiles,
+                      sim_workers=args.sim_workers,
+                      movable_area_path=args.movable_area,
+                      navigation=args.navigation)
+    app.wait_until_ready()
+    print("world loaded in {:.3f} s".format(app.world.load_time_s))
+
+    globalClock.setMode(ClockObject.MNonRealTime)
+    globalClock.setDt(args.dt)
+
+    # Joints are normally posed by the cull traversal of the window.
+    stages = app.stages + (("joints", app.world.player.update),)
+    timings_s = {name: [] for name, _ in stages}
+    timings_s["frame"] = []
+    trajectory = []
+
+    for _ in range(args.frames):
+        if replay is not None:
+            if replay.finished:
+                break
+            globalClock.setDt(replay.next_dt_s)  # Recorded frame time.
+
+        globalClock.tick()
+        frame_start_s = time.perf_counter()
+
+        for name, stage in stages:
+            start_s = time.perf_counter()
+            stage()
+            timings_s[name].append(time.perf_counter() - start_s)
+        timings_s["frame"].append(time.perf_counter() - frame_start_s)
+
+        trajectory.append(trajectory_sample(app))
+
+    if args.record:
+        app.input_recorder.close()
+
+    if args.trajectory:
+        with open(args.trajectory, 'w') as csv_file:
+            csv_file.write("player_x,player_y,player_z,player_h,"
+                           "camera_x,camera_y,camera_z,camera_h,camera_p\n")
+
+            for sample in trajectory:
+                csv_file.write(",".join("{:.5f}".format(value)
+                                        for value in sample) + "\n")
+
+    report = {name: {"p{}".format(rank): percentile(samples, rank) * 1e3
+                     for rank in (50, 95, 99)}
+              for name, samples in timings_s.items()}
+
+    print("{:>16} {:>10} {:>10} {:>10}".format(
+        "stage [ms]", "p50", "p95", "p99"))
+    for name, ranks in report.items():
+        print("{:>16} {:>10.3f} {:>10.3f} {:>10.3f}".format(
+            name, ranks["p50"], ranks["p95"], ranks["p99"]))
+
+    print("actor LOD bands: {}".format(app.actor_lod.counts))
+    print("simulation: {} steps, {} dropped".format(
+        app.fixed_step.steps, app.fixed_step.dropped_steps))
+
+    if app.path_planner is not None:
+        print("paths: {} searched, {} cached, {} queued".format(
+            app.path_planner.misses, app.path_planner.hits,
+            len(app.path_planner)))
+
+    boom = app.tpp_camera.boom_stats
+    print("camera boom: {} tests, {} reuses, {} skips, {} hits, "
+          "{:.3f} ms per test".format(
+              boom["tests"], boom["reuses"], boom["skips"], boom["hits"],
+              boom["time_s"] * 1e3 / max(boom["tests"], 1)))
+
+    if args.json:
+        report["camera_boom"] = dict(boom)
+
+        with open(args.json, 'w') as json_file:
+            json.dump(report, json_file, indent=2)
+
+    if args.max_p95_ms is not None \
+            and report["frame"]["p95"] > args.max_p95_ms:
+        sys.stderr.write("Frame p95 over the budget.\n")
+        exit(1)
+
+
+def benchmark_kernels(args: argparse.Namespace):
+    """Compare the per-element cost of the scalar and batch paths.
+
+    The scalar border function moves the nodes, the batch one an array
+    of their positions.
+    """
+
+    random = np.random.default_rng(0)
+    area_m = invisible_border.MOVABLE_AREA_METERS
+    kernels = (
+        ("angle limit", rotation.limit_angle_to_360_deg,
+         rotation.limit_angles_to_360_deg),
+        ("angle quarter", rotation.get_angle_quarter,
+         rotation.get_angle_quarters),
+        ("border", invisible_border.limit_actor_movable_area,
+         invisible_border.limit_positions_to_movable_area))
+
+    print("{:>14} {:>8} {:>14} {:>14} {:>10} {:>10}".format(
+        "kernel", "size", "scalar [ns]", "batch [ns]", "speedup",
+        "max diff"))
+
+    for size in args.sizes:
+        angles_deg = random.uniform(-360, 720, size)
+        positions_m = np.column_stack([
+            random.uniform(-area_m["width"], area_m["width"], size),
+            random.uniform(-area_m["height"], area_m["height"], size),
+            np.zeros(size)])
+        repeats = max(args.elements // size, 1)
+
+        for name, scalar, batch in kernels:
+            if name == "border":
+                nodes = [NodePath("actor") for _ in range(size)]
+
+                def run_scalar():
+                    for node, position_m in zip(nodes, positions_m):
+                        node.setPos(*position_m)
+                        scalar(node)
+                    return [tuple(node.getPos()) for node in nodes]
+
+                batch_input = positions_m
+            else:
+                angles = angles_deg.tolist()
+
+                def run_scalar():
+                    return [scalar(angle_deg) for angle_deg in angles]
+
+                batch_input = angles_deg
+
+            scalar_result = np.array(run_scalar())
+            batch_result = batch(batch_input)
+
+            start_s = time.perf_counter()
+            for _ in range(repeats):
+                run_scalar()
+            scalar_s = (time.perf_counter() - start_s) / repeats / size
+
+            start_s = time.perf_counter()
+            for _ in range(repeats):
+                batch(batch_input)
+            batch_s = (time.perf_counter() - start_s) / repeats / size
+
+            # Node positions are single precision.
+            print("{:>14} {:>8} {:>14.1f} {:>14.1f} {:>10.1f} {:>10.2g}"
+                  .format(name, size, scalar_s * 1e9, batch_s * 1e9,
+                          scalar_s / batch_s,
+                          np.abs(scalar_result - batch_result).max()))
+
+
+def benchmark_movable_area(args: argparse.Namespace):
+    """Time clamping wandering agents to the polygons every step.
+
+    The grid tests are checked against the exact tests of all the
+    edges, on random points around the area.
+    """
+
+    area = MovableArea.load(args.file)
+    random = np.random.default_rng(0)
+
+    points_m = np.column_stack([
+        random.uniform(area.min_x_m - 10, area.max_x_m + 10, 100000),
+        random.uniform(area.min_y_m - 10, area.max_y_m + 10, 100000)])
+    mismatches = np.count_nonzero(
+        area.contains(points_m)
+        != area.contains_by_rays(points_m))
+
+    print("{} edges, {} edge cells of {} m, {} grid mismatches".format(
+        len(area.segments_m), area.edge_cells_count, area.cell_size_m,
+        mismatches))
+    print("{:>10} {:>14} {:>14} {:>14} {:>10}".format(
+        "agents", "contains [ms]", "limit p50 [ms]", "limit p95 [ms]",
+        "out [%]"))
+
+    for agents in args.agents:
+        positions_m = area.random_points(agents, random)
+        headings_rad = random.uniform(0, 2 * math.pi, agents)
+        contains_s = []
+        limits_s = []
+        moved_count = 0
+
+        for _ in range(args.steps):
+            # Walking and running speeds, so some agents leave every step.
+            steps_m = random.uniform(1, 6, agents) * args.dt
+            positions_m[:, 0] -= np.sin(headings_rad) * steps_m
+            positions_m[:, 1] += np.cos(headings_rad) * steps_m
+            headings_rad += random.normal(0, 0.05, agents)
+
+            start_s = time.perf_counter()
+            area.contains(positions_m)
+            contains_s.append(time.perf_counter() - start_s)
+
+            start_s = time.perf_counter()
+            moved, normals = area.limit(positions_m)
+            limits_s.append(time.perf_counter() - start_s)
+
+            moved_count += len(moved)
+            headings_rad[moved] += math.pi
+
+        print("{:>10} {:>14.3f} {:>14.3f} {:>14.3f} {:>10.2f}".format(
+            agents, percentile(contains_s, 50) * 1e3,
+            percentile(limits_s, 50) * 1e3, percentile(limits_s, 95) * 1e3,
+            moved_count / agents / args.steps * 100))
+
+
+def benchmark_navigation(args: argparse.Namespace):
+    """Time the path requests of many agents at once.
+
+    All the agents ask in one tick, the searches are spread over the
+    next ones by the time budget. They ask again for the same paths,
+    answered by the cache, and again after a wall has blocked some.
+    """
+
+    controls.input_source = ScriptedInput(SCRIPT)
+    app = Application(headless=True)
+    app.wait_until_ready()
+
+    start_s = time.perf_counter()
+    grid = NavigationGrid(app.world.height_map, args.cell_size)
+    print("grid baked in {:.1f} ms, {} of {} cells walkable".format(
+        (time.perf_counter() - start_s) * 1e3, grid.walkable_count,
+        grid.columns * grid.rows))
+
+    print("{:>8} {:>8} {:>6} {:>14} {:>14} {:>12} {:>10} {:>12}".format(
+        "agents", "round", "ticks", "p95 tick [ms]", "max tick [ms]",
+        "search [ms]", "replanned", "unreachable"))
+
+    random = np.random.default_rng(0)
+    area_m = invisible_border.MOVABLE_AREA_METERS
+
+    # Across the middle of the area, from the bottom to the top.
+    wall_m = [(-area_m["width"] / 4, -args.cell_size),
+              (area_m["width"] / 4, -args.cell_size),
+              (area_m["width"] / 4, args.cell_size),
+              (-area_m["width"] / 4, args.cell_size)]
+
+    for agents in args.agents:
+        planner = PathPlanner(grid, budget_ms=args.budget_ms)
+        starts_m = grid.center_of(grid.random_open_cells(agents, random))
+        goals_m = grid.center_of(grid.random_open_cells(agents, random))
+
+        for round_name in ("first", "cached", "blocked"):
+            replanned = agents
+
+            if round_name == "blocked":
+                replanned = len(planner.block("wall", wall_m))
+
+            for agent in range(agents):
+                if round_name != "blocked" or agent not in planner.paths:
+                    planner.request(agent, starts_m[agent], goals_m[agent])
+
+            ticks_s = []
+            searched = planner.misses
+
+            while len(planner):
+                start_s = time.perf_counter()
+                planner.update()
+                ticks_s.append(time.perf_counter() - start_s)
+
+            searched = planner.misses - searched
+            unreachable = sum(path is None for path in planner.paths.values())
+
+            print("{:>8} {:>8} {:>6} {:>14.3f} {:>14.3f} {:>12.3f} {:>10} "
+                  "{:>12}".format(agents, round_name, len(ticks_s),
+                                  percentile(ticks_s, 95) * 1e3
+                                  if ticks_s else 0,
+                                  max(ticks_s, default=0) * 1e3,
+                                  sum(ticks_s) * 1e3 / max(searched, 1),
+                                  replanned, unreachable))
+
+        grid.unblock("wall")
+
+
+def benchmark_quality(args: argparse.Namespace):
+    """Show the quality changes and frame times around a load spike."""
+
+    controls.input_source = ScriptedInput(SCRIPT)
+    app = Application(headless=True, crowd_size=args.crowd,
+                      quality_budget_ms=args.budget_ms)
+    app.wait_until_ready()
+
+    def extra_load():
+        end_s = time.perf_counter() + args.load_ms / 1e3
+
+        while time.perf_counter() < end_s:
+            pass
+
+    # Real-time clock, the governor reads the measured frame times.
+    stages = app.stages + (("joints", app.world.player.update),)
+    phases = ("calm", "loaded", "calm again")
+    phase_frames = -(-args.frames // len(phases))
+    frame_times_ms = {phase: [] for phase in phases}
+    app.quality_governor.events.clear()
+
+    for frame in range(args.frames):
+        phase = phases[frame // phase_frames]
+        globalClock.tick()
+
+        for _, stage in stages:
+            stage()
+
+        if phase == "loaded":
+            extra_load()
+        frame_times_ms[phase].append(globalClock.getDt() * 1e3)
+
+    print("{:>6} {:>26} {:>8} {:>8} {:>12}".format(
+        "frame", "lever", "from", "to", "mean [ms]"))
+    for event in app.quality_governor.events:
+        print("{:>6} {:>26} {:>8.4g} {:>8.4g} {:>12.3f}".format(
+            event["frame"], event["lever"], event["from"], event["to"],
+            event["mean_frame_ms"]))
+
+    print("{:>12} {:>10} {:>10} {:>10}".format(
+        "phase [ms]", "mean", "p50", "p95"))
+    for phase, samples in frame_times_ms.items():
+        print("{:>12} {:>10.3f} {:>10.3f} {:>10.3f}".format(
+            phase, sum(samples) / len(samples), percentile(samples, 50),
+            percentile(samples, 95)))
+
+    print("final levels: {}".format(
+        {lever.name: lever.levels[lever.level]
+         for lever in app.quality_governor.levers}))
+
+
+def benchmark_server(args: argparse.Namespace):
+    """Load the simulation server with more and more sessions.
+
+    The server runs in its own process, the load generator in this one.
+    On a single core machine they share it, so the estimate from the
+    server's tick time is the more telling number.
+    """
+
+    directory = tempfile.mkdtemp()
+    step_ms = 1e3 / args.rate
+
+    print("{:>8} {:>10} {:>10} {:>10} {:>10} {:>6} {:>10} {:>8} {:>12}"
+          .format("sessions", "connected", "tick p50", "tick p95",
+                  "tick max", "late", "updates/s", "missed",
+                  "latency p95"))
+
+    try:
+        for sessions in args.sessions:
+            unix_path = os.path.join(directory, "server.sock") \
+                if args.unix else None
+            server = subprocess.Popen(
+                [sys.executable, "sim_server.py", "serve", "--rate",
+                 str(args.rate)] + (["--unix", unix_path] if args.unix
+                                    else ["--port", "0"]),
+                stdout=subprocess.PIPE, universal_newlines=True)
+
+            try:
+                address = server.stdout.readline().split()[-1]
+                host, port = (None, 0) if args.unix \
+                    else address.rsplit(":", 1)
+
+                load = asyncio.run(sim_server.generate_load(
+                    sessions, args.duration, unix_path,
+                    host or "127.0.0.1", int(port)))
+            finally:
+                server.send_signal(signal.SIGINT)
+                stats = json.loads(server.communicate()[0].splitlines()[-1])
+
+            print("{:>8} {:>10} {:>10.3f} {:>10.3f} {:>10.3f} {:>6} "
+                  "{:>10.2f} {:>8} {:>12.3f}".format(
+                      sessions, min(load["connected"],
+                                    stats["max_sessions"]),
+                      stats["tick_ms"]["p50"],
+                      stats["tick_ms"]["p95"], stats["tick_ms"]["max"],
+                      stats["late_ticks"], load["updates_per_session_s"],
+                      load["missed_ticks"], load["latency_ms"]["p95"]))
+
+        # Linear in the sessions, the tick has almost no fixed cost.
+        print("~{:.0f} sessions per core at {:g} Hz, by the tick p95 of the "
+              "largest load".format(
+                  stats["max_sessions"] * step_ms
+                  / max(stats["tick_ms"]["p95"], 1e-9), args.rate))
+    finally:
+        shutil.rmtree(directory)
+
+
+def benchmark_parity(args: argparse.Namespace):
+    """Walk the scripted input with the game's player and a player of the
+    simulation server side by side and compare their states.
+
+    The batch gets the keys and the camera heading of the game every
+    simulation step. The headings differ a little where the camera's
+    mouse position wraps around, hence the tolerance.
+    """
+
+    controls.input_source = ScriptedInput(SCRIPT)
+    app = Application(headless=True)
+    app.wait_until_ready()
+
+    globalClock.setMode(ClockObject.MNonRealTime)
+    globalClock.setDt(args.dt)
+
+    player = app.world.player
+    batch = sim_server.PlayerBatch(app.world.height_map)
+    batch.add()
+    batch.positions_m[0] = tuple(player.getPos())
+    batch.headings_deg[0] = player.getH()
+
+    worst = {"position_m": 0.0, "heading_deg": 0.0}
+    failed_steps = []
+
+    def step_batch():
+        batch.key_masks[0] = controls.key_mask
+        batch.camera_headings_deg[0] = base.camera.getH()
+        batch.step(app.fixed_step.step_s)
+
+        position_m = np.abs(np.array(tuple(player.getPos()))
+                            - batch.positions_m[0]).max()
+        heading_deg = abs((player.getH() - batch.headings_deg[0] + 180)
+                          % 360 - 180)
+        worst["position_m"] = max(worst["position_m"], position_m)
+        worst["heading_deg"] = max(worst["heading_deg"], heading_deg)
+
+        if position_m > args.max_position_m \
+                or heading_deg > args.max_heading_deg:
+            failed_steps.append(globalClock.getFrameCount())
+
+    # After the player's stages, the batch does physics and control too.
+    app.simulation_stages += (("batch", step_batch),)
+
+    for _ in range(args.frames):
+        globalClock.tick()
+
+        for _, stage in app.stages:
+            stage()
+
+    print("{} frames, worst position difference {:.6f} m, worst heading "
+          "difference {:.3f} deg".format(args.frames, worst["position_m"],
+                                         worst["heading_deg"]))
+
+    if failed_steps:
+        sys.stderr.write("{} steps over the tolerance, the first in the "
+                         "frame {}.\n".format(len(failed_steps),
+                                              failed_steps[0]))
+        exit(1)
+
+
+def benchmark_replay(args: argparse.Namespace):
+    """Record the scripted input through the task manager, as the game
+    does, replay it in a new process and compare the trajectories.
+
+    The frame times vary, so the replay has to follow the recorded ones.
+    """
+
+    directory = tempfile.mkdtemp(prefix="tpp3d_replay_")
+    record_path = os.path.join(directory, "input.bin")
+    trajectory_path = os.path.join(directory, "trajectory.csv")
+
+    try:
+        controls.input_source = ScriptedInput(SCRIPT)
+        app = Application(headless=True, record_path=record_path)
+        app.wait_until_ready()
+
+        globalClock.setMode(ClockObject.MNonRealTime)
+        recorded = []
+        app.stages += (("trajectory",
+                        lambda: recorded.append(trajectory_sample(app))),)
+
+        while len(recorded) < args.frames:
+            globalClock.setDt((1 / 60, 1 / 30, 1 / 45)[len(recorded) % 3])
+            app.taskMgr.step()
+
+        lost = app.input_recorder.close()
+        subprocess.run([sys.executable, "benchmark.py", "frame", "--replay",
+                        record_path, "--trajectory", trajectory_path,
+                        "--frames", str(2 * args.frames)],
+                       stdout=subprocess.DEVNULL, check=True)
+
+        with open(trajectory_path) as csv_file:
+            replayed = [tuple(float(value) for value in line.split(","))
+                        for line in list(csv_file)[1:]]
+    finally:
+        shutil.rmtree(directory)
+
+    differences_m = [max(abs(recorded_value - replayed_value)
+                         for recorded_value, replayed_value
+                         in zip(recorded_sample[:3] + recorded_sample[4:7],
+                                replayed_sample[:3] + replayed_sample[4:7]))
+                     for recorded_sample, replayed_sample
+                     in zip(recorded, replayed)]
+    worst_m = max(differences_m, default=0.0)
+
+    print("{} frames recorded, {} lost, {} replayed, worst position "
+          "difference {:.6f} m".format(len(recorded), lost, len(replayed),
+                                       worst_m))
+
+    if len(replayed) != len(recorded) or worst_m > args.max_difference_m:
+        sys.stderr.write("The replay differs from the recording.\n")
+        exit(1)
+
+
+def benchmark_snapshots(args: argparse.Namespace):
+    """Capture every simulation step of the scripted walk, then decode,
+    save, load and rewind the history.
+    """
+
+    controls.input_source = ScriptedInput(SCRIPT)
+    app = Application(headless=True, snapshots=True)
+    app.wait_until_ready()
+
+    globalClock.setMode(ClockObject.MNonRealTime)
+    globalClock.setDt(args.dt)
+
+    # Timed around the capture stage of the simulation step.
+    capture_s = []
+    stages = list(app.simulation_stages)
+    index = [name for name, _ in stages].index("snapshot")
+    capture = stages[index][1]
+
+    def timed_capture():
+        start_s = time.perf_counter()
+        capture()
+        capture_s.append(time.perf_counter() - start_s)
+
+    stages[index] = ("snapshot", timed_capture)
+    app.simulation_stages = tuple(stages)
+
+    for _ in range(args.frames):
+        globalClock.tick()
+
+        for _, stage in app.stages:
+            stage()
+
+    history = app.snapshots
+    full_size = snapshot.MASK.size + struct.calcsize(
+        "<" + "".join(code for _, code in snapshot.FIELDS))
+    path = os.path.join(tempfile.mkdtemp(prefix="tpp3d_snapshots_"),
+                        "snapshots.bin")
+
+    start_s = time.perf_counter()
+    history.save(path)
+    save_s = time.perf_counter() - start_s
+    size = os.path.getsize(path) - snapshot.HEADER.size
+
+    start_s = time.perf_counter()
+    loaded = snapshot.SnapshotHistory.load(path)
+    load_s = time.perf_counter() - start_s
+    shutil.rmtree(os.path.dirname(path))
+
+    start_s = time.perf_counter()
+    states = [history.state_at(index) for index in range(len(history))]
+    decode_s = (time.perf_counter() - start_s) / len(history)
+
+    # Restoring and capturing again has to give the same state, up to
+    # the float32 clip frame.
+    mismatches = 0
+
+    for index in range(len(history) - 1, -1, -97):
+        snapshot.restore(app.world.player, app.tpp_camera, states[index])
+
+        if not all(math.isclose(restored, saved, abs_tol=1e-4)
+                   for restored, saved in zip(snapshot.capture(
+                       app.world.player, app.tpp_camera), states[index])):
+            mismatches += 1
+
+    print("snapshots: {}, {:.1f} B each on average, {} B full".format(
+        len(history), size / len(history), full_size))
+    print("capture: p50 {:.2f} us, p95 {:.2f} us".format(
+        percentile(capture_s, 50) * 1e6, percentile(capture_s, 95) * 1e6))
+    print("decode: {:.2f} us per snapshot".format(decode_s * 1e6))
+    print("save: {:.3f} ms, load: {:.3f} ms".format(save_s * 1e3,
+                                                    load_s * 1e3))
+    print("loaded history equal: {}, rewind mismatches: {}".format(
+        all(loaded.state_at(index) == states[index]
+            for index in range(len(history))), mismatches))
+
+
+def benchmark_startup(args: argparse.Namespace):
+    """Split the start of fresh processes into its phases.
+
+    The first process converts the assets into an empty cache, the next
+    ones load the conversions. Panda3D's own model cache is disabled.
+    """
+
+    cache_dir = tempfile.mkdtemp(prefix="tpp3d_cache_")
+
+    print("{:>6} {:>14} {:>10} {:>10} {:>14} {:>10}".format(
+        "start", "interpreter", "imports", "assets", "first frame",
+        "total [ms]"))
+
+    try:
+        for run in range(1 + args.warm_runs):
+            spawned_s = time.time()
+            probe = subprocess.run(
+                [sys.executable, "-c", STARTUP_PROBE, cache_dir],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                universal_newlines=True, check=True)
+            timestamps_s = [spawned_s] \
+                + json.loads(probe.stdout.splitlines()[-1])
+
+            print("{:>6} {:>14.1f} {:>10.1f} {:>10.1f} {:>14.1f} {:>10.1f}"
+                  .format("warm" if run else "cold",
+                          *((end_s - start_s) * 1e3
+                            for start_s, end_s in zip(timestamps_s,
+                                                      timestamps_s[1:])),
+                          (timestamps_s[-1] - spawned_s) * 1e3))
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def benchmark_streaming(args: argparse.Namespace):
+    """Walk diagonally across generated worlds of different sizes.
+
+    The frames are paced in the real time, so the loader thread keeps
+    up as it would in the game. A hole is a frame without the ground
+    under the walker.
+    """
+
+    start_headless()
+    tiles_dir = args.keep or tempfile.mkdtemp(prefix="tpp3d_tiles_")
+
+    print("{:>8} {:>10} {:>10} {:>10} {:>10} {:>8} {:>12} {:>8}".format(
+        "tiles", "world [m]", "p50 [ms]", "p95 [ms]", "max [ms]",
+        "loaded", "memory [MB]", "holes"))
+
+    try:
+        for tiles in args.tiles:
+            world_dir = os.path.join(tiles_dir, "{0}x{0}".format(tiles))
+            samples = tiles * (args.tile_samples - 1) + 1
+            rows, columns = np.mgrid[0:samples, 0:samples]
+
+            terrain_streaming.write_tiles(
+                world_dir, 8 * np.sin(columns / 37) * np.cos(rows / 53)
+                + 3 * np.sin((columns + rows) / 11), args.tile_samples, 1.0)
+
+            parent = NodePath("streamed_terrain")
+            terrain = terrain_streaming.StreamedTerrain(world_dir, parent)
+
+            # Start at a corner, after the start tiles are loaded.
+            start_m = -min(args.distance / math.sqrt(2),
+                           terrain.width_m * 0.8) / 2
+
+            while not terrain.is_ready():
+                terrain.update(start_m, start_m)
+                time.sleep(args.dt)
+
+            frames_s = []
+            max_loaded = 0
+            max_memory_bytes = 0
+            holes = 0
+            step_m = args.speed * args.dt / math.sqrt(2)
+
+            for frame in range(int(-2 * start_m / step_m)):
+                frame_start_s = time.perf_counter()
+                focus_m = start_m + frame * step_m
+
+                terrain.update(focus_m, focus_m)
+                frames_s.append(time.perf_counter() - frame_start_s)
+
+                if terrain.height_at(focus_m, focus_m) is None:
+                    holes += 1
+
+                max_loaded = max(max_loaded, len(terrain.tiles))
+                max_memory_bytes = max(max_memory_bytes, sum(
+                    tile.height_map.heights.nbytes
+                    + tile.mesh.node().getGeom(0).getVertexData()
+                    .getArray(0).getDataSizeBytes()
+                    + tile.mesh.node().getGeom(0).getPrimitive(0)
+                    .getVertices().getDataSizeBytes()
+                    for tile in terrain.tiles.values()))
+
+                time.sleep(max(args.dt - (time.perf_counter()
+                                          - frame_start_s), 0))
+
+            terrain.close()
+            print("{:>8} {:>10.0f} {:>10.3f} {:>10.3f} {:>10.3f} {:>8} "
+                  "{:>12.1f} {:>8}".format(
+                      tiles, tiles * (args.tile_samples - 1),
+                      percentile(frames_s, 50) * 1e3,
+                      percentile(frames_s, 95) * 1e3, max(frames_s) * 1e3,
+                      max_loaded, max_memory_bytes / 2**20, holes))
+    finally:
+        if args.keep is None:
+            shutil.rmtree(tiles_dir)
+
+
+def benchmark_telemetry(args: argparse.Namespace):
+    """Time logging the frames of a session and summarizing the log."""
+
+    directory = tempfile.mkdtemp()
+    path = args.keep or os.path.join(directory, "session.tel")
+
+    try:
+        controls.input_source = ScriptedInput(SCRIPT)
+        app = Application(headless=True, crowd_size=args.crowd,
+                          telemetry_path=path)
+        app.wait_until_ready()
+
+        globalClock.setMode(ClockObject.MNonRealTime)
+        globalClock.setDt(1 / 60)
+        record_s = []
+
+        for _ in range(args.frames):
+            globalClock.tick()
+            app.profiler.run(app.stages)
+
+            # The work time, the fixed dt doesn't say anything.
+            start_s = time.perf_counter()
+            app.telemetry(sum(app.profiler.last_frame_s),
+                          app.profiler.last_frame_s,
+                          snapshot.capture(app.world.player, app.tpp_camera))
+            record_s.append(time.perf_counter() - start_s)
+
+        start_s = time.perf_counter()
+        dropped = app.telemetry.close()
+        close_s = time.perf_counter() - start_s
+
+        start_s = time.perf_counter()
+        columns = telemetry.read(path)
+        read_s = time.perf_counter() - start_s
+
+        start_s = time.perf_counter()
+        summary = telemetry.summarize(columns)
+        summarize_s = time.perf_counter() - start_s
+
+        print("record: p50 {:.2f} us, p99 {:.2f} us, max {:.2f} us per frame"
+              .format(percentile(record_s, 50) * 1e6,
+                      percentile(record_s, 99) * 1e6, max(record_s) * 1e6))
+        print("{} columns, {:.1f} bytes per frame, {} dropped, "
+              "{:.1f} ms to close".format(
+                  len(app.telemetry.column_names),
+                  os.path.getsize(path) / args.frames, dropped,
+                  close_s * 1e3))
+        print("read {} frames in {:.1f} ms, summarized in {:.1f} ms\n"
+              .format(len(columns["frame"]), read_s * 1e3,
+                      summarize_s * 1e3))
+        print(summary, end="")
+    finally:
+        shutil.rmtree(directory)
+
+
+def benchmark_workers(args: argparse.Namespace):
+    """Measure the agent steps throughput for the worker counts.
+
+    The main process can busy-wait between starting a step and reading
+    its results, like the rest of a frame does in the game.
+    """
+
+    height_map = HeightMap.from_triangles(
+        terrain_geometry.read_triangles(make_grid_terrain(96)))
+    dt_s = 1 / 60
+
+    print("{} CPU cores".format(os.cpu_count()))
+    print("{:>8} {:>12} {:>14} {:>10}".format(
+        "workers", "step [ms]", "agents/s [M]", "speedup"))
+
+    serial_s = None
+
+    for count in args.workers:
+        crowd = Crowd(args.agents, height_map, None, None, pool_size=0,
+                      workers=count)
+        crowd.step(dt_s)  # Warm up.
+        crowd.sync()
+
+        start_s = time.perf_counter()
+
+        for _ in range(args.steps):
+            crowd.step(dt_s)
+            busy_until_s = time.perf_counter() + args.main_work_ms / 1e3
+
+            while time.perf_counter() < busy_until_s:
+                pass
+            crowd.sync()
+
+        step_s = (time.perf_counter() - start_s) / args.steps
+        serial_s = serial_s or step_s
+        del crowd
+
+        print("{:>8} {:>12.3f} {:>14.2f} {:>10.2f}".format(
+            count, step_s * 1e3, args.agents / step_s / 1e6,
+            serial_s / step_s))
+
+
+def make_grid_terrain(quads: int, size_m: float = 200.0) -> NodePath:
+    """Build a hilly square terrain with 2 * quads^2 triangles.
+
+    Parameters:
+    quads -- number of the grid quads per side.
+    size_m -- terrain width and height.
+    """
+
+    vertex_data = GeomVertexData("terrain", GeomVertexFormat.getV3(),
+                                 Geom.UHStatic)
+    vertex_data.setNumRows((quads + 1) ** 2)
+    writer = GeomVertexWriter(vertex_data, "vertex")
+
+    for row in range(quads + 1):
+        for col in range(quads + 1):
+            x = (col / quads - 0.5) * size_m
+            y = (row / quads - 0.5) * size_m
+            writer.addData3(x, y, 2 * math.sin(x / 15) * math.cos(y / 11)
+                            + 0.5 * math.sin(x / 3))
+
+    triangles = GeomTriangles(Geom.UHStatic)
+
+    for row in range(quads):
+        for col in range(quads):
+            corner = row * (quads + 1) + col
+            triangles.addVertices(corner, corner + 1, corner + quads + 2)
+            triangles.addVertices(corner, corner + quads + 2,
+                                  corner + quads + 1)
+
+    geom = Geom(vertex_data)
+    geom.addPrimitive(triangles)
+    geom_node = GeomNode("terrain")
+    geom_node.addGeom(geom)
+
+    return NodePath(geom_node)
+
+
+def percentile(samples: list, rank: float) -> float:
+    """Return the nearest-rank percentile.
+
+    Parameters:
+    samples -- measured values.
+    rank -- percent, e.g. 95.
+    """
+
+    ordered = sorted(samples)
+    return ordered[max(math.ceil(rank / 100 * len(ordered)) - 1, 0)]
+
+
+def query_rays(terrain: NodePath, points: list,
+               from_mask: CollideMask = None) -> tuple:
+    """Cast the vertical ray the way the physics does, point by point.
+
+    Parameters:
+    terrain -- model to collide with.
+    points -- (x, y) pairs in the terrain space.
+    from_mask -- layer to collide with, the visible geometry if None.
+    """
+
+    coll_checker = CollisionTraverser()
+    coll_handler = CollisionHandlerQueue()
+    probe = terrain.attachNewNode(CollisionNode("probe"))
+    probe.node().addSolid(CollisionRay(0, 0, 100, 0, 0, -1))
+    probe.node().setFromCollideMask(GeomNode.getDefaultCollideMask()
+                                    if from_mask is None else from_mask)
+
+    heights = []
+    start_s = time.perf_counter()
+
+    for x, y in points:
+        probe.setPos(x, y, 0)
+        coll_checker.addCollider(probe, coll_handler)
+        coll_checker.traverse(terrain)
+        coll_handler.sortEntries()
+        entries = list(coll_handler.getEntries())
+        heights.append(entries[0].getSurfacePoint(terrain).getZ()
+                       if entries else None)
+        coll_checker.clearColliders()
+
+    elapsed_s = time.perf_counter() - start_s
+    probe.removeNode()
+
+    return heights, elapsed_s
+
+
+def random_points(triangles: np.ndarray, count: int) -> list:
+    """Return reproducible points spread over the terrain's inner part.
+
+    Parameters:
+    triangles -- terrain's triangles.
+    count -- number of the points.
+    """
+
+    margin = 0.05
+    points = triangles.reshape(-1, 3)
+    low, high = points[:, :2].min(axis=0), points[:, :2].max(axis=0)
+    span = high - low
+    rng = np.random.default_rng(0)
+
+    return (low + span * margin + rng.random((count, 2)) * span
+            * (1 - 2 * margin)).tolist()
+
+
+def trajectory_sample(app: Application) -> tuple:
+    """Return the player's position and heading and the camera's position,
+    heading and pitch.
+
+    Parameters:
+    app -- loaded game.
+    """
+
+    return tuple(app.world.player.getPos()) + (app.world.player.getH(),) \
+        + tuple(base.camera.getPos()) + tuple(base.camera.getHpr())[:2]
+
+
+class ScriptedInput:
+    """Input source replaying a fixed list of the key and mouse steps."""
+
+    def __init__(self, script: tuple):
+        """Start at the beginning of the script.
+
+        Parameters:
+        script -- (frames, keys, mouse_dx, mouse_dy) steps looped forever.
+                  Keys are held during the step and the mouse moves by
+                  the deltas per frame, as in the relative mouse mode.
+        """
+
+        self.__frames = [(sum(controls.KEY_BITS[key] for key in keys),
+                          mouse_dx, mouse_dy)
+                         for frames, keys, mouse_dx, mouse_dy in script
+                         for _ in range(frames)]
+        self.__frame_idx = 0
+
+    def __call__(self, mouse_pos: dict) -> int:
+        """Apply the next frame of the script and return its keys.
+
+        Parameters:
+        mouse_pos -- controls' mouse position to move.
+        """
+
+        key_mask, mouse_dx, mouse_dy = self.__frames[self.__frame_idx]
+        self.__frame_idx = (self.__frame_idx + 1) % len(self.__frames)
+
+        mouse_pos['x'] += mouse_dx
+        mouse_pos['y'] += mouse_dy
+
+        return key_mask
+
+
+# Standing, walking around, toggling the run, strafing and looking around.
+SCRIPT = ((60, (), 0.0, 0.0),
+          (120, ('w',), 0.002, 0.0),
+          (60, ('w', 'a'), 0.0, -0.001),
+          (2, ("lshift",), 0.0, 0.0),
+          (120, ('w',), -0.003, 0.001),
+          (60, ('s',), 0.0, 0.0),
+          (60, ('d',), 0.0, 0.002),
+          (60, ('s', 'd'), 0.001, -0.002),
+          (2, ("lshift",), 0.0, 0.0))
+
+# Started in a fresh interpreter with the cache directory as an argument,
+# prints the timestamps of the startup phases.
+STARTUP_PROBE = """
+import json
+import sys
+import time
+
+started_s = time.time()
+
+import application
+import asset_cache
+import controls
+
+imported_s = time.time()
+
+from panda3d.core import BamCache
+
+BamCache.getGlobalPtr().setActive(False)
+asset_cache.CACHE_DIR = sys.argv[1]
+controls.input_source = lambda mouse_pos: 0
+
+app = application.Application(headless=True)
+app.wait_until_ready()
+ready_s = time.time()
+
+for _, stage in app.stages:
+    stage()
+
+print(json.dumps([started_s, imported_s, ready_s, time.time()]))
+"""
+
+
+def start_headless():
+    """Create the windowless ShowBase that provides the loader."""
+
+    loadPrcFileData("", "window-type none\naudio-library-name null")
+    return ShowBase()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""Simplified terrain collision mesh baked from the render geometry.
+
+The terrain heights are split into a quadtree, a quad is kept whole if
+two triangles over its corners are within the error tolerance of all
+the height samples under it. The collision cost then follows the shape
+of the terrain, not the density of its visual mesh. The baked triangles
+are cached next to the converted assets.
+"""
+
+import bisect
+import os
+import sys
+
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    sys.stderr.write("NumPy not found.\n")
+    exit()
+
+
+import asset_cache
+from height_map import HeightMap
+
+
+VERSION = 1  # Of the baking, a new one doesn't reuse the cached meshes.
+DEFAULT_TOLERANCE_M = 0.1
+
+
+def bake(triangles: np.ndarray, height_map: HeightMap,
+         tolerance_m: float = DEFAULT_TOLERANCE_M) -> np.ndarray:
+    """Return the simplified triangles of a terrain.
+
+    The neighbours' corners on the edges of a quad are fanned from its
+    center, so the mesh has no cracks. Where the height map has no
+    single ground, e.g. under an overhang, the original triangles are
+    kept. The original triangles are returned if they are fewer.
+
+    Parameters:
+    triangles -- (count, 3, 3) array of the render triangles' points.
+    height_map -- heights of the same triangles.
+    tolerance_m -- max. height error at the height map samples.
+    """
+
+    heights = height_map.heights
+    quads, raw_quads = __split(heights, tolerance_m)
+
+    # Columns of the quads' corners on every row and rows on every
+    # column, sorted.
+    corner_columns = {}
+    corner_rows = {}
+
+    for column0, row0, column1, row1 in quads:
+        for row in (row0, row1):
+            corner_columns.setdefault(row, set()).update((column0, column1))
+        for column in (column0, column1):
+            corner_rows.setdefault(column, set()).update((row0, row1))
+
+    corner_columns = {row: sorted(columns)
+                      for row, columns in corner_columns.items()}
+    corner_rows = {column: sorted(rows)
+                   for column, rows in corner_rows.items()}
+
+    baked = []
+
+    for column0, row0, column1, row1 in quads:
+        # Counterclockwise from above, from the lower left corner.
+        bottom = __between(corner_columns[row0], column0, column1)
+        right = __between(corner_rows[column1], row0, row1)
+        top = __between(corner_columns[row1], column0, column1)
+        left = __between(corner_rows[column0], row0, row1)
+
+        if not (bottom or right or top or left):
+            baked.append(((column0, row0), (column1, row0), (column1, row1)))
+            baked.append(((column0, row0), (column1, row1), (column0, row1)))
+            continue
+
+        ring = [(column0, row0)] + [(column, row0) for column in bottom] \
+            + [(column1, row0)] + [(column1, row) for row in right] \
+            + [(column1, row1)] + [(column, row1) for column in top[::-1]] \
+            + [(column0, row1)] + [(column0, row) for row in left[::-1]]
+        center = ((column0 + column1) / 2, (row0 + row1) / 2)
+
+        baked.extend((center, ring[index - 1], ring[index])
+                     for index in range(len(ring)))
+
+    baked = __to_points(np.array(baked, dtype=np.float64).reshape(-1, 3, 2),
+                        height_map)
+
+    if raw_quads:
+        baked = np.concatenate([baked, __triangles_within(
+            triangles, raw_quads, height_map)])
+
+    return baked if len(baked) < len(triangles) else triangles
+
+
+def load_or_bake(asset_path: str, triangles: np.ndarray,
+                 height_map: HeightMap,
+                 tolerance_m: float = DEFAULT_TOLERANCE_M) -> np.ndarray:
+    """Return the cached simplified triangles or bake and cache them.
+
+    The cache file is named after the asset contents, the tolerance
+    and the baking version.
+
+    Parameters:
+    asset_path -- terrain asset as passed to the loader.
+    triangles -- (count, 3, 3) array of the render triangles' points.
+    height_map -- heights of the same triangles.
+    tolerance_m -- max. height error at the height map samples.
+    """
+
+    cached = asset_cache.derived_path(
+        asset_path, "collision", ".npy",
+        "{} {!r}".format(VERSION, float(tolerance_m)))
+
+    if cached is not None and os.path.isfile(cached):
+        return np.load(cached)
+
+    baked = bake(triangles, height_map, tolerance_m)
+
+    if cached is not None:
+        asset_cache.remove_outdated(cached)
+
+        # Renamed when complete, so a crash never leaves a truncated file.
+        partial = cached + ".part"
+
+        with open(partial, "wb") as cache_file:
+            np.save(cache_file, baked)
+        os.replace(partial, cached)
+
+    return baked
+
+
+def __between(values: list, low: int, high: int) -> list:
+    """Return the sorted values strictly between two bounds.
+
+    Parameters:
+    values -- sorted values.
+    low -- lower bound.
+    high -- upper bound.
+    """
+
+    return values[bisect.bisect_right(values, low):
+                  bisect.bisect_left(values, high)]
+
+
+def __fit_error(heights: np.ndarray) -> float:
+    """Return the max. error of two triangles over a block's corners.
+
+    The triangles share the diagonal from the first to the last sample.
+
+    Parameters:
+    heights -- (rows, columns) block of the height samples.
+    """
+
+    rows, columns = heights.shape
+    u = np.linspace(0, 1, columns)[None, :]
+    v = np.linspace(0, 1, rows)[:, None]
+
+    z00, z10 = heights[0, 0], heights[0, -1]
+    z01, z11 = heights[-1, 0], heights[-1, -1]
+
+    fitted = np.where(u >= v,
+                      z00 + u * (z10 - z00) + v * (z11 - z10),
+                      z00 + v * (z01 - z00) + u * (z11 - z01))
+
+    return np.abs(heights - fitted).max()
+
+
+def __split(heights: np.ndarray, tolerance_m: float) -> tuple:
+    """Return the quads within the tolerance and the raw ones.
+
+    A quad is a first column, first row, last column and last row of
+    the samples. A raw quad is a single cell without a known height.
+
+    Parameters:
+    heights -- (rows, columns) array of the height samples.
+    tolerance_m -- max. height error at the samples.
+    """
+
+    quads = []
+    raw_quads = []
+    last_column = heights.shape[1] - 1
+    last_row = heights.shape[0] - 1
+
+    # Aligned to the powers of two, like the regular meshes' quads.
+    size = 1 << max(max(last_column, last_row) - 1, 0).bit_length()
+    pending = [(0, 0, size)]
+
+    while pending:
+        column0, row0, size = pending.pop()
+        column1 = min(column0 + size, last_column)
+        row1 = min(row0 + size, last_row)
+        block = heights[row0:row1 + 1, column0:column1 + 1]
+        known = not np.isnan(block).any()
+
+        if size == 1 or known and __fit_error(block) <= tolerance_m:
+            (quads if known else raw_quads).append(
+                (column0, row0, column1, row1))
+            continue
+
+        size //= 2
+        pending.extend((column, row, size)
+                       for column in (column0, column0 + size)
+                       for row in (row0, row0 + size)
+                       if column < last_column and row < last_row)
+
+    return quads, raw_quads
+
+
+def __to_points(samples: np.ndarray, height_map: HeightMap) -> np.ndarray:
+    """Return the (count, 3, 3) points of the triangles in the samples.
+
+    Parameters:
+    samples -- (count, 3, 2) columns and rows, fractional at the quad
+               centers.
+    height_map -- heights of the samples.
+    """
+
+    x_m = height_map.origin_x_m + samples[..., 0] * height_map.cell_size_m
+    y_m = height_map.origin_y_m + samples[..., 1] * height_map.cell_size_m
+    z_m = height_map.heights_at(x_m, y_m)
+
+    # Read directly, the interpolation touches the unknown neighbours.
+    columns = samples[..., 0].astype(np.int64)
+    rows = samples[..., 1].astype(np.int64)
+    on_samples = (columns == samples[..., 0]) & (rows == samples[..., 1])
+    z_m[on_samples] = height_map.heights[rows[on_samples],
+                                         columns[on_samples]]
+
+    return np.stack([x_m, y_m, z_m], axis=-1)
+
+
+def __triangles_within(triangles: np.ndarray, quads: list,
+                       height_map: HeightMap) -> np.ndarray:
+    """Return the triangles whose centroids are in the quads.
+
+    Parameters:
+    triangles -- (count, 3, 3) array of points.
+    quads -- single cells as the first and last column and row.
+    height_map -- grid of the quads.
+    """
+
+    centroids = triangles.mean(axis=1)
+    columns = np.floor((centroids[:, 0] - height_map.origin_x_m)
+                       / height_map.cell_size_m).astype(np.int64)
+    rows = np.floor((centroids[:, 1] - height_map.origin_y_m)
+                    / height_map.cell_size_m).astype(np.int64)
+
+    raw = np.zeros(height_map.heights.shape, dtype=bool)
+
+    for column0, row0, _, _ in quads:
+        raw[row0, column0] = True
+
+    inside = (columns >= 0) & (columns < raw.shape[1]) \
+        & (rows >= 0) & (rows < raw.shape[0])
+    selected = np.zeros(len(triangles), dtype=bool)
+    selected[inside] = raw[rows[inside], columns[inside]]
+
+    return triangles[selected]
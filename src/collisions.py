@@ -0,0 +1,191 @@
+"""Terrain collisions shared by the player and the camera."""
+
+import sys
+import time
+
+try:
+    from panda3d.core import BitMask32
+    from panda3d.core import CollideMask
+    from panda3d.core import CollisionHandlerQueue
+    from panda3d.core import CollisionTraverser
+    from panda3d.core import NodePath
+except ModuleNotFoundError:
+    sys.stderr.write("Panda3d not found.\n")
+    exit()
+
+
+TERRAIN_MASK = BitMask32.bit(1)
+
+GROUND_PASS = "ground"  # Vertical rays, positioned at the frame start.
+BOOM_PASS = "boom"  # Camera boom, swept after the camera is rotated.
+
+
+class Collisions:
+    """Traversers with persistent colliders grouped in passes.
+
+    Colliders positioned at the same point of the frame share a pass.
+    Every pass traverses the terrain at most once per frame, on the
+    first request for entries, so frames that don't need it cost
+    nothing.
+    """
+
+    def __init__(self, terrain: NodePath):
+        """Prepare the traversers.
+
+        Parameters:
+        terrain -- collision geometry with the TERRAIN_MASK into
+                   collide mask, e.g. the terrain chunks.
+        """
+
+        self.__terrain = terrain
+        self.__passes = {}
+        self.__collider_passes = {}
+
+    def add_collider(self, collider: NodePath, pass_name: str = GROUND_PASS,
+                     swept: bool = False):
+        """Register a "from" object once for all the next frames.
+
+        Parameters:
+        collider -- node path with the CollisionNode, e.g. a ray.
+        pass_name -- group of colliders traversed together.
+        swept -- test the path from the previous position set by the
+                 setFluidPos, for the whole pass.
+        """
+
+        collider.node().setFromCollideMask(TERRAIN_MASK)
+        collider.node().setIntoCollideMask(CollideMask.allOff())
+
+        if pass_name not in self.__passes:
+            self.__passes[pass_name] = TraversalPass(pass_name)
+
+        traversal_pass = self.__passes[pass_name]
+        traversal_pass.add_collider(collider)
+        traversal_pass.coll_checker.setRespectPrevTransform(
+            swept or traversal_pass.coll_checker.getRespectPrevTransform())
+        self.__collider_passes[collider] = traversal_pass
+
+    def invalidate(self, pass_name: str = GROUND_PASS):
+        """Make the next request for entries traverse again.
+
+        Needed when the colliders move more than once per frame, e.g.
+        in every simulation step.
+
+        Parameters:
+        pass_name -- group of colliders that have moved.
+        """
+
+        if pass_name in self.__passes:
+            self.__passes[pass_name].stale = True
+
+    def remove_collider(self, collider: NodePath):
+        """Stop tracking a "from" object.
+
+        Parameters:
+        collider -- node path passed to the add_collider.
+        """
+
+        self.__collider_passes.pop(collider).remove_collider(collider)
+
+    def entries(self, collider: NodePath) -> list:
+        """Return the collider's entries sorted from the nearest one.
+
+        Parameters:
+        collider -- node path passed to the add_collider.
+        """
+
+        return self.__collider_passes[collider].entries(collider,
+                                                        self.__terrain)
+
+    def frame_stats(self) -> tuple:
+        """Return the traversal count and time in seconds of the current
+        frame.
+        """
+
+        frame = globalClock.getFrameCount()
+        traversed = [(traversal_pass.traversal_count,
+                      traversal_pass.traversal_time_s)
+                     for traversal_pass in self.__passes.values()
+                     if traversal_pass.traversed_frame == frame]
+
+        return (sum(count for count, _ in traversed),
+                sum(time_s for _, time_s in traversed))
+
+
+class TraversalPass:
+    """Colliders checked by one traversal per frame."""
+
+    def __init__(self, name: str):
+        """Create the traverser.
+
+        Parameters:
+        name -- pass name, also visible in the PStats.
+        """
+
+        self.coll_checker = CollisionTraverser(name)
+        self.stale = False  # Traverse again even in the same frame.
+        self.traversed_frame = -1
+        self.traversal_count = 0  # In the traversed frame.
+        self.traversal_time_s = 0.0
+
+        self.__handlers = {}
+        self.__entries = {}
+
+    def add_collider(self, collider: NodePath):
+        """Register a "from" object.
+
+        Parameters:
+        collider -- node path with the CollisionNode.
+        """
+
+        self.__handlers[collider] = CollisionHandlerQueue()
+        self.coll_checker.addCollider(collider, self.__handlers[collider])
+
+    def entries(self, collider: NodePath, terrain: NodePath) -> list:
+        """Return the collider's sorted entries, traverse if needed.
+
+        Parameters:
+        collider -- registered node path.
+        terrain -- collision geometry to traverse.
+        """
+
+        frame = globalClock.getFrameCount()
+
+        if frame != self.traversed_frame or self.stale:
+            self.__traverse(frame, terrain)
+
+        return self.__entries.get(collider, [])
+
+    def remove_collider(self, collider: NodePath):
+        """Stop tracking a "from" object.
+
+        Parameters:
+        collider -- registered node path.
+        """
+
+        self.coll_checker.removeCollider(collider)
+        self.__entries.pop(collider, None)
+        del self.__handlers[collider]
+
+    def __traverse(self, frame: int, terrain: NodePath):
+        """Check all the colliders against the terrain at once.
+
+        Parameters:
+        frame -- number of the current frame.
+        terrain -- collision geometry to traverse.
+        """
+
+        start_s = time.perf_counter()
+        self.coll_checker.traverse(terrain)
+
+        for collider, handler in self.__handlers.items():
+            handler.sortEntries()
+            self.__entries[collider] = list(handler.getEntries())
+
+        if frame != self.traversed_frame:
+            self.traversed_frame = frame
+            self.traversal_count = 0
+            self.traversal_time_s = 0.0
+
+        self.stale = False
+        self.traversal_count += 1
+        self.traversal_time_s += time.perf_counter() - start_s
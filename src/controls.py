@@ -3,6 +3,7 @@
 import sys
 
 try:
+    from panda3d.core import ModifierButtons
     from panda3d.core import WindowProperties
 except ModuleNotFoundError:
     sys.stderr.write("Panda3d not found.\n")
@@ -12,15 +13,20 @@ except ModuleNotFoundError:
 MOUSE_SENSITIVITY_DEG = 60
 KEYPRESS_TIMEOUT_S = 0.1
 
-pressed_keys = {'w': False,
-                's': False,
-                'a': False,
-                'd': False,
-                "lshift": False,
-                "lcontrol": False}
+# Bit of every key in the key_mask, also the order in the recordings.
+KEYS = ('w', 's', 'a', 'd', "lshift", "lcontrol")
+KEY_BITS = {key: 1 << bit for bit, key in enumerate(KEYS)}
+
+key_mask = 0  # Currently pressed keys, set by the button events.
 
 mouse_pos = {'x': 0, 'y': 0}
 
+# Callable that fills the mouse_pos and returns the key_mask instead of
+# the live input, e.g. a scripted input of the headless benchmark.
+input_source = None
+
+__window_size_px = [0, 0]
+
 
 class Keymap:
     """Keyboard bindings."""
@@ -35,65 +41,120 @@ class Keymap:
         toggle_run = "lshift"
         toggle_crouch = "lcontrol"
 
+    class Debug:
+        """Development helpers."""
+
+        dump_profile = "f12"
+        save_snapshots = "f5"
+        rewind = "f9"  # One snapshot back, pauses the simulation.
+        step_forward = "f10"
+        resume = "f11"  # Continues from the rewound snapshot.
+
 
 def handle_events():
     """Wrap keyboard and mouse calls."""
 
-    __poll_keyboard()
+    global key_mask
+
+    if input_source is not None:
+        key_mask = input_source(mouse_pos)
+        return
+
     __assign_mouse_pos()
 
 
+def is_pressed(key: str) -> bool:
+    """Tell if the key is held down.
+
+    Parameters:
+    key -- key name from the KEYS, e.g. 'w'.
+    """
+
+    return key_mask & KEY_BITS[key] != 0
+
+
 def limit_mouse_pos(min_pitch_deg: float, max_pitch_deg: float):
     """
     Panda3D describes max. left mouse position as x = -1 and max. right
     as the x = 1. The same thing is with the Y axis. If You move the
     mouse a lot, the values can be relatively smaller and bigger, e.g.
     y = 6.35. This method set the mouse position to avoid such values.
+    The pointer is moved only if any limit is exceeded.
 
     Parameters:
     min_pitch_deg -- how low can You look.
     max_pitch_deg -- how far can You look on the sky.
     """
 
-    global MOUSE_SENSITIVITY_DEG
-    global mouse_pos
-
-    DEFAULT_POINTER_ID = 0
-    window = base.win.getProperties()
-
-    # Convert P3D coorinates to screen pixels.
-    mouse_x_onscreen_px = (window.getXSize() / 2) + ((window.getXSize() / 2)
-                                                     * mouse_pos['x'])
-
-    mouse_y_onscreen_px = (window.getYSize() / 2) - ((window.getYSize() / 2)
-                                                     * mouse_pos['y'])
+    limited_x = mouse_pos['x']
+    limited_y = mouse_pos['y']
 
     # Push the mouse pointer maximally to the left.
     if -mouse_pos['x'] * MOUSE_SENSITIVITY_DEG < 0:
-        mouse_x_onscreen_px = (window.getXSize() / 2) \
-            - (window.getXSize() / 2 * 360 / MOUSE_SENSITIVITY_DEG)
+        limited_x = -360 / MOUSE_SENSITIVITY_DEG
 
     # Push the pointer to the default pos (center).
     elif -mouse_pos['x'] * MOUSE_SENSITIVITY_DEG > 360:
-        mouse_x_onscreen_px = window.getXSize() / 2
+        limited_x = 0
 
     # Mouse is too low.
     if mouse_pos['y'] * MOUSE_SENSITIVITY_DEG < min_pitch_deg:
-        mouse_y_onscreen_px = (window.getYSize() / 2) \
-            - (window.getYSize() / 2 * min_pitch_deg /
-               MOUSE_SENSITIVITY_DEG)
+        limited_y = min_pitch_deg / MOUSE_SENSITIVITY_DEG
 
     # Mouse is too high.
     elif mouse_pos['y'] * MOUSE_SENSITIVITY_DEG > max_pitch_deg:
-        # Konwersja pandowych koordynatów myszy na piksele na ekranie.
-        mouse_y_onscreen_px = (window.getYSize() / 2) \
-            - (window.getYSize() / 2 * max_pitch_deg /
-               MOUSE_SENSITIVITY_DEG)
+        limited_y = max_pitch_deg / MOUSE_SENSITIVITY_DEG
+
+    if limited_x == mouse_pos['x'] and limited_y == mouse_pos['y']:
+        return
+
+    set_mouse_pos(limited_x, limited_y)
+
+
+def set_mouse_pos(x: float, y: float):
+    """Set the mouse position and move the pointer there, so the next
+    frames continue from it.
+
+    Parameters:
+    x -- Panda3D X coordinate of the mouse.
+    y -- Panda3D Y coordinate of the mouse.
+    """
+
+    DEFAULT_POINTER_ID = 0
+
+    mouse_pos['x'] = x
+    mouse_pos['y'] = y
+
+    if input_source is not None or base.win is None:  # No pointer.
+        return
+
+    # Convert P3D coorinates to screen pixels.
+    mouse_x_onscreen_px = (__window_size_px[0] / 2) \
+        + ((__window_size_px[0] / 2) * x)
+
+    mouse_y_onscreen_px = (__window_size_px[1] / 2) \
+        - ((__window_size_px[1] / 2) * y)
 
     base.win.movePointer(DEFAULT_POINTER_ID, int(mouse_x_onscreen_px),
                          int(mouse_y_onscreen_px))
 
 
+def setup_keyboard():
+    """Register the key bindings once, the events set the key_mask."""
+
+    # Throw e.g. "w" instead of "shift-w" while running.
+    base.buttonThrowers[0].node().setModifierButtons(ModifierButtons())
+    base.mouseWatcherNode.setModifierButtons(ModifierButtons())
+
+    for key in KEYS:
+        base.accept(key, __set_key_state, [key, "down"])
+        base.accept(key + "-up", __set_key_state, [key, "up"])
+
+    base.accept("escape", sys.exit)
+    base.accept("window-event", __handle_window_event)
+    __handle_window_event(base.win)
+
+
 def setup_mouse():
     """
     Set the mouse mode from the absolute to the relative
@@ -115,8 +176,6 @@ def __assign_mouse_pos():
     another modules.
     """
 
-    global mouse_pos
-
     if base.mouseWatcherNode.hasMouse():
         mouse = base.mouseWatcherNode.getMouse()
 
@@ -124,17 +183,22 @@ def __assign_mouse_pos():
         mouse_pos['y'] = mouse.getY()
 
 
-def __poll_keyboard():
-    """Look for keyboard events."""
+def __handle_window_event(window):
+    """Cache the window size and release the keys on the focus loss.
 
-    global pressed_keys
+    Parameters:
+    window -- window that has changed.
+    """
 
-    for key in pressed_keys:
-        if base.mouseWatcherNode.is_button_down(key):
-            __set_key_state(key, "down")
-        else:
-            __set_key_state(key, "up")
-    base.accept("escape", sys.exit)
+    global key_mask
+
+    properties = window.getProperties()
+
+    __window_size_px[0] = properties.getXSize()
+    __window_size_px[1] = properties.getYSize()
+
+    if properties.hasForeground() and not properties.getForeground():
+        key_mask = 0  # Key releases outside the window are never seen.
 
 
 def __set_key_state(key: str, state: str):
@@ -145,9 +209,9 @@ def __set_key_state(key: str, state: str):
     state -- just "up" or "down".
     """
 
-    global pressed_keys
+    global key_mask
 
     if state == "down":
-        pressed_keys[key] = True
+        key_mask |= KEY_BITS[key]
     elif state == "up":
-        pressed_keys[key] = False
+        key_mask &= ~KEY_BITS[key]
@@ -0,0 +1,564 @@
+"""Many walking NPCs simulated in batches."""
+
+import functools
+import sys
+
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    sys.stderr.write("NumPy not found.\n")
+    exit()
+
+try:
+    from panda3d.core import NodePath
+except ModuleNotFoundError:
+    sys.stderr.write("Panda3d not found.\n")
+    exit()
+
+
+from actor_lod import ActorLOD
+from height_map import HeightMap
+import invisible_border
+from movable_area import MovableArea
+from navigation import PathPlanner
+from player import CLIP_SPEEDS_M_PER_S
+
+
+class Crowd:
+    """Wandering agents stored as a struct of arrays.
+
+    Every agent is a row of the NumPy arrays, all of them are moved,
+    kept within the border and put on the ground at once, optionally by
+    the worker processes. Only the agents nearest to the viewer are
+    shown, by a small pool of actors rebound to them every frame.
+    """
+
+    MIN_SPEED_M_PER_S = 0.8
+    MAX_SPEED_M_PER_S = 1.6
+    MODEL_YAW_DEG = 180  # The model faces the negative Y axis.
+    WAYPOINT_RADIUS_M = 0.5  # Reached from this close.
+
+    def __init__(self, count: int, height_map: HeightMap, parent: NodePath,
+                 create_actor, pool_size: int = 16, seed: int = 0,
+                 workers: int = 0, planner: PathPlanner = None):
+        """Scatter the agents and create the actors pool.
+
+        Parameters:
+        count -- number of the agents.
+        height_map -- terrain heights the agents walk on.
+        parent -- node the actors are shown under, e.g. the terrain.
+        create_actor -- returns a new actor with the "walk" animation.
+        pool_size -- max. number of the agents shown at once.
+        seed -- makes the wandering repeatable.
+        workers -- number of the processes stepping the agents, the
+                   main process steps them if zero.
+        planner -- finds the paths of the agents walking to the random
+                   goals instead of wandering.
+        """
+
+        self.__height_map = height_map
+        self.__random = np.random.default_rng(seed)
+
+        area_m = invisible_border.MOVABLE_AREA_METERS
+        half_width_m = area_m["width"] / 2
+        half_height_m = area_m["height"] / 2
+        movable_area = invisible_border.movable_area
+
+        self.__pool = []
+
+        for _ in range(min(pool_size, count)):
+            actor = create_actor()
+            actor.setScale(0.4)
+            actor.reparentTo(parent)
+            actor.hide()
+            self.__pool.append(actor)
+
+        self.__walk_frames = self.__pool[0].getNumFrames("walk") \
+            if self.__pool else 1
+        self.__walk_cycles_per_m = 0.0
+
+        if self.__pool:
+            self.__walk_cycles_per_m = 1 / (
+                CLIP_SPEEDS_M_PER_S["walk"]
+                * self.__pool[0].getDuration("walk"))
+
+        self.__bound_actors = {}  # Agent index: actor.
+        self.__lod_bands = np.full(count, -1)  # Of the bound agents.
+        self.__free_actors = list(self.__pool)
+
+        self.__shared_arrays = None
+        self.__workers = None
+
+        if workers:
+            from sim_workers import SharedArrays
+
+            self.__shared_arrays = SharedArrays(agent_array_specs(count))
+            arrays = self.__shared_arrays.arrays
+        else:
+            arrays = {name: np.zeros(shape, dtype) for name, (shape, dtype)
+                      in agent_array_specs(count).items()}
+
+        self.positions_m = arrays["positions_m"]
+        self.headings_deg = arrays["headings_deg"]
+        self.speeds_m_per_s = arrays["speeds_m_per_s"]
+        self.anim_phases = arrays["anim_phases"]
+        self.__previous_positions_m = arrays["previous_positions_m"]
+
+        if movable_area is None:
+            self.positions_m[:, 0] = self.__random.uniform(
+                -half_width_m, half_width_m, count)
+            self.positions_m[:, 1] = self.__random.uniform(
+                -half_height_m, half_height_m, count)
+        else:
+            self.positions_m[:, :2] = movable_area.random_points(
+                count, self.__random)
+        self.headings_deg[:] = self.__random.uniform(0, 360, count)
+        self.speeds_m_per_s[:] = self.__random.uniform(
+            self.MIN_SPEED_M_PER_S, self.MAX_SPEED_M_PER_S, count)
+        self.anim_phases[:] = self.__random.uniform(0, 1, count)
+        arrays["turn_timers_s"][:] = self.__random.uniform(
+            0, Agents.MAX_TURN_INTERVAL_S, count)
+
+        put_on_ground(self.positions_m, height_map)
+        self.__previous_positions_m[:] = self.positions_m
+
+        self.__planner = planner
+
+        if planner is not None:
+            arrays["turn_timers_s"][:] = np.inf  # Never wander.
+
+            self.__walking_speeds_m_per_s = self.speeds_m_per_s.copy()
+            self.__goals_m = np.zeros((count, 2))
+            self.__has_goal = np.zeros(count, dtype=bool)
+            self.__paths = [None] * count  # Waypoints of the agents.
+            self.__next_waypoints = np.zeros(count, dtype=np.int64)
+            self.__targets_m = np.zeros((count, 2))  # Next waypoints.
+            self.__following = np.zeros(count, dtype=bool)
+
+        # Only a height map of the whole terrain is copied to the workers,
+        # the streamed one changes.
+        self.__ground_in_workers = isinstance(height_map, HeightMap)
+        self.__grounded = True
+
+        self.__agents = None
+
+        if workers:
+            from sim_workers import WorkerPool
+
+            create_simulation = functools.partial(
+                create_agents, height_map=height_map
+                if self.__ground_in_workers else None,
+                walk_cycles_per_m=self.__walk_cycles_per_m, seed=seed,
+                half_width_m=half_width_m, half_height_m=half_height_m,
+                movable_area=movable_area)
+            self.__workers = WorkerPool(self.__shared_arrays,
+                                        create_simulation, workers)
+        else:
+            self.__agents = Agents(arrays, height_map,
+                                   self.__walk_cycles_per_m, self.__random,
+                                   half_width_m, half_height_m, movable_area)
+
+    def __del__(self):
+        """Stop the workers and remove the pooled actors."""
+
+        if self.__workers is not None:
+            self.__workers.close()
+
+            del self.positions_m, self.headings_deg, self.speeds_m_per_s
+            del self.anim_phases, self.__previous_positions_m
+            self.__shared_arrays.close()
+
+        for actor in self.__pool:
+            actor.cleanup()
+            actor.removeNode()
+
+    def block(self, name: str, polygon_m: list):
+        """Close a region to the walking agents.
+
+        The agents whose paths cross it find new ones to their goals.
+
+        Parameters:
+        name -- region name for the unblock().
+        polygon_m -- (X, Y) vertices.
+        """
+
+        if self.__planner is None:
+            raise ValueError("The crowd has no path planner to block.")
+
+        for agent in self.__planner.block(name, polygon_m):
+            self.__paths[agent] = None
+            self.__following[agent] = False
+
+    def show(self, viewer_pos_m, actor_lod: ActorLOD = None,
+             alpha: float = 1.0):
+        """Show the agents nearest to the viewer.
+
+        Parameters:
+        viewer_pos_m -- point the shown agents are nearest to.
+        actor_lod -- bands that pose the shown agents less often far
+                     from the viewer.
+        alpha -- position between the last two steps to render.
+        """
+
+        self.sync()
+        self.__show_nearest(viewer_pos_m, actor_lod, alpha)
+
+    def step(self, dt_s: float):
+        """Move all the agents.
+
+        The workers move them in the background, until the sync().
+
+        Parameters:
+        dt_s -- duration of the simulation step.
+        """
+
+        if self.__workers is None:
+            self.__steer_along_paths()
+            self.__agents.step(dt_s)
+            return
+
+        self.sync()
+        self.__steer_along_paths()
+        self.__workers.step(dt_s)
+        self.__grounded = self.__ground_in_workers
+
+    def sync(self):
+        """Wait for the workers to finish moving the agents."""
+
+        if self.__workers is None:
+            return
+
+        self.__workers.wait()
+
+        if not self.__grounded:
+            put_on_ground(self.positions_m, self.__height_map)
+            self.__grounded = True
+
+    def unblock(self, name: str):
+        """Open a region closed by the block() again.
+
+        Parameters:
+        name -- region name.
+        """
+
+        if self.__planner is None:
+            raise ValueError("The crowd has no path planner to unblock.")
+
+        self.__planner.unblock(name)
+
+    def update(self, viewer_pos_m, dt_s: float, actor_lod: ActorLOD = None):
+        """Move all the agents and show the nearest ones.
+
+        Parameters:
+        viewer_pos_m -- point the shown agents are nearest to.
+        dt_s -- duration of the frame.
+        actor_lod -- bands that pose the shown agents less often far
+                     from the viewer.
+        """
+
+        self.step(dt_s)
+        self.show(viewer_pos_m, actor_lod)
+
+    def __show_nearest(self, viewer_pos_m, actor_lod: ActorLOD,
+                       alpha: float):
+        """Bind the pooled actors to the agents nearest to the viewer.
+
+        Agents that stay near keep their actors. A bound agent is posed
+        every update interval of its LOD band, and once when bound or
+        moved to another band.
+
+        Parameters:
+        viewer_pos_m -- point the shown agents are nearest to.
+        actor_lod -- distance bands, every frame posing without it.
+        alpha -- position between the last two steps to render.
+        """
+
+        if not self.__pool:
+            return
+
+        distances_m2 = (self.positions_m[:, 0] - viewer_pos_m[0])**2 \
+            + (self.positions_m[:, 1] - viewer_pos_m[1])**2
+
+        if len(self.__pool) < len(distances_m2):
+            nearest = np.argpartition(distances_m2, len(self.__pool))
+            nearest = set(nearest[:len(self.__pool)].tolist())
+        else:
+            nearest = set(range(len(distances_m2)))
+
+        for agent in list(self.__bound_actors):
+            if agent not in nearest:
+                actor = self.__bound_actors.pop(agent)
+                actor.hide()
+                self.__free_actors.append(actor)
+                self.__lod_bands[agent] = -1
+
+        for agent in nearest.difference(self.__bound_actors):
+            self.__bound_actors[agent] = self.__free_actors.pop()
+            self.__bound_actors[agent].show()
+
+        bound = np.fromiter(self.__bound_actors, int, len(self.__bound_actors))
+        previous_bands = self.__lod_bands[bound]
+
+        if actor_lod is None:
+            bands = np.zeros_like(previous_bands)
+            intervals = np.ones_like(previous_bands)
+        else:
+            bands = actor_lod.classify(np.sqrt(distances_m2[bound]),
+                                       previous_bands)
+            intervals = np.array(actor_lod.update_intervals)[bands]
+
+        self.__lod_bands[bound] = bands
+        frame = globalClock.getFrameCount()
+
+        rendered_m = self.__previous_positions_m[bound] + alpha \
+            * (self.positions_m[bound] - self.__previous_positions_m[bound])
+
+        for agent, (x_m, y_m, z_m), interval, switched in zip(
+                bound.tolist(), rendered_m.tolist(), intervals.tolist(),
+                (bands != previous_bands).tolist()):
+            actor = self.__bound_actors[agent]
+
+            actor.setPosHpr(x_m, y_m, z_m,
+                            self.headings_deg[agent] + self.MODEL_YAW_DEG,
+                            0, 0)
+
+            # Staggered, so the agents of a band aren't posed at once.
+            if switched or interval and (frame + agent) % interval == 0:
+                actor.pose("walk", int(self.anim_phases[agent]
+                                       * self.__walk_frames))
+
+    def __steer_along_paths(self):
+        """Head the agents to their next waypoints.
+
+        The agents without a path stand until the planner finds it, the
+        ones at their goals ask for the paths to new ones.
+        """
+
+        if self.__planner is None:
+            return
+
+        planner = self.__planner
+
+        for agent in planner.update():
+            waypoints = planner.paths[agent]
+            self.__paths[agent] = waypoints
+
+            # An unreachable goal is replaced.
+            self.__has_goal[agent] = waypoints is not None
+            self.__following[agent] = waypoints is not None
+
+            if waypoints is not None:
+                self.__next_waypoints[agent] = 0
+                self.__targets_m[agent] = waypoints[0]
+
+        offsets_m = self.__targets_m - self.positions_m[:, :2]
+        reached = np.flatnonzero(self.__following & (
+            (offsets_m ** 2).sum(axis=1) < self.WAYPOINT_RADIUS_M ** 2))
+
+        for agent in reached.tolist():
+            waypoints = self.__paths[agent]
+            self.__next_waypoints[agent] += 1
+
+            if self.__next_waypoints[agent] < len(waypoints):
+                self.__targets_m[agent] = \
+                    waypoints[self.__next_waypoints[agent]]
+                offsets_m[agent] = self.__targets_m[agent] \
+                    - self.positions_m[agent, :2]
+            else:
+                self.__paths[agent] = None
+                self.__following[agent] = False
+                self.__has_goal[agent] = False
+
+        new_goals = np.flatnonzero(~self.__has_goal)
+
+        if len(new_goals):
+            self.__goals_m[new_goals] = planner.grid.center_of(
+                planner.grid.random_open_cells(len(new_goals),
+                                               self.__random))
+            self.__has_goal[new_goals] = True
+
+        for agent in np.flatnonzero(~self.__following).tolist():
+            if not planner.is_pending(agent):
+                planner.request(agent, self.positions_m[agent],
+                                self.__goals_m[agent])
+
+        following = self.__following
+        self.speeds_m_per_s[:] = np.where(
+            following, self.__walking_speeds_m_per_s, 0)
+        self.headings_deg[following] = np.degrees(np.arctan2(
+            -offsets_m[following, 0], offsets_m[following, 1])) % 360
+
+
+class Agents:
+    """Wandering of the agents' arrays, without the rendering.
+
+    Steps either all the agents in the main process or a slice of them
+    in a worker process.
+    """
+
+    MIN_TURN_INTERVAL_S = 2.0
+    MAX_TURN_INTERVAL_S = 6.0
+    TURN_SPREAD_DEG = 60.0
+
+    def __init__(self, arrays: dict, height_map: HeightMap,
+                 walk_cycles_per_m: float, random: np.random.Generator,
+                 half_width_m: float, half_height_m: float,
+                 movable_area: MovableArea = None):
+        """Wrap the arrays.
+
+        Parameters:
+        arrays -- agents' arrays described by the agent_array_specs.
+        height_map -- terrain heights, None leaves the Z to the caller.
+        walk_cycles_per_m -- walk animation cycles per walked meter.
+        random -- generator of the wandering.
+        half_width_m -- half of the movable area's X size.
+        half_height_m -- half of the movable area's Y size.
+        movable_area -- polygons replacing the rectangle if set.
+        """
+
+        self.__positions_m = arrays["positions_m"]
+        self.__previous_positions_m = arrays["previous_positions_m"]
+        self.__headings_deg = arrays["headings_deg"]
+        self.__speeds_m_per_s = arrays["speeds_m_per_s"]
+        self.__anim_phases = arrays["anim_phases"]
+        self.__turn_timers_s = arrays["turn_timers_s"]
+
+        self.__height_map = height_map
+        self.__walk_cycles_per_m = walk_cycles_per_m
+        self.__random = random
+        self.__half_width_m = half_width_m
+        self.__half_height_m = half_height_m
+        self.__movable_area = movable_area
+
+    def step(self, dt_s: float):
+        """Move the agents.
+
+        Parameters:
+        dt_s -- duration of the simulation step.
+        """
+
+        self.__previous_positions_m[:] = self.__positions_m
+        self.__wander(dt_s)
+
+        headings_rad = np.radians(self.__headings_deg)
+        steps_m = self.__speeds_m_per_s * dt_s
+
+        self.__positions_m[:, 0] -= np.sin(headings_rad) * steps_m
+        self.__positions_m[:, 1] += np.cos(headings_rad) * steps_m
+
+        self.__bounce_off_border()
+
+        if self.__height_map is not None:
+            put_on_ground(self.__positions_m, self.__height_map)
+
+        self.__anim_phases += steps_m * self.__walk_cycles_per_m
+        self.__anim_phases %= 1.0
+
+    def __bounce_off_border(self):
+        """Clamp the agents to the movable area and turn them back."""
+
+        if self.__movable_area is not None:
+            self.__bounce_off_polygons()
+            return
+
+        x_m = self.__positions_m[:, 0]
+        y_m = self.__positions_m[:, 1]
+
+        out_x = np.abs(x_m) > self.__half_width_m
+        out_y = np.abs(y_m) > self.__half_height_m
+
+        np.clip(x_m, -self.__half_width_m, self.__half_width_m, out=x_m)
+        np.clip(y_m, -self.__half_height_m, self.__half_height_m, out=y_m)
+
+        # Mirror the X or Y component of the walking direction.
+        self.__headings_deg[out_x] = -self.__headings_deg[out_x]
+        self.__headings_deg[out_y] = 180 - self.__headings_deg[out_y]
+        self.__headings_deg %= 360
+
+    def __bounce_off_polygons(self):
+        """Move the agents back inside and reflect off the border."""
+
+        moved, normals = self.__movable_area.limit(self.__positions_m)
+
+        if not len(moved):
+            return
+
+        headings_rad = np.radians(self.__headings_deg[moved])
+        directions = np.column_stack([-np.sin(headings_rad),
+                                      np.cos(headings_rad)])
+
+        # Mirrored along the inside-pointing normal, only if walking out.
+        dots = np.minimum((directions * normals).sum(axis=1), 0)
+        directions -= 2 * dots[:, None] * normals
+
+        self.__headings_deg[moved] = np.degrees(np.arctan2(
+            -directions[:, 0], directions[:, 1])) % 360
+
+    def __wander(self, dt_s: float):
+        """Turn the agents whose turn timers have run out.
+
+        Parameters:
+        dt_s -- duration of the simulation step.
+        """
+
+        self.__turn_timers_s -= dt_s
+        turning = np.flatnonzero(self.__turn_timers_s <= 0)
+
+        if not len(turning):
+            return
+
+        self.__headings_deg[turning] += self.__random.normal(
+            0, self.TURN_SPREAD_DEG, len(turning))
+        self.__headings_deg[turning] %= 360
+        self.__turn_timers_s[turning] = self.__random.uniform(
+            self.MIN_TURN_INTERVAL_S, self.MAX_TURN_INTERVAL_S, len(turning))
+
+
+def agent_array_specs(count: int) -> dict:
+    """Return the shapes and types of the agents' arrays.
+
+    Parameters:
+    count -- number of the agents.
+    """
+
+    return {"positions_m": ((count, 3), np.float64),
+            "previous_positions_m": ((count, 3), np.float64),
+            "headings_deg": ((count,), np.float64),
+            "speeds_m_per_s": ((count,), np.float64),
+            "anim_phases": ((count,), np.float64),
+            "turn_timers_s": ((count,), np.float64)}
+
+
+def create_agents(arrays: dict, index: int, height_map: HeightMap,
+                  walk_cycles_per_m: float, seed: int, half_width_m: float,
+                  half_height_m: float,
+                  movable_area: MovableArea = None) -> Agents:
+    """Return the simulation of a worker's slice of the agents.
+
+    Parameters:
+    arrays -- slices of the shared agents' arrays.
+    index -- worker index, every worker wanders differently.
+    height_map -- terrain heights, None leaves the Z to the main process.
+    walk_cycles_per_m -- walk animation cycles per walked meter.
+    seed -- makes the wandering repeatable.
+    half_width_m -- half of the movable area's X size.
+    half_height_m -- half of the movable area's Y size.
+    movable_area -- polygons replacing the rectangle if set.
+    """
+
+    return Agents(arrays, height_map, walk_cycles_per_m,
+                  np.random.default_rng((seed, index)), half_width_m,
+                  half_height_m, movable_area)
+
+
+def put_on_ground(positions_m: np.ndarray, height_map: HeightMap):
+    """Set the Z of the positions to the terrain height, if it is known.
+
+    Parameters:
+    positions_m -- (count, 3) array changed in place.
+    height_map -- terrain heights.
+    """
+
+    ground_z = height_map.heights_at(positions_m[:, 0], positions_m[:, 1])
+    known = ~np.isnan(ground_z)
+    positions_m[known, 2] = ground_z[known]
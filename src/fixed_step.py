@@ -0,0 +1,160 @@
+"""Simulation at a constant rate, independent of the frame rate."""
+
+import sys
+
+try:
+    from panda3d.core import NodePath
+except ModuleNotFoundError:
+    sys.stderr.write("Panda3d not found.\n")
+    exit()
+
+
+class FixedStep:
+    """Accumulates the frame time and runs whole simulation steps.
+
+    Every step has the same duration, so the simulation behaves the
+    same at any frame rate and a slow display never pays for more steps
+    than a fast one. Transforms of the registered nodes are rendered
+    interpolated between the last two steps.
+    """
+
+    EPSILON = 1e-6  # Fraction of a step treated as a rounding error.
+
+    def __init__(self, rate_hz: float = 60.0, max_steps_per_frame: int = 4):
+        """Start with an empty accumulator.
+
+        Parameters:
+        rate_hz -- simulation steps per second.
+        max_steps_per_frame -- steps run after a long frame at most,
+                               the rest of the time is dropped.
+        """
+
+        self.step_s = 1 / rate_hz
+        self.alpha = 0.0  # Position between the last two steps.
+        self.steps = 0
+        self.dropped_steps = 0
+
+        self.__max_steps_per_frame = max_steps_per_frame
+        self.__accumulated_steps = 0.0
+        self.__interpolated = []
+
+    def add_interpolated(self, node_path: NodePath):
+        """Render the node's position and heading interpolated.
+
+        Parameters:
+        node_path -- node moved by the simulation steps.
+        """
+
+        self.__interpolated.append(InterpolatedTransform(node_path))
+
+    def set_rate(self, rate_hz: float):
+        """Change the step duration, keeping the accumulated time.
+
+        Parameters:
+        rate_hz -- simulation steps per second.
+        """
+
+        step_s = 1 / rate_hz
+        self.__accumulated_steps *= self.step_s / step_s
+        self.step_s = step_s
+
+    def reset_interpolated(self):
+        """Take the current transforms as both the last steps, e.g. after
+        the nodes have been moved outside of the steps.
+        """
+
+        for transform in self.__interpolated:
+            transform.reset()
+
+    def run(self, stages: tuple, dt_s: float):
+        """Run as many steps as the frame time has accumulated.
+
+        Parameters:
+        stages -- (name, callable) pairs of one simulation step.
+        dt_s -- duration of the frame.
+        """
+
+        self.__accumulated_steps += dt_s / self.step_s
+        steps = int(self.__accumulated_steps + self.EPSILON)
+
+        if steps > self.__max_steps_per_frame:
+            self.dropped_steps += steps - self.__max_steps_per_frame
+            self.__accumulated_steps -= steps - self.__max_steps_per_frame
+            steps = self.__max_steps_per_frame
+
+        self.__accumulated_steps = max(self.__accumulated_steps - steps, 0.0)
+        self.alpha = self.__accumulated_steps
+
+        if steps:
+            for transform in self.__interpolated:
+                transform.restore()
+
+            for _ in range(steps):
+                for transform in self.__interpolated:
+                    transform.save_previous()
+
+                for _, stage in stages:
+                    stage()
+
+            for transform in self.__interpolated:
+                transform.save_current()
+            self.steps += steps
+
+        for transform in self.__interpolated:
+            transform.apply(self.alpha)
+
+
+class InterpolatedTransform:
+    """Simulated and rendered transforms of a node."""
+
+    def __init__(self, node_path: NodePath):
+        """Take the current transform as both the last steps.
+
+        Parameters:
+        node_path -- node moved by the simulation steps.
+        """
+
+        self.__node_path = node_path
+        self.reset()
+
+    def apply(self, alpha: float):
+        """Set the rendered transform.
+
+        Parameters:
+        alpha -- 0 at the previous step, 1 at the current one.
+        """
+
+        (previous_pos, previous_h), (current_pos, current_h) = \
+            self.__previous, self.__current
+
+        # The shorter way around.
+        delta_h = (current_h - previous_h + 180) % 360 - 180
+
+        self.__node_path.setPos(previous_pos
+                                + (current_pos - previous_pos) * alpha)
+        self.__node_path.setH(previous_h + delta_h * alpha)
+
+    def reset(self):
+        """Take the current transform as both the last steps."""
+
+        self.__previous = (self.__node_path.getPos(),
+                           self.__node_path.getH())
+        self.__current = self.__previous
+
+    def restore(self):
+        """Set the simulated transform before the next steps."""
+
+        self.__node_path.setPos(self.__current[0])
+        self.__node_path.setH(self.__current[1])
+
+    def save_current(self):
+        """Remember the transform of the last step."""
+
+        self.__current = (self.__node_path.getPos(),
+                          self.__node_path.getH())
+
+    def save_previous(self):
+        """Remember the transform before a step."""
+
+        self.__previous = (self.__node_path.getPos(),
+                           self.__node_path.getH())
@@ -0,0 +1,187 @@
+"""Precomputed terrain heights for constant-time ground queries."""
+
+import math
+import sys
+
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    sys.stderr.write("NumPy not found.\n")
+    exit()
+
+
+class HeightMap:
+    """Regular grid of the terrain heights sampled bilinearly.
+
+    Cells without a surface or with an overhang (more than one
+    surface above each other) hold NaN. Queries that touch such a cell
+    return None, so the caller can fall back to the ray traversal.
+    """
+
+    def __init__(self, heights: np.ndarray, origin_x_m: float,
+                 origin_y_m: float, cell_size_m: float):
+        """Wrap an already computed grid.
+
+        Parameters:
+        heights -- (rows, columns) array, rows go along the Y axis.
+        origin_x_m -- X coordinate of the first column.
+        origin_y_m -- Y coordinate of the first row.
+        cell_size_m -- distance between neighbouring samples.
+        """
+
+        self.heights = heights
+        self.origin_x_m = origin_x_m
+        self.origin_y_m = origin_y_m
+        self.cell_size_m = cell_size_m
+
+        # Plain lists are faster than the NumPy scalar indexing.
+        self.__rows = heights.tolist()
+        self.__max_col = heights.shape[1] - 1
+        self.__max_row = heights.shape[0] - 1
+
+    @classmethod
+    def from_triangles(cls, triangles: np.ndarray, cell_size_m: float = 0.5,
+                       overhang_tolerance_m: float = 0.25):
+        """Rasterize the terrain triangles once.
+
+        Parameters:
+        triangles -- (count, 3, 3) array of points.
+        cell_size_m -- distance between neighbouring samples.
+        overhang_tolerance_m -- max. height difference between surfaces
+                                above the same sample that still is
+                                considered as a single ground.
+        """
+
+        epsilon = 1e-9
+
+        points = triangles.reshape(-1, 3)
+        origin_x_m, origin_y_m = points[:, 0].min(), points[:, 1].min()
+
+        cols = int(math.ceil((points[:, 0].max() - origin_x_m)
+                             / cell_size_m)) + 1
+        rows = int(math.ceil((points[:, 1].max() - origin_y_m)
+                             / cell_size_m)) + 1
+
+        top = np.full(rows * cols, -np.inf)
+        bottom = np.full(rows * cols, np.inf)
+
+        x0, y0, z0 = (triangles[:, 0, axis] for axis in range(3))
+        x1, y1, z1 = (triangles[:, 1, axis] for axis in range(3))
+        x2, y2, z2 = (triangles[:, 2, axis] for axis in range(3))
+        det = (y1 - y2) * (x0 - x2) + (x2 - x1) * (y0 - y2)
+
+        # Samples covered by the triangles' bounding boxes.
+        min_col = np.maximum(np.ceil((np.minimum(np.minimum(x0, x1), x2)
+                                      - origin_x_m) / cell_size_m), 0)
+        max_col = np.minimum(np.floor((np.maximum(np.maximum(x0, x1), x2)
+                                       - origin_x_m) / cell_size_m), cols - 1)
+        min_row = np.maximum(np.ceil((np.minimum(np.minimum(y0, y1), y2)
+                                      - origin_y_m) / cell_size_m), 0)
+        max_row = np.minimum(np.floor((np.maximum(np.maximum(y0, y1), y2)
+                                       - origin_y_m) / cell_size_m), rows - 1)
+
+        spans = np.stack([max_col - min_col + 1, max_row - min_row + 1],
+                         axis=1).astype(np.int64)
+
+        # Skip vertical walls, degenerated and too small triangles.
+        valid = (np.abs(det) > epsilon) & (spans > 0).all(axis=1)
+
+        # Rasterize at once all triangles with the same bounding box size.
+        for span_cols, span_rows in np.unique(spans[valid], axis=0):
+            group = valid & (spans[:, 0] == span_cols) \
+                & (spans[:, 1] == span_rows)
+
+            sample_cols = min_col[group, None, None].astype(np.int64) \
+                + np.arange(span_cols)[None, None, :]
+            sample_rows = min_row[group, None, None].astype(np.int64) \
+                + np.arange(span_rows)[None, :, None]
+
+            grid_x = origin_x_m + sample_cols * cell_size_m
+            grid_y = origin_y_m + sample_rows * cell_size_m
+
+            g_x0, g_y0, g_z0, g_x1, g_y1, g_z1, g_x2, g_y2, g_z2, g_det = (
+                coord[group, None, None] for coord
+                in (x0, y0, z0, x1, y1, z1, x2, y2, z2, det))
+
+            # Barycentric coordinates of the samples.
+            weight_0 = ((g_y1 - g_y2) * (grid_x - g_x2)
+                        + (g_x2 - g_x1) * (grid_y - g_y2)) / g_det
+            weight_1 = ((g_y2 - g_y0) * (grid_x - g_x2)
+                        + (g_x0 - g_x2) * (grid_y - g_y2)) / g_det
+            weight_2 = 1 - weight_0 - weight_1
+
+            inside = (weight_0 >= -epsilon) & (weight_1 >= -epsilon) \
+                & (weight_2 >= -epsilon)
+            z = (weight_0 * g_z0 + weight_1 * g_z1 + weight_2 * g_z2)[inside]
+            sample_idx = (sample_rows * cols + sample_cols)[inside]
+
+            np.maximum.at(top, sample_idx, z)
+            np.minimum.at(bottom, sample_idx, z)
+
+        top = top.reshape(rows, cols)
+        bottom = bottom.reshape(rows, cols)
+
+        heights = top
+        heights[~np.isfinite(top)] = np.nan
+        heights[top - bottom > overhang_tolerance_m] = np.nan
+
+        return cls(heights, float(origin_x_m), float(origin_y_m), cell_size_m)
+
+    def height_at(self, x_m: float, y_m: float):
+        """Return the ground Z under a point or None if unknown.
+
+        Parameters:
+        x_m -- X coordinate in the terrain space.
+        y_m -- Y coordinate in the terrain space.
+        """
+
+        col_f = (x_m - self.origin_x_m) / self.cell_size_m
+        row_f = (y_m - self.origin_y_m) / self.cell_size_m
+
+        if not (0 <= col_f <= self.__max_col and 0 <= row_f <= self.__max_row):
+            return None
+
+        col = min(int(col_f), self.__max_col - 1)
+        row = min(int(row_f), self.__max_row - 1)
+        ratio_x = col_f - col
+        ratio_y = row_f - row
+
+        lower_row = self.__rows[row]
+        upper_row = self.__rows[row + 1]
+
+        z = (lower_row[col] * (1 - ratio_x) + lower_row[col + 1] * ratio_x) \
+            * (1 - ratio_y) \
+            + (upper_row[col] * (1 - ratio_x) + upper_row[col + 1] * ratio_x) \
+            * ratio_y
+
+        if z != z:  # NaN, at least one corner is unknown.
+            return None
+        return z
+
+    def heights_at(self, x_m: np.ndarray, y_m: np.ndarray) -> np.ndarray:
+        """Return the ground Z under many points at once, NaN if unknown.
+
+        Parameters:
+        x_m -- X coordinates in the terrain space.
+        y_m -- Y coordinates in the terrain space, the same shape.
+        """
+
+        col_f = (np.asarray(x_m) - self.origin_x_m) / self.cell_size_m
+        row_f = (np.asarray(y_m) - self.origin_y_m) / self.cell_size_m
+
+        outside = (col_f < 0) | (col_f > self.__max_col) \
+            | (row_f < 0) | (row_f > self.__max_row)
+
+        col = np.clip(col_f.astype(np.int64), 0, self.__max_col - 1)
+        row = np.clip(row_f.astype(np.int64), 0, self.__max_row - 1)
+        ratio_x = col_f - col
+        ratio_y = row_f - row
+
+        heights = self.heights
+        z = (heights[row, col] * (1 - ratio_x)
+             + heights[row, col + 1] * ratio_x) * (1 - ratio_y) \
+            + (heights[row + 1, col] * (1 - ratio_x)
+               + heights[row + 1, col + 1] * ratio_x) * ratio_y
+
+        z[outside] = np.nan
+        return z
@@ -0,0 +1,167 @@
+"""Recording of the per-frame input and its streaming replay."""
+
+import os
+import struct
+
+from background_writer import BackgroundWriter
+
+
+MAGIC = b"TPPI"
+VERSION = 1
+
+HEADER = struct.Struct("<4sBB")  # Magic, version, keys count.
+KEY_NAME_LENGTH = struct.Struct("<B")
+
+# Frame time, pressed keys bitmask, mouse X and Y.
+RECORD = struct.Struct("<dHdd")
+
+
+class Recorder:
+    """Appends the input of every frame to a compact binary file."""
+
+    def __init__(self, path: str, key_names: list):
+        """Open the file for appending and write its header if new.
+
+        Parameters:
+        path -- recording file.
+        key_names -- keys in the bitmask order, e.g. the controls.KEYS.
+        """
+
+        self.__key_names = list(key_names)
+        is_new = not os.path.isfile(path) or os.path.getsize(path) == 0
+
+        if not is_new:
+            with open(path, "rb") as existing:
+                if read_header(existing) != self.__key_names:
+                    raise OSError("Recording with different keys: " + path)
+
+        self.__writer = BackgroundWriter(path)
+
+        if is_new:
+            self.__writer.write(pack_header(self.__key_names))
+
+    def __call__(self, key_mask: int, mouse_pos: dict, dt_s: float):
+        """Queue the frame's input.
+
+        Parameters:
+        key_mask -- controls' pressed keys.
+        mouse_pos -- controls' mouse position.
+        dt_s -- duration of the frame.
+        """
+
+        self.__writer.write(RECORD.pack(dt_s, key_mask, mouse_pos['x'],
+                                        mouse_pos['y']))
+
+    def close(self) -> int:
+        """Flush the file and return the number of the lost frames."""
+
+        self.__writer.close()
+        return self.__writer.dropped
+
+
+class Replay:
+    """Input source that streams a recording instead of the live input.
+
+    Records are read one by one from a buffered file, so a recording
+    of any length costs the same memory.
+    """
+
+    def __init__(self, path: str, key_names: list, on_finished=None):
+        """Open the recording and read ahead the first frame.
+
+        Parameters:
+        path -- recording file.
+        key_names -- keys in the returned bitmask order, recordings
+                     with other orders are remapped.
+        on_finished -- called once on the first frame after the
+                       recorded ones.
+        """
+
+        self.finished = False
+        self.next_dt_s = 0.0
+
+        self.__file = open(path, "rb")
+        recorded_key_names = read_header(self.__file)
+        self.__remapped_bits = None
+
+        if recorded_key_names != list(key_names):
+            self.__remapped_bits = [
+                (1 << recorded_bit, 1 << list(key_names).index(key))
+                for recorded_bit, key in enumerate(recorded_key_names)
+                if key in key_names]
+        self.__on_finished = on_finished
+        self.__next_record = None
+        self.__read_ahead()
+
+    def __call__(self, mouse_pos: dict) -> int:
+        """Apply the next recorded frame and return its pressed keys.
+
+        Parameters:
+        mouse_pos -- controls' mouse position to fill.
+        """
+
+        if self.__next_record is None:
+            if self.__on_finished is not None:
+                on_finished, self.__on_finished = self.__on_finished, None
+                on_finished()
+            return 0  # All released.
+
+        _, key_mask, mouse_pos['x'], mouse_pos['y'] = self.__next_record
+        self.__read_ahead()
+
+        if self.__remapped_bits is None:
+            return key_mask
+
+        return sum(bit for recorded_bit, bit in self.__remapped_bits
+                   if key_mask & recorded_bit)
+
+    def __read_ahead(self):
+        """Read the next frame, so its dt is known before it starts."""
+
+        chunk = self.__file.read(RECORD.size)
+
+        if len(chunk) < RECORD.size:  # End or a truncated last frame.
+            self.__next_record = None
+            self.finished = True
+            self.__file.close()
+            return
+
+        self.__next_record = RECORD.unpack(chunk)
+        self.next_dt_s = self.__next_record[0]
+
+
+def pack_header(key_names: list) -> bytes:
+    """Return the file header.
+
+    Parameters:
+    key_names -- keys in the bitmask order.
+    """
+
+    header = HEADER.pack(MAGIC, VERSION, len(key_names))
+
+    for key in key_names:
+        name = key.encode("ascii")
+        header += KEY_NAME_LENGTH.pack(len(name)) + name
+
+    return header
+
+
+def read_header(recording) -> list:
+    """Return the key names stored in the header.
+
+    Parameters:
+    recording -- file opened in the binary mode at its beginning.
+    """
+
+    magic, version, keys_count = HEADER.unpack(recording.read(HEADER.size))
+
+    if magic != MAGIC or version != VERSION:
+        raise OSError("Not an input recording.")
+
+    key_names = []
+
+    for _ in range(keys_count):
+        length, = KEY_NAME_LENGTH.unpack(recording.read(KEY_NAME_LENGTH.size))
+        key_names.append(recording.read(length).decode("ascii"))
+
+    return key_names
@@ -11,6 +11,9 @@ except ModuleNotFoundError:
 
 MOVABLE_AREA_METERS = {"width": 200, "height": 180}
 
+# Polygonal movable_area.MovableArea replacing the rectangle if set.
+movable_area = None
+
 
 def limit_actor_movable_area(actor: Actor) -> None:
     """Reset a position if exceeded.
@@ -19,25 +22,43 @@ def limit_actor_movable_area(actor: Actor) -> None:
     actor -- model that is somewhere.
     """
 
-    global MOVABLE_AREA_METERS
+    pos = actor.getPos()
 
-    pos_x = actor.getX()
-    pos_y = actor.getY()
+    if movable_area is not None:
+        limited_x, limited_y = movable_area.limit_point(pos.getX(),
+                                                        pos.getY())
+    else:
+        max_x = MOVABLE_AREA_METERS["width"] / 2
+        max_y = MOVABLE_AREA_METERS["height"] / 2
 
-    max_x = MOVABLE_AREA_METERS["width"] / 2
-    min_x = -max_x
+        limited_x = min(max(pos.getX(), -max_x), max_x)
+        limited_y = min(max(pos.getY(), -max_y), max_y)
 
-    max_y = MOVABLE_AREA_METERS["height"] / 2
-    min_y = -max_y
+    # Set once and only if exceeded.
+    if limited_x != pos.getX() or limited_y != pos.getY():
+        actor.setPos(limited_x, limited_y, pos.getZ())
+
+
+def limit_positions_to_movable_area(positions_m):
+    """Return many positions limited at once, e.g. a crowd's ones.
+
+    Parameters:
+    positions_m -- NumPy (count, 2 or 3) array of the X, Y and
+                   optionally Z coordinates, the Z is kept.
+    """
+
+    import numpy as np  # Not needed before the first batch.
 
-    if pos_x < min_x:
-        actor.setX(min_x)
+    limited_m = np.array(positions_m, dtype=np.float64)
 
-    elif pos_x > max_x:
-        actor.setX(max_x)
+    if movable_area is not None:
+        movable_area.limit(limited_m)
+        return limited_m
+
+    max_x = MOVABLE_AREA_METERS["width"] / 2
+    max_y = MOVABLE_AREA_METERS["height"] / 2
 
-    if pos_y < min_y:
-        actor.setY(min_y)
+    np.clip(limited_m[:, 0], -max_x, max_x, out=limited_m[:, 0])
+    np.clip(limited_m[:, 1], -max_y, max_y, out=limited_m[:, 1])
 
-    elif pos_y > max_y:
-        actor.setY(max_y)
+    return limited_m
@@ -2,68 +2,89 @@
 
 """The main file where everything begins."""
 
+import argparse
 import sys
 
-try:
-    from direct.showbase.ShowBase import ShowBase
-    from direct.task.Task import Task
-except ModuleNotFoundError:
-    sys.stderr.write("Panda3d not found.\n")
-    exit()
-
-
+from application import Application
 import controls
-from physics import Physics
-from tpp_camera import TPPCamera
-from world import World
-
-
-class Application(ShowBase):
-    """Start the app using the Panda3D API."""
-
-    def __init__(self):
-        """Create the window and start the main loop."""
-
-        ShowBase.__init__(self)
-        controls.setup_mouse()
-        self.tpp_camera = TPPCamera()
-
-        try:
-            self.world = World()
-        except OSError:
-            raise
-
-        self.physics = Physics(self.world.player)
-        base.taskMgr.add(self.__main_loop, "__main_loop")
-
-    def __del__(self):
-        """Clean resources."""
-
-        del self.physics
-        del self.world
-        del self.tpp_camera
-
-    def __main_loop(self, task: Task) -> Task:
-        """Refresh between frames.
-
-        Parameters:
-        task -- task form a task manager that is also returned to loop
-                the function.
-        """
-
-        controls.handle_events()
-        self.physics(self.world.player, self.world.terrain)
-
-        self.tpp_camera.fly_over_terrain(self.world.player,
-                                         self.world.terrain)
-        self.world.player.control(self.tpp_camera)
-
-        return Task.cont
+from input_record import Replay
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--record", help="append the input to a file")
+    parser.add_argument("--replay",
+                        help="play a recorded input instead of the live one")
+    parser.add_argument("--profile", action="store_true",
+                        help="time the frame stages, F12 dumps them")
+    parser.add_argument("--frame-budget-ms", type=float, default=0.0,
+                        help="dump the profile when a frame is slower")
+    parser.add_argument("--crowd", type=int, default=0,
+                        help="number of the wandering NPCs")
+    parser.add_argument("--sim-rate", type=float, default=60.0,
+                        help="simulation steps per second")
+    parser.add_argument("--sim-workers", type=int, default=0,
+                        help="processes moving the NPCs")
+    parser.add_argument("--snapshots", action="store_true",
+                        help="keep the world states, F9/F10 step back and "
+                        "forth, F11 resumes, F5 saves them")
+    parser.add_argument("--snapshots-dir", metavar="DIR", default=".",
+                        help="where F5 saves the snapshots")
+    parser.add_argument("--terrain-tiles", metavar="DIR",
+                        help="stream the terrain from a tile set")
+    parser.add_argument("--movable-area", metavar="FILE",
+                        help="walkable polygons instead of the rectangle, "
+                        "e.g. ../assets/movable_area.json")
+    parser.add_argument("--navigation", action="store_true",
+                        help="the NPCs walk to random goals along the found "
+                        "paths")
+    parser.add_argument("--collision-tolerance", type=float, default=0.1,
+                        help="max. height error of the simplified terrain "
+                        "collision mesh in meters")
+    parser.add_argument("--quality-budget-ms", type=float, default=0.0,
+                        help="lower the simulation rate and the details "
+                        "when the frames are slower")
+    parser.add_argument("--quality-log", metavar="FILE",
+                        help="append the quality changes to a file")
+    parser.add_argument("--telemetry", metavar="FILE",
+                        help="append the per-frame metrics to a file, "
+                        "./telemetry.py FILE summarizes them")
+    args = parser.parse_args()
+
     try:
-        Application().run()
+        replay = None
+
+        if args.replay:
+            replay = controls.input_source = Replay(
+                args.replay, controls.KEYS, on_finished=sys.exit)
+        app = Application(record_path=args.record, profile=args.profile,
+                          frame_budget_ms=args.frame_budget_ms,
+                          crowd_size=args.crowd,
+                          sim_rate_hz=args.sim_rate,
+                          tiles_dir=args.terrain_tiles,
+                          sim_workers=args.sim_workers,
+                          snapshots=args.snapshots,
+                          snapshots_dir=args.snapshots_dir,
+                          movable_area_path=args.movable_area,
+                          navigation=args.navigation,
+                          collision_tolerance_m=args.collision_tolerance,
+                          quality_budget_ms=args.quality_budget_ms,
+                          quality_log_path=args.quality_log,
+                          telemetry_path=args.telemetry)
+
+        if replay is not None:
+            def follow_recorded_time(task):
+                """Set the next frame's time to the recorded one."""
+
+                globalClock.setDt(replay.next_dt_s)
+                return task.cont
+
+            # Paced like the recording, the frames' dt is the recorded one
+            # however fast they render.
+            globalClock.setMode(globalClock.MForced)
+            app.taskMgr.add(follow_recorded_time, "follow_recorded_time",
+                            sort=100)
+        app.run()
     except OSError:
         pass
 else:
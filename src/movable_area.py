@@ -0,0 +1,419 @@
+"""Walkable regions bounded by polygons, e.g. around lakes and cliffs.
+
+The polygons are precompiled into a uniform grid of the cells that are
+inside, outside or on an edge. Most of the containment tests are then
+a grid lookup, only a point in an edge cell is tested exactly, against
+the few polygon edges crossing its cell.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import sys
+
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    sys.stderr.write("NumPy not found.\n")
+    exit()
+
+
+OUTSIDE = 0
+INSIDE = 1
+EDGE = 2
+
+
+class MovableArea:
+    """Polygons with holes limiting where the actors can move.
+
+    A point is inside if it is inside an odd number of the rings, so a
+    hole is a ring within a region's outline.
+    """
+
+    INSIDE_OFFSET_M = 0.001  # Of a limited point from the border.
+    INSIDE_CODE = -1  # Of a cell, the edge ones have their slots.
+    OUTSIDE_CODE = -2
+
+    def __init__(self, regions: list, cell_size_m: float = 4.0):
+        """Precompile the regions into the grid.
+
+        Parameters:
+        regions -- dicts with the "outer" list of the (X, Y) vertices
+                   and the optional "holes" list of the vertex lists.
+        cell_size_m -- grid cell size.
+        """
+
+        rings = []
+
+        for region in regions:
+            rings.append(region["outer"])
+            rings.extend(region.get("holes", ()))
+
+        segments = []
+
+        for ring in rings:
+            vertices = np.asarray(ring, dtype=np.float64)
+            segments.append(np.hstack([vertices,
+                                       np.roll(vertices, -1, axis=0)]))
+
+        # Rows of the start X, Y and end X, Y.
+        self.segments_m = np.vstack(segments)
+        self.cell_size_m = cell_size_m
+        self.min_x_m, self.min_y_m = self.segments_m[:, :2].min(axis=0)
+        self.max_x_m, self.max_y_m = self.segments_m[:, :2].max(axis=0)
+
+        self.edge_cells_count = 0
+        self.__columns = max(math.ceil(
+            (self.max_x_m - self.min_x_m) / cell_size_m), 1)
+        self.__rows = max(math.ceil(
+            (self.max_y_m - self.min_y_m) / cell_size_m), 1)
+
+        self.__compile()
+
+    @classmethod
+    def load(cls, path: str) -> MovableArea:
+        """Read the regions from a JSON file.
+
+        The file holds the "regions" list of the __init__ and optionally
+        the "cell_size_m".
+
+        Parameters:
+        path -- regions file.
+        """
+
+        with open(path) as area_file:
+            data = json.load(area_file)
+
+        return cls(data["regions"], data.get("cell_size_m", 4.0))
+
+    def contains(self, points_m: np.ndarray) -> np.ndarray:
+        """Return which points are inside the area.
+
+        Parameters:
+        points_m -- (count, 2 or more) array of the X and Y.
+        """
+
+        points_m = np.asarray(points_m, dtype=np.float64)
+
+        # The points off the grid fall to its outside border cells.
+        columns = np.clip(np.floor(
+            (points_m[:, 0] - self.min_x_m) / self.cell_size_m) + 1, 0,
+            self.__columns + 1).astype(np.int64)
+        rows = np.clip(np.floor(
+            (points_m[:, 1] - self.min_y_m) / self.cell_size_m) + 1, 0,
+            self.__rows + 1)
+
+        codes = self.__cell_codes[(rows * (self.__columns + 2)).astype(
+            np.int64) + columns]
+        inside = codes == self.INSIDE_CODE
+
+        on_edge = np.flatnonzero(codes >= 0)
+
+        if len(on_edge):
+            inside[on_edge] = self.__contains_exactly(points_m[on_edge],
+                                                      codes[on_edge])
+
+        return inside
+
+    def contains_by_rays(self, points_m: np.ndarray) -> np.ndarray:
+        """Test the points against all the edges, by the ray crossings.
+
+        Slow, compiles the grid and checks its tests.
+
+        Parameters:
+        points_m -- (count, 2) array of the X and Y.
+        """
+
+        x0, y0, x1, y1 = (self.segments_m[:, column] for column in range(4))
+        inside = np.zeros(len(points_m), dtype=bool)
+        chunk = max((1 << 20) // len(self.segments_m), 1)
+
+        for start in range(0, len(points_m), chunk):
+            x = points_m[start:start + chunk, 0, None]
+            y = points_m[start:start + chunk, 1, None]
+
+            # Edges crossing the horizontal line, half-open at a vertex.
+            straddling = (y0 > y) != (y1 > y)
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                crossing_x = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+
+            crossings = straddling & (crossing_x > x)
+            inside[start:start + chunk] = crossings.sum(axis=1) % 2 == 1
+
+        return inside
+
+    def contains_point(self, x_m: float, y_m: float) -> bool:
+        """Return whether a point is inside, mostly without NumPy.
+
+        Parameters:
+        x_m -- X coordinate of the point.
+        y_m -- Y coordinate of the point.
+        """
+
+        column = math.floor((x_m - self.min_x_m) / self.cell_size_m)
+        row = math.floor((y_m - self.min_y_m) / self.cell_size_m)
+
+        if not (0 <= column < self.__columns and 0 <= row < self.__rows):
+            return False
+
+        state = self.__state_bytes[row * self.__columns + column]
+
+        if state != EDGE:
+            return state == INSIDE
+
+        return bool(self.contains(np.array([[x_m, y_m]]))[0])
+
+    def limit(self, positions_m: np.ndarray) -> tuple:
+        """Move the outside positions to the nearest border point.
+
+        The X and Y are changed in place, just inside the border.
+
+        Parameters:
+        positions_m -- (count, 2 or more) float array.
+
+        Return the indices of the moved positions and the (count, 2)
+        unit vectors pointing inside from their old to their new places.
+        """
+
+        moved = np.flatnonzero(~self.contains(positions_m))
+
+        if not len(moved):
+            return moved, np.zeros((0, 2))
+
+        points_m = positions_m[moved, :2]
+        nearest_m, normals = self.__nearest_border_points(points_m)
+
+        limited_m = nearest_m + normals * self.INSIDE_OFFSET_M
+
+        # A point on the border itself has no direction to the inside, its
+        # edge's normal was tried, the other side is.
+        outside = np.flatnonzero(~self.contains(limited_m))
+        normals[outside] = -normals[outside]
+        limited_m[outside] = nearest_m[outside] \
+            + normals[outside] * self.INSIDE_OFFSET_M
+
+        positions_m[moved, :2] = limited_m
+
+        return moved, normals
+
+    def limit_point(self, x_m: float, y_m: float) -> tuple:
+        """Return a point moved inside, if it is outside.
+
+        Parameters:
+        x_m -- X coordinate of the point.
+        y_m -- Y coordinate of the point.
+        """
+
+        if self.contains_point(x_m, y_m):
+            return x_m, y_m
+
+        position_m = np.array([[x_m, y_m]], dtype=np.float64)
+        self.limit(position_m)
+
+        return tuple(position_m[0].tolist())
+
+    def random_points(self, count: int,
+                      random: np.random.Generator) -> np.ndarray:
+        """Return uniformly scattered points inside the area.
+
+        Parameters:
+        count -- number of the points.
+        random -- generator of the points.
+        """
+
+        points_m = np.zeros((0, 2))
+
+        while len(points_m) < count:
+            candidates_m = np.column_stack([
+                random.uniform(self.min_x_m, self.max_x_m, count),
+                random.uniform(self.min_y_m, self.max_y_m, count)])
+            points_m = np.vstack([points_m,
+                                  candidates_m[self.contains(candidates_m)]])
+
+        return points_m[:count]
+
+    def __compile(self):
+        """Sort the cells into the inside, outside and edge ones.
+
+        An edge cell keeps the edges crossing it and a reference point
+        known to be inside or outside, the exact test counts the edges
+        crossed on the way from a point to the reference one.
+        """
+
+        cell_segments = {}  # Row, column: crossing segments.
+
+        for index, (x0, y0, x1, y1) in enumerate(self.segments_m.tolist()):
+            for row, column in self.__cells_crossed(x0, y0, x1, y1):
+                cell_segments.setdefault((row, column), []).append(index)
+
+        rows, columns = np.mgrid[:self.__rows, :self.__columns]
+        centers_m = np.column_stack([
+            self.min_x_m + (columns.ravel() + 0.5) * self.cell_size_m,
+            self.min_y_m + (rows.ravel() + 0.5) * self.cell_size_m])
+
+        self.__states = np.where(
+            self.contains_by_rays(centers_m), INSIDE, OUTSIDE).astype(
+                np.int8).reshape(self.__rows, self.__columns)
+
+        width = max((len(segments) for segments in cell_segments.values()),
+                    default=1)
+        slot_segments = np.full((len(cell_segments), width), -1)
+        references_m = np.zeros((len(cell_segments), 2))
+
+        for slot, ((row, column), segments) in enumerate(
+                cell_segments.items()):
+            self.__states[row, column] = EDGE
+            slot_segments[slot, :len(segments)] = segments
+            references_m[slot] = self.__reference_point(row, column,
+                                                        segments)
+
+        self.__slot_segments = slot_segments
+        self.__references_m = references_m
+        self.__references_inside = self.contains_by_rays(references_m)
+        self.__state_bytes = self.__states.tobytes()
+
+        # Edge slot or the inside or outside code, with a border of the
+        # outside cells.
+        codes = np.full((self.__rows + 2, self.__columns + 2),
+                        self.OUTSIDE_CODE, dtype=np.int32)
+        codes[1:-1, 1:-1][self.__states == INSIDE] = self.INSIDE_CODE
+
+        for slot, (row, column) in enumerate(cell_segments):
+            codes[row + 1, column + 1] = slot
+        self.__cell_codes = codes.ravel()
+        self.edge_cells_count = len(cell_segments)
+
+    def __cells_crossed(self, x0: float, y0: float, x1: float,
+                        y1: float) -> list:
+        """Return the rows and columns of the cells a segment touches.
+
+        Parameters:
+        x0 -- X of the segment start.
+        y0 -- Y of the segment start.
+        x1 -- X of the segment end.
+        y1 -- Y of the segment end.
+        """
+
+        size_m = self.cell_size_m
+        first_column = max(math.floor((min(x0, x1) - self.min_x_m) / size_m),
+                           0)
+        last_column = min(math.floor((max(x0, x1) - self.min_x_m) / size_m),
+                          self.__columns - 1)
+        first_row = max(math.floor((min(y0, y1) - self.min_y_m) / size_m), 0)
+        last_row = min(math.floor((max(y0, y1) - self.min_y_m) / size_m),
+                       self.__rows - 1)
+
+        crossed = []
+
+        for row in range(first_row, last_row + 1):
+            for column in range(first_column, last_column + 1):
+                corner_x = self.min_x_m + column * size_m
+                corner_y = self.min_y_m + row * size_m
+                sides = [(x1 - x0) * (y - y0) - (y1 - y0) * (x - x0)
+                         for x in (corner_x, corner_x + size_m)
+                         for y in (corner_y, corner_y + size_m)]
+
+                # Within the segment's bounds, it touches the cell unless
+                # all the corners are on one side of its line.
+                if min(sides) <= 0 <= max(sides):
+                    crossed.append((row, column))
+
+        return crossed
+
+    def __contains_exactly(self, points_m: np.ndarray,
+                           slots: np.ndarray) -> np.ndarray:
+        """Test the points in the edge cells against the cells' edges.
+
+        Parameters:
+        points_m -- (count, 2 or more) array of the X and Y.
+        slots -- edge cell of every point.
+        """
+
+        segments = self.__slot_segments[slots]
+        valid = segments >= 0
+        x0, y0, x1, y1 = np.moveaxis(self.segments_m[segments], 2, 0)
+
+        px = points_m[:, 0, None]
+        py = points_m[:, 1, None]
+        rx = self.__references_m[slots, 0, None]
+        ry = self.__references_m[slots, 1, None]
+
+        # The edge's ends on the different sides of the point-reference
+        # line, half-open so a vertex on the line is counted once.
+        side0 = (rx - px) * (y0 - py) - (ry - py) * (x0 - px) > 0
+        side1 = (rx - px) * (y1 - py) - (ry - py) * (x1 - px) > 0
+
+        # The point and the reference on the different sides of the edge.
+        edge0 = (x1 - x0) * (py - y0) - (y1 - y0) * (px - x0)
+        edge1 = (x1 - x0) * (ry - y0) - (y1 - y0) * (rx - x0)
+
+        crossings = valid & (side0 != side1) & (
+            (edge0 > 0) != (edge1 > 0))
+        odd = crossings.sum(axis=1) % 2 == 1
+
+        return self.__references_inside[slots] != odd
+
+    def __nearest_border_points(self, points_m: np.ndarray) -> tuple:
+        """Return the nearest points on the edges and the unit vectors
+        to them.
+
+        The vector of a point on an edge is the edge's normal.
+
+        Parameters:
+        points_m -- (count, 2) array of the X and Y.
+        """
+
+        starts_m = self.segments_m[:, :2]
+        edges_m = self.segments_m[:, 2:] - starts_m
+        lengths_m2 = np.maximum((edges_m ** 2).sum(axis=1), 1e-12)
+
+        nearest_m = np.empty_like(points_m)
+        nearest_edges = np.empty(len(points_m), dtype=np.int64)
+        chunk = max((1 << 18) // len(self.segments_m), 1)
+
+        for start in range(0, len(points_m), chunk):
+            offsets_m = points_m[start:start + chunk, None] - starts_m
+            ratios = np.clip((offsets_m * edges_m).sum(axis=2) / lengths_m2,
+                             0, 1)
+            projections_m = starts_m + ratios[..., None] * edges_m
+            distances_m2 = ((points_m[start:start + chunk, None]
+                             - projections_m) ** 2).sum(axis=2)
+
+            nearest = distances_m2.argmin(axis=1)
+            nearest_edges[start:start + chunk] = nearest
+            nearest_m[start:start + chunk] = projections_m[
+                np.arange(len(nearest)), nearest]
+
+        normals = nearest_m - points_m
+        on_edge = np.flatnonzero(~normals.any(axis=1))
+        normals[on_edge, 0] = -edges_m[nearest_edges[on_edge], 1]
+        normals[on_edge, 1] = edges_m[nearest_edges[on_edge], 0]
+        normals /= np.linalg.norm(normals, axis=1)[:, None]
+
+        return nearest_m, normals
+
+    def __reference_point(self, row: int, column: int,
+                          segments: list) -> tuple:
+        """Return a point in a cell that is off its edges.
+
+        Parameters:
+        row -- cell row.
+        column -- cell column.
+        segments -- edges crossing the cell.
+        """
+
+        # Tried from the center, off the grid-aligned edges.
+        for fraction_x, fraction_y in ((0.5, 0.5), (0.31, 0.67),
+                                       (0.73, 0.29), (0.17, 0.13),
+                                       (0.89, 0.83)):
+            x = self.min_x_m + (column + fraction_x) * self.cell_size_m
+            y = self.min_y_m + (row + fraction_y) * self.cell_size_m
+
+            if all(abs((x1 - x0) * (y - y0) - (y1 - y0) * (x - x0))
+                   > 1e-9 * self.cell_size_m * math.hypot(x1 - x0, y1 - y0)
+                   for x0, y0, x1, y1 in self.segments_m[segments].tolist()):
+                return x, y
+
+        return x, y
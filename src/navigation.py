@@ -0,0 +1,522 @@
+"""Paths over the terrain found by A* on a baked navigation grid.
+
+The grid is baked once from the terrain heights, its slopes and the
+movable area. Blocking regions can be added and removed at run time,
+only the cached paths crossing them are planned again. The searches
+are queued and run within a time budget per tick, so many agents can
+ask for a path at once without stalling the frame.
+"""
+
+from __future__ import annotations
+
+import collections
+import heapq
+import math
+import sys
+import time
+
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    sys.stderr.write("NumPy not found.\n")
+    exit()
+
+
+from height_map import HeightMap
+import invisible_border
+from movable_area import MovableArea
+
+
+class NavigationGrid:
+    """Walkable cells of the terrain, with 8 neighbours each.
+
+    The cells are stored flat, with a border of the blocked cells, so a
+    neighbour is an index offset without the bounds checks.
+    """
+
+    CELLS_PER_STEP = 64  # Expanded between the pauses of a search.
+
+    def __init__(self, height_map: HeightMap, cell_size_m: float = 2.0,
+                 max_slope_deg: float = 35.0,
+                 movable_area: MovableArea = None):
+        """Bake the walkable cells.
+
+        A cell is walkable if its ground is known, not steeper than the
+        limit and within the movable area.
+
+        Parameters:
+        height_map -- heights of the whole movable area.
+        cell_size_m -- grid cell size.
+        max_slope_deg -- steepest walkable ground.
+        movable_area -- polygons replacing the rectangular movable area.
+        """
+
+        if movable_area is None:
+            area_m = invisible_border.MOVABLE_AREA_METERS
+            min_x_m, min_y_m = -area_m["width"] / 2, -area_m["height"] / 2
+            max_x_m, max_y_m = -min_x_m, -min_y_m
+        else:
+            min_x_m, min_y_m = movable_area.min_x_m, movable_area.min_y_m
+            max_x_m, max_y_m = movable_area.max_x_m, movable_area.max_y_m
+
+        self.cell_size_m = cell_size_m
+        self.origin_x_m = min_x_m
+        self.origin_y_m = min_y_m
+        self.columns = max(math.ceil((max_x_m - min_x_m) / cell_size_m), 1)
+        self.rows = max(math.ceil((max_y_m - min_y_m) / cell_size_m), 1)
+
+        # Cell centers, with the border.
+        x_m = min_x_m + (np.arange(-1, self.columns + 1) + 0.5) * cell_size_m
+        y_m = min_y_m + (np.arange(-1, self.rows + 1) + 0.5) * cell_size_m
+        grid_x_m, grid_y_m = np.meshgrid(x_m, y_m)
+        heights = height_map.heights_at(grid_x_m, grid_y_m)
+
+        slopes_y, slopes_x = np.gradient(heights, cell_size_m)
+        slopes_deg = np.degrees(np.arctan(np.hypot(slopes_x, slopes_y)))
+
+        walkable = ~np.isnan(heights) & (slopes_deg <= max_slope_deg)
+        centers_m = np.column_stack([grid_x_m.ravel(), grid_y_m.ravel()])
+
+        if movable_area is None:
+            walkable &= ((np.abs(grid_x_m) <= max_x_m)
+                         & (np.abs(grid_y_m) <= max_y_m))
+        else:
+            walkable &= movable_area.contains(centers_m).reshape(
+                walkable.shape)
+
+        walkable[[0, -1], :] = False
+        walkable[:, [0, -1]] = False
+
+        self.heights = np.nan_to_num(heights).ravel()
+        self.walkable = walkable.ravel()
+        self.blocked = np.zeros(len(self.walkable), dtype=np.int32)
+        self.walkable_count = int(self.walkable.sum())
+        self.expanded_count = 0  # Cells expanded by the last search.
+
+        self.__centers_m = centers_m
+        self.__regions = {}  # Blocking region name: its cells.
+
+        # Plain lists are faster than the NumPy scalar indexing.
+        self.__open = self.walkable.tolist()
+        self.__heights = self.heights.tolist()
+
+        # Offset, step length and the offsets of the cells beside a
+        # diagonal step, both have to be free.
+        stride = self.columns + 2
+        self.__neighbours = []
+
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                if dx and dy:
+                    self.__neighbours.append((stride * dy + dx,
+                                              math.sqrt(2) * cell_size_m,
+                                              stride * dy, dx))
+                elif dx or dy:
+                    self.__neighbours.append((stride * dy + dx, cell_size_m,
+                                              None, None))
+
+    def block(self, name: str, polygon_m: list) -> np.ndarray:
+        """Close the cells within a polygon, e.g. a fallen tree.
+
+        Parameters:
+        name -- region name for the unblock().
+        polygon_m -- (X, Y) vertices.
+
+        Return the cells that have been closed by it.
+        """
+
+        self.unblock(name)
+
+        region = MovableArea([{"outer": polygon_m}], self.cell_size_m)
+        cells = np.flatnonzero(region.contains(self.__centers_m)
+                               & self.walkable)
+        self.__regions[name] = cells
+
+        closed = cells[self.blocked[cells] == 0]
+        self.blocked[cells] += 1
+        self.__set_open(closed, False)
+
+        return closed
+
+    def cell_at(self, x_m: float, y_m: float) -> int:
+        """Return the cell of a point, the nearest one if off the grid.
+
+        Never a cell of the closed border, the search would step out of
+        the grid from it.
+
+        Parameters:
+        x_m -- X coordinate of the point.
+        y_m -- Y coordinate of the point.
+        """
+
+        column = min(max(math.floor((x_m - self.origin_x_m)
+                                    / self.cell_size_m), 0),
+                     self.columns - 1)
+        row = min(max(math.floor((y_m - self.origin_y_m)
+                                 / self.cell_size_m), 0), self.rows - 1)
+
+        return (row + 1) * (self.columns + 2) + column + 1
+
+    def center_of(self, cells) -> np.ndarray:
+        """Return the (count, 2) X and Y of the cell centers.
+
+        Parameters:
+        cells -- cell indices.
+        """
+
+        return self.__centers_m[cells]
+
+    def is_open(self, cell: int) -> bool:
+        """Return whether a cell is walkable and not blocked.
+
+        Parameters:
+        cell -- cell index.
+        """
+
+        return self.__open[cell]
+
+    def random_open_cells(self, count: int,
+                          random: np.random.Generator) -> np.ndarray:
+        """Return random walkable and not blocked cells.
+
+        Parameters:
+        count -- number of the cells.
+        random -- generator of the cells.
+        """
+
+        return random.choice(np.flatnonzero(self.walkable
+                                            & (self.blocked == 0)), count)
+
+    def search(self, start: int, goal: int) -> list:
+        """Return the cells of the shortest path or None if none exists.
+
+        Parameters:
+        start -- first cell, walked out of even if closed.
+        goal -- last cell.
+        """
+
+        steps = self.search_steps(start, goal)
+
+        while True:
+            try:
+                next(steps)
+            except StopIteration as finished:
+                return finished.value
+
+    def search_steps(self, start: int, goal: int):
+        """Search for the shortest path in the resumable steps.
+
+        A generator, it pauses every few expanded cells, so a long
+        search can be spread over the ticks. Its return value is the
+        cells of the path or None if none exists. The grid must not be
+        changed before it is finished.
+
+        The step cost is the 3D distance between the cell centers, the
+        octile distance is the heuristic.
+
+        Parameters:
+        start -- first cell, walked out of even if closed.
+        goal -- last cell.
+        """
+
+        if not self.__open[goal]:
+            return None
+
+        stride = self.columns + 2
+        is_open = self.__open
+        heights = self.__heights
+        neighbours = self.__neighbours
+        straight_m = self.cell_size_m
+        diagonal_m = (math.sqrt(2) - 1) * straight_m
+        goal_row, goal_column = divmod(goal, stride)
+
+        costs = {start: 0.0}
+        came_from = {start: None}
+        queue = [(0.0, 0.0, start)]
+        self.expanded_count = 0
+
+        while queue:
+            _, cost, cell = heapq.heappop(queue)
+
+            if cell == goal:
+                path = []
+
+                while cell is not None:
+                    path.append(cell)
+                    cell = came_from[cell]
+                return path[::-1]
+
+            if cost > costs[cell]:
+                continue  # Already reached cheaper.
+
+            self.expanded_count += 1
+            height = heights[cell]
+
+            if self.expanded_count % self.CELLS_PER_STEP == 0:
+                yield
+
+            for offset, step_m, side_y, side_x in neighbours:
+                neighbour = cell + offset
+
+                if not is_open[neighbour] or side_y is not None and not (
+                        is_open[cell + side_y] and is_open[cell + side_x]):
+                    continue
+
+                climb_m = heights[neighbour] - height
+                new_cost = cost + math.sqrt(step_m * step_m
+                                            + climb_m * climb_m)
+
+                if new_cost < costs.get(neighbour, math.inf):
+                    costs[neighbour] = new_cost
+                    came_from[neighbour] = cell
+
+                    row, column = divmod(neighbour, stride)
+                    dx = abs(column - goal_column)
+                    dy = abs(row - goal_row)
+                    heapq.heappush(queue, (
+                        new_cost + straight_m * max(dx, dy)
+                        + diagonal_m * min(dx, dy), new_cost, neighbour))
+
+        return None
+
+    def unblock(self, name: str) -> np.ndarray:
+        """Open the cells of a blocking region again.
+
+        Parameters:
+        name -- region name given to the block().
+
+        Return the cells that have been opened.
+        """
+
+        cells = self.__regions.pop(name, None)
+
+        if cells is None:
+            return np.zeros(0, dtype=np.int64)
+
+        self.blocked[cells] -= 1
+        opened = cells[self.blocked[cells] == 0]
+        self.__set_open(opened, True)
+
+        return opened
+
+    def waypoints(self, path: list) -> np.ndarray:
+        """Return the (count, 2) X and Y of a path's turns and its end.
+
+        Parameters:
+        path -- cells returned by the search().
+        """
+
+        if len(path) == 1:
+            return self.__centers_m[path]
+
+        # Starting in the start cell, the agent heads for the next turn.
+        turns = [cell for previous, cell, following
+                 in zip(path, path[1:], path[2:])
+                 if cell - previous != following - cell]
+
+        return self.__centers_m[turns + path[-1:]]
+
+    def __set_open(self, cells: np.ndarray, is_open: bool):
+        """Update the cell list used by the search.
+
+        Parameters:
+        cells -- cell indices.
+        is_open -- new state.
+        """
+
+        for cell in cells.tolist():
+            self.__open[cell] = is_open
+
+
+class PathPlanner:
+    """Queued path requests with an LRU cache of the found paths.
+
+    The paths are cached by the start and goal cells. An agent asking
+    again replaces its queued request, the latest one is planned.
+    """
+
+    def __init__(self, grid: NavigationGrid, cache_size: int = 1024,
+                 budget_ms: float = 1.0):
+        """Start without any requests.
+
+        Parameters:
+        grid -- walkable cells.
+        cache_size -- max. number of the cached paths.
+        budget_ms -- search time per update, the first queued search
+                     advances by a step even past it.
+        """
+
+        self.grid = grid
+        self.budget_ms = budget_ms
+        self.paths = {}  # Agent: waypoints, None if the goal is unreachable.
+        self.hits = 0
+        self.misses = 0
+
+        self.__cache_size = cache_size
+        # (start, goal): path cells and waypoints, None if unreachable.
+        self.__cache = collections.OrderedDict()
+        self.__requests = collections.OrderedDict()  # Agent: cells.
+        self.__agent_cells = {}  # Agent: cells of its path.
+        self.__search = None  # Paused: (start, goal), search steps.
+
+    def __len__(self) -> int:
+        """Return the number of the queued requests."""
+
+        return len(self.__requests)
+
+    def block(self, name: str, polygon_m: list) -> list:
+        """Add a blocking region and drop the paths crossing it.
+
+        Parameters:
+        name -- region name for the unblock().
+        polygon_m -- (X, Y) vertices.
+
+        Return the agents whose paths have been dropped, they have to
+        ask for new ones.
+        """
+
+        self.__search = None  # Searched the old grid.
+        closed = self.grid.block(name, polygon_m)
+
+        if not len(closed):
+            return []
+
+        closed = set(closed.tolist())
+
+        for key in [key for key, answer in self.__cache.items()
+                    if answer is not None
+                    and not closed.isdisjoint(answer[0])]:
+            del self.__cache[key]
+
+        stale = [agent for agent, cells in self.__agent_cells.items()
+                 if not closed.isdisjoint(cells)]
+
+        for agent in stale:
+            del self.__agent_cells[agent]
+            self.paths.pop(agent, None)
+
+        return stale
+
+    def cancel(self, agent):
+        """Forget an agent's request and path.
+
+        Parameters:
+        agent -- hashable agent ID.
+        """
+
+        self.__requests.pop(agent, None)
+        self.__agent_cells.pop(agent, None)
+        self.paths.pop(agent, None)
+
+    def is_pending(self, agent) -> bool:
+        """Return whether an agent's request waits for the search.
+
+        Parameters:
+        agent -- hashable agent ID.
+        """
+
+        return agent in self.__requests
+
+    def request(self, agent, start_m: tuple, goal_m: tuple):
+        """Queue a path request, answered by the update().
+
+        Parameters:
+        agent -- hashable agent ID.
+        start_m -- X and Y of the start.
+        goal_m -- X and Y of the goal.
+        """
+
+        self.__requests.pop(agent, None)
+        self.__requests[agent] = (self.grid.cell_at(*start_m[:2]),
+                                  self.grid.cell_at(*goal_m[:2]))
+
+    def unblock(self, name: str):
+        """Remove a blocking region.
+
+        The cached paths stay valid, only the cached failures are
+        dropped, as the goals may be reachable now.
+
+        Parameters:
+        name -- region name given to the block().
+        """
+
+        self.__search = None  # Searched the old grid.
+
+        if not len(self.grid.unblock(name)):
+            return
+
+        for key in [key for key, answer in self.__cache.items()
+                    if answer is None]:
+            del self.__cache[key]
+
+    def update(self) -> list:
+        """Answer the queued requests until the time budget runs out.
+
+        The cached paths are answered first and whatever the budget. A
+        search that runs out of the time goes on in the next update, the
+        first one advances by a step anyway, so a slow update can't stall
+        the queue.
+
+        Return the agents whose paths are ready, in the paths.
+        """
+
+        deadline_s = time.perf_counter() + self.budget_ms / 1000
+        ready = []
+        advanced = False
+
+        for agent, key in list(self.__requests.items()):
+            if key in self.__cache:
+                self.__cache.move_to_end(key)
+                self.hits += 1
+                self.__answer(agent, self.__cache[key])
+                ready.append(agent)
+
+        while self.__requests \
+                and (not advanced or time.perf_counter() < deadline_s):
+            agent, key = next(iter(self.__requests.items()))
+            advanced = True
+
+            if self.__search is None or self.__search[0] != key:
+                self.__search = (key, self.grid.search_steps(*key))
+
+            try:
+                while True:
+                    next(self.__search[1])
+
+                    if time.perf_counter() >= deadline_s:
+                        break
+            except StopIteration as finished:
+                self.__search = None
+                self.misses += 1
+
+                cells = finished.value
+                answer = None if cells is None \
+                    else (cells, self.grid.waypoints(cells))
+                self.__cache[key] = answer
+
+                if len(self.__cache) > self.__cache_size:
+                    self.__cache.popitem(last=False)
+
+                # Also the other agents asking for the same path.
+                for other, other_key in list(self.__requests.items()):
+                    if other_key == key:
+                        self.__answer(other, answer)
+                        ready.append(other)
+
+        return ready
+
+    def __answer(self, agent, answer: tuple):
+        """Hand a found path to an agent.
+
+        Parameters:
+        agent -- hashable agent ID.
+        answer -- cells and waypoints of the path, None if unreachable.
+        """
+
+        del self.__requests[agent]
+
+        if answer is None:
+            self.__agent_cells.pop(agent, None)
+            self.paths[agent] = None
+        else:
+            self.__agent_cells[agent], self.paths[agent] = answer
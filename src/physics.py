@@ -1,57 +1,78 @@
-import sys
+from __future__ import annotations
 
-try:
+from typing import TYPE_CHECKING
+
+from collisions import Collisions
+
+if TYPE_CHECKING:  # Annotations only, not worth importing at the start.
     from direct.actor.Actor import Actor
-    from panda3d.core import CollisionHandlerQueue
-    from panda3d.core import CollideMask
-    from panda3d.core import CollisionNode
-    from panda3d.core import CollisionRay
-    from panda3d.core import CollisionTraverser
     from panda3d.core import ModelRoot
-except ModuleNotFoundError:
-    sys.stderr.write("Panda3d not found.\n")
-    exit()
+
+    from height_map import HeightMap
 
 
 class Physics:
     """Walk on a terrain support."""
 
-    def __init__(self, player: Actor):
-        """Collosion handling and physical models creation."""
+    def __init__(self, player: Actor, collisions: Collisions):
+        """Collosion handling and physical models creation.
 
-        self.coll_checker = CollisionTraverser()
-        self.coll_handler = CollisionHandlerQueue()  # Collisions list.
+        Parameters:
+        player -- movable human-like model.
+        collisions -- shared terrain collisions service.
+        """
+
+        from panda3d.core import CollisionNode
+        from panda3d.core import CollisionRay
+
+        self.__collisions = collisions
 
         self.player_gravity_ray = player.attachNewNode(
             CollisionNode("player_coll_node"))
 
         self.player_gravity_ray.node().addSolid(
             CollisionRay(0, 0, 5, 0, 0, -1))
-        self.player_gravity_ray.node().setIntoCollideMask(
-            CollideMask.allOff())
+        self.__collisions.add_collider(self.player_gravity_ray)
 
     def __del__(self):
         """Physical model deletion."""
+        self.__collisions.remove_collider(self.player_gravity_ray)
         self.player_gravity_ray.removeNode()
 
-    def __call__(self, player: Actor, terrain: ModelRoot):
+    def __call__(self, player: Actor, terrain: ModelRoot,
+                 height_map: HeightMap = None):
         """Walk on the terrain.
 
         Parameters:
         terrain -- terrain model to walk on.
         player -- movable human-like model.
+        height_map -- precomputed terrain heights, the ray is cast only
+                      where it doesn't know the ground, e.g. overhangs.
         """
 
-        self.coll_checker.addCollider(self.player_gravity_ray,
-                                      self.coll_handler)
+        ground_z = None
 
-        self.coll_checker.traverse(terrain)
-        terrain_colls = list(self.coll_handler.getEntries())
+        if height_map is not None:
+            ground_z = height_map.height_at(player.getX(), player.getY())
 
-        if terrain_colls:
+        if ground_z is None:
+            ground_z = self.__cast_gravity_ray(terrain)
+
+        if ground_z is not None:
             terrain_coll_z = player.RELATIVE_Z_OFFSET_M \
-                - player.getZ() \
-                + terrain_colls[0].getSurfacePoint(terrain).getZ()
+                - player.getZ() + ground_z
 
             player.delta_vector_m.setZ(terrain_coll_z)
-        self.coll_checker.clearColliders()
+
+    def __cast_gravity_ray(self, terrain: ModelRoot):
+        """Return the ground Z under the player found by the ray or None.
+
+        Parameters:
+        terrain -- terrain model to walk on.
+        """
+
+        terrain_colls = self.__collisions.entries(self.player_gravity_ray)
+
+        if terrain_colls:
+            return terrain_colls[0].getSurfacePoint(terrain).getZ()
+        return None
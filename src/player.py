@@ -1,8 +1,11 @@
 """Player initialization and movement."""
 
+from __future__ import annotations
+
 from enum import Enum
 import math
 import sys
+from typing import TYPE_CHECKING
 
 try:
     from direct.actor.Actor import Actor
@@ -12,10 +15,20 @@ except ModuleNotFoundError:
     exit()
 
 
+from animation import AnimationDriver
 import controls
 import rotation
 import invisible_border
-from tpp_camera import TPPCamera
+
+if TYPE_CHECKING:
+    from actor_lod import ActorLOD
+    from tpp_camera import TPPCamera
+
+
+# Ground speeds shown by the clips at their native 24 FPS.
+CLIP_SPEEDS_M_PER_S = {"walk": 2.4, "run": 7.2}
+
+CLIPS = (None, "walk", "run")  # Saved by the index.
 
 
 class States(Enum):
@@ -26,26 +39,30 @@ class States(Enum):
 class Player(Actor):
     """Same as in the file's header docstring."""
 
-    def __init__(self):
-        """Load and set the player attribiutes."""
+    def __init__(self, model="../assets/ralph", anims: dict = None):
+        """Load and set the player attribiutes.
+
+        Parameters:
+        model -- model file or an already loaded model.
+        anims -- "walk" and "run" animation files or loaded animations.
+        """
 
         self.RELATIVE_Z_OFFSET_M = 0.0
         self.delta_vector_m = Vec3(0.0)
 
-        self.__ANIM_FPS = 20
         self.__DEFAULT_RELATIVE_YAW_DEG = 180
         self.__SPEED_M_PER_S = {"walk": 2, "run": 6}
 
-        self.__current_anim_frame_idx = 0
-        self.__delta_per_frame_m = 0.0  # Normalized step per frame.
+        self.__delta_per_step_m = 0.0  # Normalized step per simulation step.
+        self.__lod_band = -1  # Not sorted yet.
         self.__running_is_toggled = False
         self.__state = States.STOP
         self.__timer_ms = 0.0  # Finite-state machine timer.
 
         try:
-            Actor.__init__(self, "../assets/ralph",
-                           {"walk": "../assets/ralph-walk",
-                            "run": "../assets/ralph-run"})
+            Actor.__init__(self, model,
+                           anims or {"walk": "../assets/ralph-walk",
+                                     "run": "../assets/ralph-run"})
         except OSError:
             sys.stderr.write("Unable to load the player assets.\n")
             raise
@@ -53,32 +70,60 @@ class Player(Actor):
         self.setH(self.__DEFAULT_RELATIVE_YAW_DEG)
         self.setScale(0.4)
 
-    def control(self, tpp_camera: TPPCamera):
-        """Change player pos using the "controls" module."""
+        self.__animation = AnimationDriver(self, CLIP_SPEEDS_M_PER_S,
+                                           ("walk", 7))
 
-        invisible_border.limit_actor_movable_area(self)
-        tpp_camera.rotate(self.getPos())
+    def animate(self, actor_lod: ActorLOD = None):
+        """Loop the walk or run animation of the current state.
+
+        Parameters:
+        actor_lod -- bands that animate less often far from the camera.
+        """
+
+        if actor_lod is not None:
+            self.__lod_band = actor_lod.classify_one(
+                self.getDistance(base.camera), self.__lod_band)
+            self.__animation.set_update_interval(
+                actor_lod.update_intervals[self.__lod_band])
+
+        clip = None
 
-        self.__set_state()
-        self.__set_delta_per_frame_m()
+        if self.__state == States.MOVE:
+            clip = "run" if self.__running_is_toggled else "walk"
 
-        if controls.pressed_keys[controls.Keymap.Player.go_left] \
-                or controls.pressed_keys[controls.Keymap.Player.go_right]:
+        self.__animation.update(clip, self.__SPEED_M_PER_S.get(clip, 0.0),
+                                globalClock.getDt())
+
+    def control(self, tpp_camera: TPPCamera, dt_s: float):
+        """Change player pos using the "controls" module.
+
+        The camera has to be rotated already in this frame.
+
+        Parameters:
+        tpp_camera -- camera whose basis the player moves along.
+        dt_s -- duration of the simulation step.
+        """
+
+        self.__set_state(dt_s)
+        self.__set_delta_per_step_m(dt_s)
+
+        if controls.is_pressed(controls.Keymap.Player.go_left) \
+                or controls.is_pressed(controls.Keymap.Player.go_right):
 
             # Move left.
-            if controls.pressed_keys[controls.Keymap.Player.go_left]:
-                self.__delta_per_frame_m = -self.__delta_per_frame_m
+            if controls.is_pressed(controls.Keymap.Player.go_left):
+                self.__delta_per_step_m = -self.__delta_per_step_m
 
             self.__follow_camera()
             self.__rotate_relatively_to_camera()
             self.__move_in_x_axis(tpp_camera)
 
-        if controls.pressed_keys[controls.Keymap.Player.go_forward] \
-                or controls.pressed_keys[controls.Keymap.Player.go_backward]:
+        if controls.is_pressed(controls.Keymap.Player.go_forward) \
+                or controls.is_pressed(controls.Keymap.Player.go_backward):
 
             # Move backward.
-            if controls.pressed_keys[controls.Keymap.Player.go_backward]:
-                self.__delta_per_frame_m = -self.__delta_per_frame_m
+            if controls.is_pressed(controls.Keymap.Player.go_backward):
+                self.__delta_per_step_m = -self.__delta_per_step_m
 
             self.__follow_camera()
             self.__rotate_relatively_to_camera()
@@ -88,6 +133,34 @@ class Player(Actor):
         self.setH(rotation.limit_angle_to_360_deg(self.getH()))
 
         tpp_camera.change_position(Vec3(0, 0, self.delta_vector_m.getZ()))
+        invisible_border.limit_actor_movable_area(self)
+
+    def load_state(self, state: tuple):
+        """Set a state returned by the save_state.
+
+        Parameters:
+        state -- saved values.
+        """
+
+        (x_m, y_m, z_m, h_deg, delta_x_m, delta_y_m, delta_z_m, moving,
+         running, self.__timer_ms, clip, clip_frame) = state
+
+        self.setPosHpr(x_m, y_m, z_m, h_deg, 0, 0)
+        self.delta_vector_m.set(delta_x_m, delta_y_m, delta_z_m)
+        self.__state = States.MOVE if moving else States.STOP
+        self.__running_is_toggled = running
+        self.__animation.load_state(CLIPS[clip], clip_frame)
+
+    def save_state(self) -> tuple:
+        """Return the position, movement and animation as numbers."""
+
+        clip, clip_frame = self.__animation.save_state()
+
+        return (self.getX(), self.getY(), self.getZ(), self.getH(),
+                self.delta_vector_m.getX(), self.delta_vector_m.getY(),
+                self.delta_vector_m.getZ(), self.__state == States.MOVE,
+                self.__running_is_toggled, self.__timer_ms,
+                CLIPS.index(clip), clip_frame)
 
     def __follow_camera(self):
         """Rotate the player's back to the camera."""
@@ -99,61 +172,24 @@ class Player(Actor):
     def __move_in_x_axis(self, tpp_camera: TPPCamera):
         """X-axis movement handling."""
 
-        camera_yaw_deg = base.camera.getH()
-        camera_yaw_rad = math.radians(camera_yaw_deg)
-        camera_yaw_quarter = rotation.get_angle_quarter(camera_yaw_deg)
-
-        delta_x_m = delta_y_m = 0.0
-
-        if camera_yaw_quarter == 1 or 2:
-            delta_x_m = math.cos(camera_yaw_rad) * self.__delta_per_frame_m
-            delta_y_m = math.sin(camera_yaw_rad) * self.__delta_per_frame_m
+        delta_m = tpp_camera.basis.right * self.__delta_per_step_m
 
-        elif camera_yaw_quarter == 3:
-            angle_rad = math.radians(camera_yaw_deg - 90)
-            delta_x_m = -math.sin(angle_rad) * self.__delta_per_frame_m
-            delta_y_m = math.cos(angle_rad) * self.__delta_per_frame_m
-
-        elif camera_yaw_quarter == 4:
-            angle_rad = math.radians(camera_yaw_deg - 180)
-            delta_x_m = -math.cos(angle_rad) * self.__delta_per_frame_m
-            delta_y_m = -math.sin(angle_rad) * self.__delta_per_frame_m
-
-        self.delta_vector_m.set(delta_x_m, delta_y_m,
+        self.delta_vector_m.set(delta_m.getX(), delta_m.getY(),
                                 self.delta_vector_m.getZ())
         self.__set_position(tpp_camera)
 
     def __move_in_y_axis(self, tpp_camera: TPPCamera):
         """Y-axis movement handling."""
 
-        camera_yaw_deg = base.camera.getH()
-        camera_yaw_rad = math.radians(camera_yaw_deg)
-        camera_yaw_quarter = rotation.get_angle_quarter(camera_yaw_deg)
-
-        delta_x_m = delta_y_m = 0.0
-
-        if camera_yaw_quarter == 1 or 2:
-            delta_x_m = -math.sin(camera_yaw_rad) * self.__delta_per_frame_m
-            delta_y_m = math.cos(camera_yaw_rad) * self.__delta_per_frame_m
-
-        elif camera_yaw_quarter == 3:
-            angle_rad = math.radians(camera_yaw_deg - 90)
-            delta_x_m = -math.cos(angle_rad) * self.__delta_per_frame_m
-            delta_y_m = -math.sin(angle_rad) * self.__delta_per_frame_m
+        delta_m = tpp_camera.basis.forward * self.__delta_per_step_m
 
-        elif camera_yaw_quarter == 4:
-            angle_rad = math.radians(camera_yaw_deg - 180)
-            delta_x_m = math.sin(angle_rad) * self.__delta_per_frame_m
-            delta_y_m = -math.cos(angle_rad) * self.__delta_per_frame_m
-
-        self.delta_vector_m.set(delta_x_m, delta_y_m,
+        self.delta_vector_m.set(delta_m.getX(), delta_m.getY(),
                                 self.delta_vector_m.getZ())
 
         # Move both directions.
-        if controls.pressed_keys[controls.Keymap.Player.go_left]:
-            if controls.pressed_keys[controls.Keymap.Player.go_forward] \
-                    or controls.pressed_keys[
-                    controls.Keymap.Player.go_backward]:
+        if controls.is_pressed(controls.Keymap.Player.go_left):
+            if controls.is_pressed(controls.Keymap.Player.go_forward) \
+                    or controls.is_pressed(controls.Keymap.Player.go_backward):
                 self.delta_vector_m.setX(-self.delta_vector_m.getX())
                 self.delta_vector_m.setY(-self.delta_vector_m.getY())
 
@@ -165,48 +201,52 @@ class Player(Actor):
         sqrt_of_2 = math.sqrt(2)
         player_yaw = self.getH()
 
-        if controls.pressed_keys[controls.Keymap.Player.go_left]:
-            self.__delta_per_frame_m /= sqrt_of_2
+        if controls.is_pressed(controls.Keymap.Player.go_left):
+            self.__delta_per_step_m /= sqrt_of_2
 
-            if controls.pressed_keys[controls.Keymap.Player.go_forward]:
+            if controls.is_pressed(controls.Keymap.Player.go_forward):
                 self.setH(player_yaw + 45)
 
-            elif controls.pressed_keys[controls.Keymap.Player.go_backward]:
+            elif controls.is_pressed(controls.Keymap.Player.go_backward):
                 self.setH(player_yaw + 135)
 
             else:
                 self.setH(player_yaw + 90)
 
-        elif controls.pressed_keys[controls.Keymap.Player.go_right]:
-            self.__delta_per_frame_m /= sqrt_of_2
+        elif controls.is_pressed(controls.Keymap.Player.go_right):
+            self.__delta_per_step_m /= sqrt_of_2
 
-            if controls.pressed_keys[controls.Keymap.Player.go_forward]:
+            if controls.is_pressed(controls.Keymap.Player.go_forward):
                 self.setH(player_yaw + 315)
 
-            elif controls.pressed_keys[controls.Keymap.Player.go_backward]:
+            elif controls.is_pressed(controls.Keymap.Player.go_backward):
                 self.setH(player_yaw + 225)
 
             else:
                 self.setH(player_yaw + 270)
 
-        elif controls.pressed_keys[controls.Keymap.Player.go_backward]:
+        elif controls.is_pressed(controls.Keymap.Player.go_backward):
             self.setH(player_yaw + 180)
 
-    def __set_delta_per_frame_m(self):
-        """Set delta speed and optionally normalize it."""
+    def __set_delta_per_step_m(self, dt_s: float):
+        """Set delta speed and optionally normalize it.
+
+        Parameters:
+        dt_s -- duration of the simulation step.
+        """
 
         if self.__running_is_toggled:
-            self.__delta_per_frame_m = self.__SPEED_M_PER_S["run"]
+            self.__delta_per_step_m = self.__SPEED_M_PER_S["run"]
         else:
-            self.__delta_per_frame_m = self.__SPEED_M_PER_S["walk"]
-        self.__delta_per_frame_m *= globalClock.getDt()
+            self.__delta_per_step_m = self.__SPEED_M_PER_S["walk"]
+        self.__delta_per_step_m *= dt_s
 
     def __set_position(self, tpp_camera: TPPCamera):
         """Adjust the player position and normalize the main vector."""
 
         try:
             vector_normalization_ratio = \
-                (math.fabs(self.__delta_per_frame_m)
+                (math.fabs(self.__delta_per_step_m)
                  - math.fabs(self.delta_vector_m.getZ())) \
                 / (math.fabs(self.delta_vector_m.getX())
                    + math.fabs(self.delta_vector_m.getY()))
@@ -226,43 +266,24 @@ class Player(Actor):
         tpp_camera.change_position(Vec3(self.delta_vector_m.getX(),
                                         self.delta_vector_m.getY(), 0.0))
 
-    def __set_state(self):
-        """Set the animations of walking or running or disable it.
+    def __set_state(self, dt_s: float):
+        """Set the state of walking or running or standing.
 
-        Simple finite-state machine.
-        """
+        Simple finite-state machine, posed later by the animate.
 
-        if controls.pressed_keys[controls.Keymap.Player.go_forward] \
-                or controls.pressed_keys[controls.Keymap.Player.go_backward] \
-                or controls.pressed_keys[controls.Keymap.Player.go_left] \
-                or controls.pressed_keys[controls.Keymap.Player.go_right]:
-            try:
-                delta_frame = self.__ANIM_FPS \
-                    / globalClock.getAverageFrameRate()
-            except ZeroDivisionError:
-                delta_frame = 0
+        Parameters:
+        dt_s -- duration of the simulation step.
+        """
 
+        if controls.is_pressed(controls.Keymap.Player.go_forward) \
+                or controls.is_pressed(controls.Keymap.Player.go_backward) \
+                or controls.is_pressed(controls.Keymap.Player.go_left) \
+                or controls.is_pressed(controls.Keymap.Player.go_right):
             self.__state = States.MOVE
-
-            if self.__running_is_toggled:
-                self.pose("run", int(self.__current_anim_frame_idx))
-                self.__current_anim_frame_idx += delta_frame
-
-                if self.__current_anim_frame_idx > self.getNumFrames("run"):
-                    self.__current_anim_frame_idx = 0
-
-            else:
-                self.pose("walk", int(self.__current_anim_frame_idx))
-                self.__current_anim_frame_idx += delta_frame
-
-                if self.__current_anim_frame_idx > self.getNumFrames("walk"):
-                    self.__current_anim_frame_idx = 0
-
         else:
             self.__state = States.STOP
-            self.pose("walk", 7)
 
-        if controls.pressed_keys[controls.Keymap.Player.toggle_run]:
+        if controls.is_pressed(controls.Keymap.Player.toggle_run):
 
             if self.__timer_ms >= controls.KEYPRESS_TIMEOUT_S:
                 if self.__running_is_toggled:
@@ -271,4 +292,4 @@ class Player(Actor):
                     self.__running_is_toggled = True
             self.__timer_ms = 0
 
-        self.__timer_ms += globalClock.getDt()
+        self.__timer_ms += dt_s
@@ -0,0 +1,114 @@
+"""Per-stage frame timings for the PStats and JSON dumps."""
+
+import json
+import sys
+import threading
+import time
+
+try:
+    from panda3d.core import PStatCollector
+except ModuleNotFoundError:
+    sys.stderr.write("Panda3d not found.\n")
+    exit()
+
+
+class FrameProfiler:
+    """Times every stage of the frame loop.
+
+    Timings go to the named PStats collectors and to a fixed-size ring
+    buffer of the recent frames, that can be dumped to JSON on demand or
+    automatically when a frame exceeds the budget.
+    """
+
+    OVER_BUDGET_DUMP_COOLDOWN_S = 10.0
+
+    def __init__(self, stage_names: list, capacity: int = 600,
+                 budget_ms: float = 0.0, dump_prefix: str = "profile"):
+        """Create the collectors and the empty ring buffer.
+
+        Parameters:
+        stage_names -- names of the frame stages in their order.
+        capacity -- number of the recent frames kept in the memory.
+        budget_ms -- frame time that triggers a dump when exceeded,
+                     zero disables the automatic dumps.
+        dump_prefix -- beginning of the dumped files paths.
+        """
+
+        self.stage_names = list(stage_names)
+        self.last_frame_s = ()  # Stage timings of the last frame.
+
+        self.__collectors = [PStatCollector("App:" + name)
+                             for name in stage_names]
+        self.__frames = [None] * capacity
+        self.__frame_idx = 0
+        self.__budget_s = budget_ms / 1e3
+        self.__dump_prefix = dump_prefix
+        self.__last_dump_s = -self.OVER_BUDGET_DUMP_COOLDOWN_S
+
+    def dump(self, path: str = None) -> str:
+        """Write the buffered frames to a JSON file in the background.
+
+        Parameters:
+        path -- output file, named after the newest frame by default.
+        """
+
+        frames = [frame for frame in (self.__frames[self.__frame_idx:]
+                                      + self.__frames[:self.__frame_idx])
+                  if frame is not None]
+
+        if path is None:
+            path = "{}-{}.json".format(
+                self.__dump_prefix, frames[-1][0] if frames else 0)
+
+        threading.Thread(target=self.__write, args=(path, frames),
+                         name="profile_dump", daemon=True).start()
+        return path
+
+    def run(self, stages: tuple):
+        """Run and time the frame stages.
+
+        Parameters:
+        stages -- (name, callable) pairs in the order of stage_names.
+        """
+
+        clock = time.perf_counter
+        frame_s = []
+
+        for (_, stage), collector in zip(stages, self.__collectors):
+            collector.start()
+            start_s = clock()
+            stage()
+            frame_s.append(clock() - start_s)
+            collector.stop()
+
+        self.last_frame_s = frame_s
+        total_s = sum(frame_s)
+
+        self.__frames[self.__frame_idx] = (globalClock.getFrameCount(),
+                                           total_s, frame_s)
+        self.__frame_idx = (self.__frame_idx + 1) % len(self.__frames)
+
+        if self.__budget_s and total_s > self.__budget_s \
+                and clock() - self.__last_dump_s \
+                > self.OVER_BUDGET_DUMP_COOLDOWN_S:
+            self.__last_dump_s = clock()
+            self.dump()
+
+    def __write(self, path: str, frames: list):
+        """Serialize the frames.
+
+        Parameters:
+        path -- output file.
+        frames -- (frame number, total, stage timings) from the oldest.
+        """
+
+        with open(path, 'w') as json_file:
+            json.dump({"budget_ms": self.__budget_s * 1e3,
+                       "frames": [{"frame": number,
+                                   "total_ms": total_s * 1e3,
+                                   "stages_ms": dict(zip(
+                                       self.stage_names,
+                                       (stage_s * 1e3
+                                        for stage_s in frame_s)))}
+                                  for number, total_s, frame_s in frames]},
+                      json_file, indent=1)
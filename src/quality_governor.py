@@ -0,0 +1,158 @@
+"""Quality levers traded for the frame time under load."""
+
+import collections
+import json
+
+from background_writer import BackgroundWriter
+
+
+class QualityLever:
+    """Setting with levels from the best quality to the cheapest one."""
+
+    def __init__(self, name: str, levels: tuple, apply):
+        """Start at the best level, that has to be the current setting.
+
+        Parameters:
+        name -- identifier in the events.
+        levels -- values from the best quality to the cheapest one.
+        apply -- callable setting a value.
+        """
+
+        self.name = name
+        self.levels = tuple(levels)
+        self.level = 0
+
+        self.__apply = apply
+
+    def set_level(self, level: int):
+        """Apply the value of a level.
+
+        Parameters:
+        level -- index into the levels.
+        """
+
+        self.level = level
+        self.__apply(self.levels[level])
+
+
+class QualityGovernor:
+    """Steps the quality levers down when the frames are over budget.
+
+    The mean of a rolling window of the frame times is compared with
+    the budget. Over it, the first lever that can still go down is
+    lowered by one level. Under the headroom fraction of the budget,
+    the lever lowered last is raised back. The window is refilled after
+    every change and raising waits for a longer calm period too, so the
+    quality doesn't oscillate around the budget.
+
+    Every decision is kept in the events, sent as the EVENT message and
+    appended to a JSON lines log, if any.
+    """
+
+    EVENT = "quality-changed"
+
+    def __init__(self, budget_ms: float, window_frames: int = 30,
+                 headroom: float = 0.7, raise_after_frames: int = 120,
+                 log_path: str = None, max_events: int = 1024):
+        """Start with no levers.
+
+        Parameters:
+        budget_ms -- target frame time.
+        window_frames -- frames averaged by a decision.
+        headroom -- fraction of the budget that the mean frame time has
+                    to stay under to raise the quality.
+        raise_after_frames -- frames since the last change before the
+                              quality is raised.
+        log_path -- file to append the events to.
+        max_events -- number of the recent events kept in the memory.
+        """
+
+        self.budget_ms = budget_ms
+        self.levers = []
+        self.events = collections.deque(maxlen=max_events)
+
+        self.__frame_times_s = collections.deque(maxlen=window_frames)
+        self.__headroom = headroom
+        self.__raise_after_frames = raise_after_frames
+        self.__frames_since_change = 0
+        self.__lowered = []  # Levers in the order they were lowered.
+        self.__log = None if log_path is None \
+            else BackgroundWriter(log_path)
+
+    def add_lever(self, name: str, levels: tuple, apply):
+        """Append a lever, the earlier ones are lowered first.
+
+        Parameters:
+        name -- identifier in the events.
+        levels -- values from the best quality to the cheapest one.
+        apply -- callable setting a value.
+        """
+
+        self.levers.append(QualityLever(name, levels, apply))
+
+    def close(self):
+        """Write the logged events to the disk."""
+
+        if self.__log is not None:
+            self.__log.close()
+
+    def update(self, dt_s: float):
+        """Add a frame time and change a lever if needed.
+
+        Parameters:
+        dt_s -- duration of the last frame.
+        """
+
+        self.__frame_times_s.append(dt_s)
+        self.__frames_since_change += 1
+
+        if len(self.__frame_times_s) < self.__frame_times_s.maxlen:
+            return
+
+        mean_ms = sum(self.__frame_times_s) * 1e3 \
+            / len(self.__frame_times_s)
+
+        if mean_ms > self.budget_ms:
+            for lever in self.levers:
+                if lever.level < len(lever.levels) - 1:
+                    self.__lowered.append(lever)
+                    self.__change(lever, lever.level + 1, "over budget",
+                                  mean_ms)
+                    break
+
+        elif mean_ms < self.budget_ms * self.__headroom \
+                and self.__lowered \
+                and self.__frames_since_change >= self.__raise_after_frames:
+            lever = self.__lowered.pop()
+            self.__change(lever, lever.level - 1, "headroom", mean_ms)
+
+    def __change(self, lever: QualityLever, level: int, reason: str,
+                 mean_ms: float):
+        """Set a lever's level and report it.
+
+        Parameters:
+        lever -- lever to change.
+        level -- its new level.
+        reason -- why it changes.
+        mean_ms -- mean frame time of the window.
+        """
+
+        event = {"frame": globalClock.getFrameCount(),
+                 "time_s": globalClock.getFrameTime(),
+                 "lever": lever.name,
+                 "from": lever.levels[lever.level],
+                 "to": lever.levels[level],
+                 "level": level,
+                 "reason": reason,
+                 "mean_frame_ms": mean_ms,
+                 "budget_ms": self.budget_ms}
+
+        lever.set_level(level)
+        self.__frame_times_s.clear()
+        self.__frames_since_change = 0
+
+        self.events.append(event)
+        messenger.send(self.EVENT, [event])
+
+        if self.__log is not None:
+            self.__log.write((json.dumps(event) + "\n").encode())
@@ -1,5 +1,56 @@
 """Some trigonometrical wrappers."""
 
+import math
+import sys
+
+try:
+    from panda3d.core import Vec3
+except ModuleNotFoundError:
+    sys.stderr.write("Panda3d not found.\n")
+    exit()
+
+
+class Basis:
+    """Orientation computed once per frame from a yaw and a pitch.
+
+    Directions are horizontal unit vectors, so movement on the ground
+    and camera placement are plain vector math, without any further
+    trigonometry.
+    """
+
+    def __init__(self, yaw_deg: float = 0.0, pitch_deg: float = 0.0):
+        """Compute the initial orientation.
+
+        Parameters:
+        yaw_deg -- heading measured in degrees.
+        pitch_deg -- looking up or down measured in degrees.
+        """
+
+        self.forward = Vec3(0, 1, 0)
+        self.right = Vec3(1, 0, 0)
+        self.pitch_cos = 1.0
+        self.pitch_sin = 0.0
+
+        self.update(yaw_deg, pitch_deg)
+
+    def update(self, yaw_deg: float, pitch_deg: float):
+        """Recompute the directions.
+
+        Parameters:
+        yaw_deg -- heading measured in degrees.
+        pitch_deg -- looking up or down measured in degrees.
+        """
+
+        yaw_rad = math.radians(yaw_deg)
+        pitch_rad = math.radians(pitch_deg)
+        yaw_cos = math.cos(yaw_rad)
+        yaw_sin = math.sin(yaw_rad)
+
+        self.forward.set(-yaw_sin, yaw_cos, 0)
+        self.right.set(yaw_cos, yaw_sin, 0)
+        self.pitch_cos = math.cos(pitch_rad)
+        self.pitch_sin = math.sin(pitch_rad)
+
 
 def limit_angle_to_360_deg(angle_deg: float) -> float:
     """
@@ -17,6 +68,22 @@ def limit_angle_to_360_deg(angle_deg: float) -> float:
         return angle_deg
 
 
+def limit_angles_to_360_deg(angles_deg):
+    """Return many angles limited at once, as limit_angle_to_360_deg.
+
+    Parameters:
+    angles_deg -- NumPy array of angles measured in degrees.
+    """
+
+    import numpy as np  # Not needed before the first batch.
+
+    angles_deg = np.asarray(angles_deg, dtype=np.float64)
+
+    return np.where(angles_deg < 0, angles_deg + 360,
+                    np.where(angles_deg >= 360, angles_deg - 360,
+                             angles_deg))
+
+
 def get_angle_quarter(angle_deg: float) -> int:
     """
     Return the angle quarter.
@@ -25,11 +92,20 @@ def get_angle_quarter(angle_deg: float) -> int:
     angle_deg -- an angle measured in degrees.
     """
 
-    if 0 <= angle_deg % 360 < 90:
-        return 1
-    elif 90 <= angle_deg % 360 < 180:
-        return 2
-    elif 180 <= angle_deg % 360 < 270:
-        return 3
-    if 270 <= angle_deg % 360 < 360:
-        return 4
+    # A tiny negative angle modulo 360 is rounded up to 360.
+    return min(int(angle_deg % 360 // 90), 3) + 1
+
+
+def get_angle_quarters(angles_deg):
+    """Return the quarters of many angles at once, as get_angle_quarter.
+
+    Parameters:
+    angles_deg -- NumPy array of angles measured in degrees.
+    """
+
+    import numpy as np  # Not needed before the first batch.
+
+    quarters = np.floor_divide(np.mod(angles_deg, 360), 90).astype(np.int64)
+
+    # A tiny negative angle modulo 360 is rounded up to 360.
+    return np.minimum(quarters, 3) + 1
@@ -0,0 +1,738 @@
+#! /usr/bin/env python3
+
+"""Headless server simulating many players fed over local sockets.
+
+Every connection is a player session. A client sends its input
+whenever it changes and gets the player's state back after every
+simulation tick. The players walk on the terrain and within the
+movable area like the game's one, all of them stepped at once.
+
+    ./sim_server.py serve --unix /tmp/tpp3d.sock
+    ./sim_server.py load --unix /tmp/tpp3d.sock --sessions 500
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import signal
+import struct
+import sys
+import time
+
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    sys.stderr.write("NumPy not found.\n")
+    exit()
+
+
+import controls
+from height_map import HeightMap
+import invisible_border
+import rotation
+
+
+MAGIC = b"TPPN"
+VERSION = 1
+
+WELCOME = struct.Struct("<4sBf")  # Magic, version, tick rate.
+INPUT = struct.Struct("<IBf")  # Sequence, keys bitmask, camera heading.
+
+# Tick, last applied input sequence, player position, heading and the
+# moving and running flags. The NumPy layout of the same record fills
+# the updates of all the sessions at once.
+STATE = struct.Struct("<IIffffB")
+STATE_DTYPE = np.dtype([("tick", "<u4"), ("sequence", "<u4"),
+                        ("x_m", "<f4"), ("y_m", "<f4"), ("z_m", "<f4"),
+                        ("h_deg", "<f4"), ("flags", "u1")])
+MOVING_FLAG = 1
+RUNNING_FLAG = 2
+
+TERRAIN = "../assets/terrain.egg"
+
+
+class PlayerBatch:
+    """Players of the sessions stored as a struct of arrays.
+
+    A step does for every player what the game's Physics and
+    Player.control do for one, in the same order and with the same
+    quirks, e.g. the diagonal steps, so a session moves as the player
+    of the game with the same input. The ground comes from the height
+    map only, where it is unknown the player keeps its last vertical
+    step, as Physics does when its ray finds no ground.
+    """
+
+    SPEED_M_PER_S = {"walk": 2, "run": 6}  # As the Player's.
+    DEFAULT_RELATIVE_YAW_DEG = 180  # The model faces the camera.
+    SPAWN_Z_M = 1.0  # Set higher to "fall" on the terrain.
+
+    # Name, type and row shape of every per-player array.
+    __ARRAYS = (("positions_m", np.float64, (3,)),
+                ("deltas_m", np.float64, (3,)),
+                ("headings_deg", np.float64, ()),
+                ("moving", bool, ()),
+                ("running", bool, ()),
+                ("timers_s", np.float64, ()),
+                ("key_masks", np.uint8, ()),
+                ("camera_headings_deg", np.float64, ()))
+
+    def __init__(self, height_map: HeightMap, capacity: int = 64):
+        """Allocate the arrays, without players.
+
+        Parameters:
+        height_map -- terrain heights the players walk on.
+        capacity -- initial number of the rows, doubled when full.
+        """
+
+        self.count = 0
+
+        self.__height_map = height_map
+        self.__allocate(capacity)
+
+    def add(self) -> int:
+        """Spawn a player and return its row."""
+
+        if self.count == len(self.positions_m):
+            self.__allocate(2 * len(self.positions_m))
+
+        row = self.count
+        self.positions_m[row] = (0.0, 0.0, self.SPAWN_Z_M)
+        self.deltas_m[row] = 0.0
+        self.headings_deg[row] = 0.0
+        self.moving[row] = False
+        self.running[row] = False
+        self.timers_s[row] = 0.0
+        self.key_masks[row] = 0
+        self.camera_headings_deg[row] = 0.0
+        self.count += 1
+
+        return row
+
+    def remove(self, row: int):
+        """Remove a player, the last one moves to its row.
+
+        Parameters:
+        row -- row of the removed player.
+        """
+
+        self.count -= 1
+
+        for name, _, _ in self.__ARRAYS:
+            array = getattr(self, name)
+            array[row] = array[self.count]
+
+    def step(self, dt_s: float):
+        """Put the players on the ground and move them by their input.
+
+        Parameters:
+        dt_s -- duration of the simulation step.
+        """
+
+        count = self.count
+
+        if not count:
+            return
+
+        positions_m = self.positions_m[:count]
+        deltas_m = self.deltas_m[:count]
+        keys = self.key_masks[:count]
+
+        # Physics, the Z delta is applied after the move.
+        ground_z_m = self.__height_map.heights_at(positions_m[:, 0],
+                                                  positions_m[:, 1])
+        known = ~np.isnan(ground_z_m)
+        deltas_m[known, 2] = ground_z_m[known] - positions_m[known, 2]
+
+        def is_pressed(key: str) -> np.ndarray:
+            return keys & controls.KEY_BITS[key] != 0
+
+        forward = is_pressed(controls.Keymap.Player.go_forward)
+        backward = is_pressed(controls.Keymap.Player.go_backward)
+        left = is_pressed(controls.Keymap.Player.go_left)
+        right = is_pressed(controls.Keymap.Player.go_right)
+        toggle_run = is_pressed(controls.Keymap.Player.toggle_run)
+
+        # States.
+        self.moving[:count] = forward | backward | left | right
+        timers_s = self.timers_s[:count]
+        toggled = toggle_run & (timers_s >= controls.KEYPRESS_TIMEOUT_S)
+        self.running[:count] ^= toggled
+        timers_s[toggle_run] = 0.0
+        timers_s += dt_s
+
+        steps_m = np.where(self.running[:count], self.SPEED_M_PER_S["run"],
+                           self.SPEED_M_PER_S["walk"]) * dt_s
+
+        camera_rad = np.radians(self.camera_headings_deg[:count])
+        camera_cos = np.cos(camera_rad)
+        camera_sin = np.sin(camera_rad)
+        follow_deg = self.DEFAULT_RELATIVE_YAW_DEG \
+            + self.camera_headings_deg[:count]
+        headings_deg = self.headings_deg[:count]
+
+        sideways = left | right
+        steps_m[left] = -steps_m[left]
+        steps_m[sideways] /= math.sqrt(2)
+        headings_deg[sideways] = follow_deg[sideways] + np.where(
+            left, np.where(forward, 45, np.where(backward, 135, 90)),
+            np.where(forward, 315, np.where(backward, 225, 270)))[sideways]
+        self.__move(sideways, camera_cos * steps_m, camera_sin * steps_m,
+                    steps_m)
+
+        lengthwise = forward | backward
+        steps_m[backward] = -steps_m[backward]
+        steps_m[sideways] /= math.sqrt(2)
+        headings_deg[lengthwise] = follow_deg[lengthwise] + np.where(
+            left, np.where(forward, 45, np.where(backward, 135, 90)),
+            np.where(right, np.where(forward, 315,
+                                     np.where(backward, 225, 270)),
+                     np.where(backward, 180, 0)))[lengthwise]
+
+        # Both directions reverse the forward one when going left.
+        reversed_sign = np.where(left, -1.0, 1.0)
+        self.__move(lengthwise, -camera_sin * steps_m * reversed_sign,
+                    camera_cos * steps_m * reversed_sign, steps_m)
+
+        positions_m[:, 2] += deltas_m[:, 2]
+        headings_deg[:] = rotation.limit_angles_to_360_deg(headings_deg)
+        positions_m[:, :2] = invisible_border.limit_positions_to_movable_area(
+            positions_m[:, :2])
+
+    def __allocate(self, capacity: int):
+        """Replace the arrays by larger ones, keeping the players.
+
+        Parameters:
+        capacity -- new number of the rows.
+        """
+
+        for name, dtype, shape in self.__ARRAYS:
+            array = np.zeros((capacity,) + shape, dtype)
+
+            if self.count:
+                array[:self.count] = getattr(self, name)[:self.count]
+            setattr(self, name, array)
+
+    def __move(self, mask: np.ndarray, delta_x_m: np.ndarray,
+               delta_y_m: np.ndarray, steps_m: np.ndarray):
+        """Move the masked players, with the step length normalized.
+
+        Parameters:
+        mask -- players to move.
+        delta_x_m -- unnormalized X steps of all the players.
+        delta_y_m -- unnormalized Y steps of all the players.
+        steps_m -- step lengths, the Z delta included.
+        """
+
+        deltas_m = self.deltas_m[:self.count]
+        manhattan_m = np.abs(delta_x_m[mask]) + np.abs(delta_y_m[mask])
+        ratios = np.ones(len(manhattan_m))
+        nonzero = manhattan_m != 0
+        ratios[nonzero] = (np.abs(steps_m[mask][nonzero])
+                           - np.abs(deltas_m[mask, 2][nonzero])) \
+            / manhattan_m[nonzero]
+
+        deltas_m[mask, 0] = delta_x_m[mask] * ratios
+        deltas_m[mask, 1] = delta_y_m[mask] * ratios
+        self.positions_m[:self.count][mask, :2] += deltas_m[mask, :2]
+
+
+class SimulationServer:
+    """Steps all the sessions at a fixed rate in one asyncio loop.
+
+    The inputs are read between the ticks, a session keeps its last one
+    until the next arrives. When a tick runs late, the missed ones are
+    skipped, not caught up, like the FixedStep drops the steps of a
+    long frame. A session whose socket doesn't drain misses updates
+    rather than buffer them.
+    """
+
+    MAX_WRITE_BUFFER_BYTES = 64 * STATE.size
+
+    def __init__(self, height_map: HeightMap, rate_hz: float = 30.0,
+                 max_tick_samples: int = 100000):
+        """Start without sessions.
+
+        Parameters:
+        height_map -- terrain heights the players walk on.
+        rate_hz -- simulation ticks per second.
+        max_tick_samples -- number of the recent tick durations kept.
+        """
+
+        self.rate_hz = rate_hz
+        self.players = PlayerBatch(height_map)
+        self.sessions = []  # Aligned with the players' rows.
+        self.ticks = 0
+        self.late_ticks = 0  # Skipped because of the slow ones.
+        self.dropped_updates = 0
+        self.max_sessions = 0
+        self.tick_times_s = np.zeros(max_tick_samples)
+
+        self.__loaded_ticks = 0  # With any sessions.
+        self.__stopped = None
+
+    def add(self, session):
+        """Spawn the player of a new session.
+
+        Parameters:
+        session -- connection, gets the row.
+        """
+
+        session.row = self.players.add()
+        self.sessions.append(session)
+        self.max_sessions = max(self.max_sessions, len(self.sessions))
+
+    def remove(self, session):
+        """Remove the player of a closed session.
+
+        Parameters:
+        session -- connection added before.
+        """
+
+        row = session.row
+        self.players.remove(row)
+        moved = self.sessions.pop()
+
+        if moved is not session:
+            self.sessions[row] = moved
+            moved.row = row
+
+    async def run(self, unix_path: str = None, host: str = "127.0.0.1",
+                  port: int = 0):
+        """Listen and tick until stopped.
+
+        Parameters:
+        unix_path -- Unix socket path, TCP if None.
+        host -- TCP address.
+        port -- TCP port, zero picks a free one.
+        """
+
+        loop = asyncio.get_running_loop()
+        self.__stopped = asyncio.Event()
+
+        if unix_path is not None:
+            server = await loop.create_unix_server(
+                lambda: ServerSession(self), unix_path)
+            address = unix_path
+        else:
+            server = await loop.create_server(
+                lambda: ServerSession(self), host, port)
+            address = "{}:{}".format(*server.sockets[0].getsockname()[:2])
+
+        sys.stdout.write("listening on {}\n".format(address))
+        sys.stdout.flush()
+
+        step_s = 1 / self.rate_hz
+        next_tick_s = loop.time()
+
+        try:
+            while not self.__stopped.is_set():
+                delay_s = next_tick_s - loop.time()
+
+                if delay_s > 0:
+                    await asyncio.sleep(delay_s)
+                else:
+                    await asyncio.sleep(0)  # Read the inputs anyway.
+
+                start_s = time.perf_counter()
+                self.players.step(step_s)
+                self.__send_states()
+
+                # Of the loaded ticks only, the idle ones cost nothing.
+                if self.sessions:
+                    self.tick_times_s[self.__loaded_ticks
+                                      % len(self.tick_times_s)] = \
+                        time.perf_counter() - start_s
+                    self.__loaded_ticks += 1
+                self.ticks += 1
+
+                next_tick_s += step_s
+                missed = math.floor((loop.time() - next_tick_s) / step_s)
+
+                if missed > 0:
+                    self.late_ticks += missed
+                    next_tick_s += missed * step_s
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    def stats(self) -> dict:
+        """Return the tick counts and the durations of the loaded ones."""
+
+        samples = self.tick_times_s[:min(self.__loaded_ticks,
+                                         len(self.tick_times_s))]
+        tick_ms = {"p{}".format(rank): float(np.percentile(samples, rank)
+                                             * 1e3) if len(samples) else 0.0
+                   for rank in (50, 95, 99)}
+        tick_ms["max"] = float(samples.max() * 1e3) if len(samples) else 0.0
+
+        return {"rate_hz": self.rate_hz, "ticks": self.ticks,
+                "late_ticks": self.late_ticks,
+                "dropped_updates": self.dropped_updates,
+                "sessions": len(self.sessions),
+                "max_sessions": self.max_sessions, "tick_ms": tick_ms}
+
+    def stop(self):
+        """Finish the current tick and close the listening socket."""
+
+        if self.__stopped is not None:
+            self.__stopped.set()
+
+    def __send_states(self):
+        """Write the state of every player to its session."""
+
+        count = self.players.count
+
+        if not count:
+            return
+
+        states = np.empty(count, STATE_DTYPE)
+        states["tick"] = self.ticks + self.late_ticks  # Gaps if skipped.
+        states["sequence"] = [session.sequence for session in self.sessions]
+        states["x_m"] = self.players.positions_m[:count, 0]
+        states["y_m"] = self.players.positions_m[:count, 1]
+        states["z_m"] = self.players.positions_m[:count, 2]
+        states["h_deg"] = self.players.headings_deg[:count]
+        states["flags"] = self.players.moving[:count] * MOVING_FLAG \
+            + self.players.running[:count] * RUNNING_FLAG
+        data = states.tobytes()
+
+        for row, session in enumerate(self.sessions):
+            transport = session.transport
+
+            if transport.is_closing():  # Removed by the next tick.
+                continue
+
+            if transport.get_write_buffer_size() \
+                    > self.MAX_WRITE_BUFFER_BYTES:
+                self.dropped_updates += 1
+                continue
+
+            transport.write(data[row * STATE.size:(row + 1) * STATE.size])
+
+
+class ServerSession(asyncio.Protocol):
+    """Connection of a player, applies its input to the batch."""
+
+    def __init__(self, server: SimulationServer):
+        """Wait for the connection.
+
+        Parameters:
+        server -- server owning the players.
+        """
+
+        self.row = None
+        self.sequence = 0  # Of the last applied input.
+        self.transport = None
+
+        self.__server = server
+        self.__buffer = b""
+
+    def connection_lost(self, exc: Exception):
+        """Remove the player.
+
+        Parameters:
+        exc -- error closing the connection, None if closed normally.
+        """
+
+        if self.row is not None:
+            self.__server.remove(self)
+            self.row = None
+
+    def connection_made(self, transport: asyncio.BaseTransport):
+        """Spawn the player and greet the client.
+
+        Parameters:
+        transport -- socket of the session.
+        """
+
+        self.transport = transport
+        self.__server.add(self)
+        transport.write(WELCOME.pack(MAGIC, VERSION, self.__server.rate_hz))
+
+    def data_received(self, data: bytes):
+        """Apply the newest complete input, the older ones are outdated.
+
+        Parameters:
+        data -- received bytes, not aligned with the records.
+        """
+
+        self.__buffer += data
+        complete = len(self.__buffer) // INPUT.size * INPUT.size
+
+        if not complete:
+            return
+
+        self.sequence, key_mask, camera_h_deg = INPUT.unpack_from(
+            self.__buffer, complete - INPUT.size)
+        self.__buffer = self.__buffer[complete:]
+
+        players = self.__server.players
+        players.key_masks[self.row] = key_mask
+        players.camera_headings_deg[self.row] = camera_h_deg
+
+
+class LoadSession(asyncio.Protocol):
+    """Client connection of the load generator."""
+
+    def __init__(self, sent_s: dict):
+        """Wait for the connection.
+
+        Parameters:
+        sent_s -- send times of the inputs by their sequence, shared by
+                  all the sessions.
+        """
+
+        self.transport = None
+        self.connected = False
+        self.rate_hz = None
+        self.updates = 0
+        self.missed_ticks = 0
+        self.latencies_s = []  # From an input to the first state with it.
+        self.sequence = 0
+
+        self.__sent_s = sent_s
+        self.__buffer = b""
+        self.__last_tick = None
+        self.__acknowledged = 0
+
+    def connection_made(self, transport: asyncio.BaseTransport):
+        """Keep the socket.
+
+        Parameters:
+        transport -- socket of the session.
+        """
+
+        self.transport = transport
+        self.connected = True
+
+    def connection_lost(self, exc: Exception):
+        """Stop sending the input.
+
+        Parameters:
+        exc -- error closing the connection, None if closed normally.
+        """
+
+        self.connected = False
+
+    def data_received(self, data: bytes):
+        """Count the states and the input latencies.
+
+        Parameters:
+        data -- received bytes, not aligned with the records.
+        """
+
+        self.__buffer += data
+        offset = 0
+
+        if self.rate_hz is None:
+            if len(self.__buffer) < WELCOME.size:
+                return
+
+            magic, version, self.rate_hz = WELCOME.unpack_from(self.__buffer)
+
+            if magic != MAGIC or version != VERSION:
+                raise OSError("Not a simulation server.")
+            offset = WELCOME.size
+
+        now_s = time.perf_counter()
+
+        while offset + STATE.size <= len(self.__buffer):
+            tick, sequence = STATE.unpack_from(self.__buffer, offset)[:2]
+            offset += STATE.size
+            self.updates += 1
+
+            if self.__last_tick is not None:
+                self.missed_ticks += max(tick - self.__last_tick - 1, 0)
+            self.__last_tick = tick
+
+            if sequence > self.__acknowledged:
+                self.__acknowledged = sequence
+                sent_s = self.__sent_s.get(sequence)
+
+                if sent_s is not None:
+                    self.latencies_s.append(now_s - sent_s)
+
+        self.__buffer = self.__buffer[offset:]
+
+    def send(self, key_mask: int, camera_h_deg: float):
+        """Send an input with the next sequence number.
+
+        Parameters:
+        key_mask -- pressed keys, as the controls.key_mask.
+        camera_h_deg -- camera heading.
+        """
+
+        self.sequence += 1
+        self.transport.write(INPUT.pack(self.sequence, key_mask,
+                                        camera_h_deg))
+
+
+async def generate_load(sessions: int, duration_s: float,
+                        unix_path: str = None, host: str = "127.0.0.1",
+                        port: int = 0, input_rate_hz: float = 10.0,
+                        seed: int = 0) -> dict:
+    """Connect the sessions, play random input and return the stats.
+
+    Every session holds random keys and turns the camera, changing them
+    every few inputs, like a player walking around.
+
+    Parameters:
+    sessions -- number of the connections.
+    duration_s -- time of the measurement after all have connected.
+    unix_path -- Unix socket path of the server, TCP if None.
+    host -- TCP address of the server.
+    port -- TCP port of the server.
+    input_rate_hz -- inputs per second of every session.
+    seed -- makes the input repeatable.
+    """
+
+    loop = asyncio.get_running_loop()
+    random = np.random.default_rng(seed)
+    sent_s = {}  # The same sequences in all the sessions.
+    clients = []
+
+    for _ in range(sessions):
+        if unix_path is not None:
+            _, client = await loop.create_unix_connection(
+                lambda: LoadSession(sent_s), unix_path)
+        else:
+            _, client = await loop.create_connection(
+                lambda: LoadSession(sent_s), host, port)
+        clients.append(client)
+
+    movement_keys = [0] + [
+        sum(controls.KEY_BITS[key] for key in keys)
+        for keys in (('w',), ('s',), ('a',), ('d',), ('w', 'a'),
+                     ('w', 'd'), ('s', 'a'), ('s', 'd'))]
+    key_masks = random.choice(movement_keys, sessions)
+    camera_headings_deg = random.uniform(0, 360, sessions)
+
+    start_s = time.perf_counter()
+    updates = sum(client.updates for client in clients)
+    missed_ticks = sum(client.missed_ticks for client in clients)
+    sequence = 0
+
+    while time.perf_counter() - start_s < duration_s:
+        sequence += 1
+        changed = random.random(sessions) < 0.1
+        key_masks[changed] = random.choice(movement_keys, changed.sum())
+        camera_headings_deg += random.normal(0, 5, sessions)
+        running = random.random(sessions) < 0.01
+        sent_s[sequence] = time.perf_counter()
+
+        for client, key_mask, camera_h_deg, run in zip(
+                clients, key_masks.tolist(), camera_headings_deg.tolist(),
+                running.tolist()):
+            if client.connected:
+                client.send(key_mask | (controls.KEY_BITS["lshift"] * run),
+                            camera_h_deg % 360)
+
+        await asyncio.sleep(1 / input_rate_hz)
+
+    elapsed_s = time.perf_counter() - start_s
+    latencies_s = [latency_s for client in clients
+                   for latency_s in client.latencies_s]
+    connected = sum(client.connected for client in clients)
+
+    for client in clients:
+        client.transport.close()
+
+    rate_hz = clients[0].rate_hz if clients else 0.0
+    updates = sum(client.updates for client in clients) - updates
+
+    return {"sessions": sessions, "connected": connected,
+            "updates_per_session_s": updates / max(connected, 1) / elapsed_s,
+            "rate_hz": rate_hz,
+            "missed_ticks": sum(client.missed_ticks for client in clients)
+            - missed_ticks,
+            "latency_ms": {"p{}".format(rank): float(
+                np.percentile(latencies_s, rank) * 1e3)
+                if latencies_s else 0.0 for rank in (50, 95, 99)}}
+
+
+def load_height_map(path: str = TERRAIN) -> HeightMap:
+    """Return the heights of a terrain model, loaded without a window.
+
+    Parameters:
+    path -- terrain asset.
+    """
+
+    try:
+        from panda3d.core import Filename
+        from panda3d.core import Loader
+        from panda3d.core import NodePath
+    except ModuleNotFoundError:
+        sys.stderr.write("Panda3d not found.\n")
+        exit()
+
+    import asset_cache
+    import terrain_geometry
+
+    load_path, _ = asset_cache.lookup(path)
+    terrain = NodePath(Loader.getGlobalPtr().loadSync(
+        Filename.fromOsSpecific(load_path)))
+
+    return HeightMap.from_triangles(terrain_geometry.read_triangles(terrain))
+
+
+async def serve(args: argparse.Namespace):
+    """Run the server until a SIGINT or SIGTERM, then print its stats."""
+
+    if args.movable_area is not None:
+        from movable_area import MovableArea
+
+        invisible_border.movable_area = MovableArea.load(args.movable_area)
+
+    server = SimulationServer(load_height_map(args.terrain), args.rate)
+    loop = asyncio.get_running_loop()
+
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, server.stop)
+
+    try:
+        await server.run(args.unix, args.host, args.port)
+    finally:
+        if args.unix is not None and os.path.exists(args.unix):
+            os.remove(args.unix)
+
+    sys.stdout.write(json.dumps(server.stats()) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    modes = parser.add_subparsers(dest="mode")
+    modes.required = True
+
+    for mode in ("serve", "load"):
+        subparser = modes.add_parser(mode)
+        subparser.add_argument("--unix", metavar="PATH",
+                               help="Unix socket instead of the TCP")
+        subparser.add_argument("--host", default="127.0.0.1")
+        subparser.add_argument("--port", type=int,
+                               default=7015,
+                               help="TCP port, zero picks a free one")
+
+        if mode == "serve":
+            subparser.add_argument("--rate", type=float, default=30.0,
+                                   help="simulation ticks per second")
+            subparser.add_argument("--terrain", default=TERRAIN)
+            subparser.add_argument("--movable-area", metavar="FILE",
+                                   help="walkable polygons instead of the "
+                                   "rectangle")
+        else:
+            subparser.add_argument("--sessions", type=int, default=100)
+            subparser.add_argument("--duration", type=float, default=10.0,
+                                   help="seconds of the measurement")
+            subparser.add_argument("--input-rate", type=float, default=10.0,
+                                   help="inputs per second of a session")
+
+    args = parser.parse_args()
+
+    if args.mode == "serve":
+        asyncio.run(serve(args))
+    else:
+        sys.stdout.write(json.dumps(asyncio.run(generate_load(
+            args.sessions, args.duration, args.unix, args.host, args.port,
+            args.input_rate))) + "\n")
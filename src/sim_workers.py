@@ -0,0 +1,200 @@
+"""Simulation steps run by a pool of worker processes.
+
+The agents' arrays live in the shared memory, every worker steps its
+own slice of them in place. Only the short commands go through the
+pipes, nothing is pickled per step.
+"""
+
+import multiprocessing
+from multiprocessing import shared_memory
+import sys
+
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    sys.stderr.write("NumPy not found.\n")
+    exit()
+
+
+class SharedArrays:
+    """NumPy arrays backed by the named shared memory blocks."""
+
+    def __init__(self, specs: dict, names: dict = None):
+        """Create the blocks or attach to the existing ones.
+
+        Parameters:
+        specs -- array name: (shape, dtype).
+        names -- array name: shared memory block name, to attach to the
+                 blocks created by another process.
+        """
+
+        self.specs = specs
+        self.blocks = {}
+        self.arrays = {}
+        self.__owner = names is None
+
+        for name, (shape, dtype) in specs.items():
+            size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+
+            if names is None:
+                block = shared_memory.SharedMemory(create=True, size=size)
+            else:
+                block = shared_memory.SharedMemory(names[name])
+
+            self.blocks[name] = block
+            self.arrays[name] = np.ndarray(shape, dtype, block.buf)
+
+    def __del__(self):
+        """Release the blocks, the creator also frees them."""
+
+        self.close()
+
+    def close(self):
+        """Release the blocks, the creator also frees them."""
+
+        self.arrays = {}
+
+        for block in self.blocks.values():
+            block.close()
+
+            if self.__owner:
+                block.unlink()
+        self.blocks = {}
+
+    def names(self) -> dict:
+        """Return the block names to attach to from the workers."""
+
+        return {name: block.name for name, block in self.blocks.items()}
+
+
+class WorkerPool:
+    """Processes stepping the slices of the shared agents' arrays.
+
+    A step is started without waiting, so the main process can do its
+    own work meanwhile, and the results are read after the wait().
+    """
+
+    def __init__(self, arrays: SharedArrays, create_simulation,
+                 count: int):
+        """Start the workers.
+
+        Parameters:
+        arrays -- agents' arrays, the first axis of each one is split.
+        create_simulation -- called in a worker with the array slices
+                             and the worker index, returns an object
+                             with the step(dt_s) method. Has to be a
+                             module-level callable.
+        count -- number of the worker processes.
+        """
+
+        agent_count = len(next(iter(arrays.arrays.values())))
+        bounds = np.linspace(0, agent_count, count + 1).astype(int)
+
+        self.count = count
+        self.__connections = []
+        self.__processes = []
+        self.__busy = True  # Until all are attached.
+
+        for index in range(count):
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=run_worker,
+                args=(worker_connection, arrays.specs, arrays.names(),
+                      bounds[index], bounds[index + 1], create_simulation,
+                      index),
+                name="sim_worker_{}".format(index), daemon=True)
+            process.start()
+            worker_connection.close()
+
+            self.__connections.append(connection)
+            self.__processes.append(process)
+
+        self.wait()
+
+    def __del__(self):
+        """Stop the workers."""
+
+        self.close()
+
+    def close(self):
+        """Stop the workers."""
+
+        for connection, process in zip(self.__connections, self.__processes):
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            process.join(1)
+
+            if process.is_alive():
+                process.terminate()
+            connection.close()
+
+        self.__connections = []
+        self.__processes = []
+
+    def step(self, dt_s: float):
+        """Start a simulation step in all the workers.
+
+        Parameters:
+        dt_s -- duration of the simulation step.
+        """
+
+        self.wait()
+
+        for connection in self.__connections:
+            connection.send(dt_s)
+        self.__busy = True
+
+    def wait(self):
+        """Block until the started step is finished everywhere."""
+
+        if not self.__busy:
+            return
+
+        for connection in self.__connections:
+            if not connection.recv():
+                raise RuntimeError("A simulation worker has failed.")
+        self.__busy = False
+
+
+def run_worker(connection, specs: dict, names: dict, start: int, stop: int,
+               create_simulation, index: int):
+    """Step the slice of the agents on every command until stopped.
+
+    Parameters:
+    connection -- pipe to the main process.
+    specs -- shapes and types of the shared arrays.
+    names -- shared memory block names.
+    start -- first agent of the slice.
+    stop -- agent after the slice.
+    create_simulation -- builds the simulation of the slice.
+    index -- worker index.
+    """
+
+    arrays = SharedArrays(specs, names)
+    simulation = None
+
+    try:
+        simulation = create_simulation(
+            {name: array[start:stop] for name, array in arrays.arrays.items()},
+            index)
+        connection.send(True)
+
+        while True:
+            dt_s = connection.recv()
+
+            if dt_s is None:
+                break
+
+            simulation.step(dt_s)
+            connection.send(True)
+    except (EOFError, KeyboardInterrupt):
+        pass
+    except Exception:
+        connection.send(False)
+        raise
+    finally:
+        del simulation  # Its views have to go before the blocks.
+        arrays.close()
+        connection.close()
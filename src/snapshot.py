@@ -0,0 +1,252 @@
+"""Compact history of the world states for saving and rewinding.
+
+Every snapshot is a fixed set of fields. A record holds a bitmask of
+the fields that have changed since the previous snapshot and only their
+values. A keyframe record every few snapshots holds all of them, so any
+snapshot is decoded from the nearest keyframe.
+"""
+
+from __future__ import annotations
+
+import collections
+import struct
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:  # Annotations only.
+    from player import Player
+    from tpp_camera import TPPCamera
+
+
+MAGIC = b"TPPS"
+VERSION = 1
+
+# Magic, version, fields count, keyframe interval, first snapshot index.
+HEADER = struct.Struct("<4sBBHI")
+MASK = struct.Struct("<I")  # Changed fields bitmask before every record.
+
+# Name and struct format of every field, in the record order. Player
+# fields come first, in the Player.save_state order, then the camera
+# ones, in the TPPCamera.save_state order.
+FIELDS = (("player_x_m", 'd'), ("player_y_m", 'd'), ("player_z_m", 'd'),
+          ("player_h_deg", 'd'),
+          ("delta_x_m", 'd'), ("delta_y_m", 'd'), ("delta_z_m", 'd'),
+          ("moving", '?'), ("running", '?'), ("run_timer_s", 'd'),
+          ("clip", 'B'), ("clip_frame", 'f'),
+          ("mouse_x", 'd'), ("mouse_y", 'd'),
+          ("camera_offset_x_m", 'd'), ("camera_offset_y_m", 'd'),
+          ("camera_offset_z_m", 'd'), ("camera_max_pitch_deg", 'd'))
+PLAYER_FIELDS_COUNT = 12
+FULL_MASK = (1 << len(FIELDS)) - 1
+
+
+class SnapshotHistory:
+    """Delta-encoded snapshots kept in memory, optionally bounded.
+
+    Snapshots are grouped by the keyframes. When the history is full,
+    the oldest group is dropped, so the memory stays constant in a long
+    session.
+    """
+
+    def __init__(self, keyframe_interval: int = 60, max_groups: int = 600):
+        """Start an empty history.
+
+        Parameters:
+        keyframe_interval -- snapshots per keyframe.
+        max_groups -- kept keyframe groups, 0 keeps all of them. The
+                      default keeps 10 minutes at 60 snapshots per s.
+        """
+
+        self.keyframe_interval = keyframe_interval
+        self.first_index = 0  # Of the oldest kept snapshot.
+
+        self.__max_groups = max_groups
+        self.__groups = collections.deque()  # [records, offsets] pairs.
+        self.__last_state = None
+        self.__count = 0
+        self.__layouts = {}  # Bitmask: struct and indices of its fields.
+
+    def __len__(self) -> int:
+        """Return the index after the newest snapshot."""
+
+        return self.first_index + self.__count
+
+    def capture(self, state: tuple):
+        """Append a snapshot, only its changed fields unless keyframe.
+
+        Parameters:
+        state -- values in the FIELDS order.
+        """
+
+        if self.__count % self.keyframe_interval == 0:
+            mask = FULL_MASK
+            values = state
+
+            if self.__max_groups \
+                    and len(self.__groups) == self.__max_groups:
+                self.__groups.popleft()
+                self.first_index += self.keyframe_interval
+                self.__count -= self.keyframe_interval
+            self.__groups.append([bytearray(), []])
+        else:
+            mask = 0
+            values = []
+            bit = 1
+
+            for new, old in zip(state, self.__last_state):
+                if new != old:
+                    mask |= bit
+                    values.append(new)
+                bit <<= 1
+
+        records, offsets = self.__groups[-1]
+        offsets.append(len(records))
+        records += MASK.pack(mask)
+        records += self.__layout(mask)[0].pack(*values)
+
+        self.__last_state = state
+        self.__count += 1
+
+    @classmethod
+    def load(cls, path: str) -> SnapshotHistory:
+        """Read the snapshots saved to a file.
+
+        Parameters:
+        path -- snapshots file.
+        """
+
+        with open(path, "rb") as snapshots_file:
+            data = snapshots_file.read()
+
+        magic, version, fields_count, keyframe_interval, first_index = \
+            HEADER.unpack_from(data)
+
+        if magic != MAGIC or version != VERSION \
+                or fields_count != len(FIELDS):
+            raise OSError("Not a snapshots file: " + path)
+
+        history = cls(keyframe_interval, max_groups=0)
+        history.first_index = first_index
+        offset = HEADER.size
+
+        # Decoded and encoded again, to rebuild the groups' offsets.
+        while offset < len(data):
+            mask, = MASK.unpack_from(data, offset)
+            packer, fields = history.__layout(mask)
+            state = list(history.__last_state or [None] * len(FIELDS))
+
+            for field, value in zip(fields, packer.unpack_from(
+                    data, offset + MASK.size)):
+                state[field] = value
+            history.capture(tuple(state))
+            offset += MASK.size + packer.size
+
+        return history
+
+    def save(self, path: str):
+        """Write the kept snapshots to a file.
+
+        Parameters:
+        path -- snapshots file, overwritten.
+        """
+
+        with open(path, "wb") as snapshots_file:
+            snapshots_file.write(HEADER.pack(
+                MAGIC, VERSION, len(FIELDS), self.keyframe_interval,
+                self.first_index))
+
+            for records, _ in self.__groups:
+                snapshots_file.write(records)
+
+    def state_at(self, index: int) -> tuple:
+        """Decode a kept snapshot.
+
+        Parameters:
+        index -- snapshot index, the first_index at least.
+        """
+
+        if not self.first_index <= index < len(self):
+            raise IndexError("Snapshot not kept: {}".format(index))
+
+        group, record = divmod(index - self.first_index,
+                               self.keyframe_interval)
+        records, offsets = self.__groups[group]
+        state = [None] * len(FIELDS)
+
+        for offset in offsets[:record + 1]:
+            mask, = MASK.unpack_from(records, offset)
+            packer, fields = self.__layout(mask)
+
+            for field, value in zip(fields, packer.unpack_from(
+                    records, offset + MASK.size)):
+                state[field] = value
+
+        return tuple(state)
+
+    def truncate(self, length: int):
+        """Drop the snapshots from the index on, e.g. to resume rewound.
+
+        Parameters:
+        length -- index of the first dropped snapshot.
+        """
+
+        length = max(length, self.first_index)
+
+        if length >= len(self):
+            return
+
+        group, record = divmod(length - self.first_index,
+                               self.keyframe_interval)
+
+        while len(self.__groups) > group + 1:
+            self.__groups.pop()
+
+        if record:
+            records, offsets = self.__groups[-1]
+            del records[offsets[record]:]
+            del offsets[record:]
+        elif self.__groups:
+            self.__groups.pop()
+
+        self.__count = length - self.first_index
+        self.__last_state = self.state_at(length - 1) if self.__count \
+            else None
+
+    def __layout(self, mask: int) -> tuple:
+        """Return the struct and the indices of the fields in a bitmask.
+
+        Parameters:
+        mask -- changed fields bitmask.
+        """
+
+        layout = self.__layouts.get(mask)
+
+        if layout is None:
+            fields = [field for field in range(len(FIELDS))
+                      if mask & 1 << field]
+            layout = self.__layouts[mask] = (struct.Struct("<" + "".join(
+                FIELDS[field][1] for field in fields)), fields)
+        return layout
+
+
+def capture(player: Player, tpp_camera: TPPCamera) -> tuple:
+    """Return the current world state in the FIELDS order.
+
+    Parameters:
+    player -- player to save.
+    tpp_camera -- camera following it.
+    """
+
+    return player.save_state() + tpp_camera.save_state()
+
+
+def restore(player: Player, tpp_camera: TPPCamera, state: tuple):
+    """Set a saved world state.
+
+    Parameters:
+    player -- player to restore.
+    tpp_camera -- camera following it.
+    state -- values in the FIELDS order.
+    """
+
+    player.load_state(state[:PLAYER_FIELDS_COUNT])
+    tpp_camera.load_state(state[PLAYER_FIELDS_COUNT:])
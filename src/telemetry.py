@@ -0,0 +1,368 @@
+#! /usr/bin/env python3
+
+"""Per-frame metrics of long sessions and their offline summary.
+
+A log is a header naming the columns and a sequence of blocks. A block
+holds a few hundred frames column by column, so a column of a whole
+log is read at once and the flags take a byte per frame.
+"""
+
+import argparse
+import array
+import os
+import struct
+import sys
+
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    sys.stderr.write("NumPy not found.\n")
+    exit()
+
+
+from background_writer import BackgroundWriter
+import snapshot
+
+
+MAGIC = b"TPPT"
+VERSION = 1
+
+HEADER = struct.Struct("<4sBH")  # Magic, version, columns count.
+COLUMN = struct.Struct("<Bc")  # Name length and the type code.
+BLOCK = struct.Struct("<II")  # First frame number, frames count.
+
+# Snapshot fields logged every frame after the frame and stage times.
+STATE_FIELDS = ("player_x_m", "player_y_m", "player_z_m",
+                "delta_x_m", "delta_y_m", "delta_z_m",
+                "camera_max_pitch_deg", "moving", "running", "clip",
+                "clip_frame")
+CLIP_NAMES = ("none", "walk", "run")  # In the player.CLIPS order.
+STAGE_PREFIX = "stage_ms:"
+
+# Single precision is enough for the metrics, flags take a byte.
+TYPE_CODES = {'d': 'f', 'f': 'f', '?': 'B', 'B': 'B'}
+DTYPES = {'f': np.dtype("<f4"), 'B': np.dtype("u1")}
+
+
+class TelemetryRecorder:
+    """Appends the metrics of every frame to a columnar log.
+
+    The frame only appends the values to the column arrays of the open
+    block. A full block is handed to the background writer, which drops
+    it rather than block the frame loop when the disk is slow.
+    """
+
+    def __init__(self, path: str, stage_names: list,
+                 block_frames: int = 256):
+        """Open the log for appending and write its header if new.
+
+        A torn last block of a crashed session is cut off first, so the
+        new blocks follow the complete ones.
+
+        Parameters:
+        path -- log file.
+        stage_names -- names of the timed frame stages in their order.
+        block_frames -- frames per block.
+        """
+
+        self.column_names = ["frame_ms"] \
+            + [STAGE_PREFIX + name for name in stage_names] \
+            + list(STATE_FIELDS)
+        self.frames = 0
+
+        field_names = [name for name, _ in snapshot.FIELDS]
+        self.__state_indices = [field_names.index(name)
+                                for name in STATE_FIELDS]
+        self.__type_codes = ['f'] * (1 + len(stage_names)) \
+            + [TYPE_CODES[snapshot.FIELDS[index][1]]
+               for index in self.__state_indices]
+        self.__block_frames = block_frames
+        self.__first_frame = 0
+        self.__new_block()
+
+        is_new = not os.path.isfile(path) or os.path.getsize(path) == 0
+
+        if not is_new:
+            with open(path, "r+b") as existing:
+                columns = read_header(existing)
+
+                if columns != list(zip(self.column_names,
+                                       self.__type_codes)):
+                    raise OSError("Telemetry with different columns: "
+                                  + path)
+
+                existing.truncate(complete_size(existing, columns))
+
+        self.__writer = BackgroundWriter(path, max_queued=256)
+
+        if is_new:
+            self.__writer.write(pack_header(self.column_names,
+                                            self.__type_codes))
+
+    def __call__(self, dt_s: float, stage_times_s: list, state: tuple):
+        """Add a frame to the open block.
+
+        Parameters:
+        dt_s -- duration of the frame.
+        stage_times_s -- durations of the stages in the stage_names
+                         order.
+        state -- world state in the snapshot.FIELDS order.
+        """
+
+        if not self.__rows:
+            self.__first_frame = globalClock.getFrameCount()
+
+        columns = iter(self.__columns)
+        next(columns).append(dt_s * 1e3)
+
+        for stage_s in stage_times_s:
+            next(columns).append(stage_s * 1e3)
+
+        for index in self.__state_indices:
+            next(columns).append(state[index])
+
+        self.__rows += 1
+        self.frames += 1
+
+        if self.__rows == self.__block_frames:
+            self.flush()
+
+    def close(self) -> int:
+        """Write the open block, flush the file and return the number of
+        the dropped frames, counted in whole blocks.
+        """
+
+        self.flush()
+        self.__writer.close()
+        return self.__writer.dropped * self.__block_frames
+
+    def flush(self):
+        """Queue the open block for writing, even if not full."""
+
+        if not self.__rows:
+            return
+
+        if sys.byteorder == "big":
+            for column in self.__columns:
+                column.byteswap()
+
+        self.__writer.write(
+            BLOCK.pack(self.__first_frame, self.__rows)
+            + b"".join(column.tobytes() for column in self.__columns))
+        self.__new_block()
+
+    def __new_block(self):
+        """Start empty columns."""
+
+        self.__columns = [array.array(type_code)
+                          for type_code in self.__type_codes]
+        self.__rows = 0
+
+
+def complete_size(log_file, columns: list) -> int:
+    """Return the size of a log up to the end of its last complete block.
+
+    Parameters:
+    log_file -- file opened in the binary mode right after its header.
+    columns -- (name, type code) pairs returned by the read_header.
+    """
+
+    row_size = sum(DTYPES[type_code].itemsize for _, type_code in columns)
+    size = os.fstat(log_file.fileno()).st_size
+    offset = log_file.tell()
+
+    while offset + BLOCK.size <= size:
+        log_file.seek(offset)
+        _, rows = BLOCK.unpack(log_file.read(BLOCK.size))
+
+        if offset + BLOCK.size + rows * row_size > size:
+            break
+
+        offset += BLOCK.size + rows * row_size
+
+    return offset
+
+
+def pack_header(column_names: list, type_codes: list) -> bytes:
+    """Return the log header.
+
+    Parameters:
+    column_names -- names of the columns in their order.
+    type_codes -- array type codes of the columns.
+    """
+
+    header = HEADER.pack(MAGIC, VERSION, len(column_names))
+
+    for name, type_code in zip(column_names, type_codes):
+        name = name.encode("ascii")
+        header += COLUMN.pack(len(name), type_code.encode("ascii")) + name
+
+    return header
+
+
+def read(path: str) -> dict:
+    """Return the columns of a log as arrays, with the frame numbers.
+
+    A truncated last block, e.g. after a crash, is ignored.
+
+    Parameters:
+    path -- log file.
+    """
+
+    with open(path, "rb") as log_file:
+        columns = read_header(log_file)
+        data = log_file.read()
+
+    blocks = {name: [] for name, _ in columns}
+    blocks["frame"] = []
+    row_size = sum(DTYPES[type_code].itemsize for _, type_code in columns)
+    offset = 0
+
+    while offset + BLOCK.size <= len(data):
+        first_frame, rows = BLOCK.unpack_from(data, offset)
+        offset += BLOCK.size
+
+        if offset + rows * row_size > len(data):
+            break
+
+        for name, type_code in columns:
+            dtype = DTYPES[type_code]
+            blocks[name].append(np.frombuffer(data, dtype, rows, offset))
+            offset += rows * dtype.itemsize
+        blocks["frame"].append(np.arange(first_frame, first_frame + rows))
+
+    return {name: np.concatenate(parts) if parts else np.zeros(0)
+            for name, parts in blocks.items()}
+
+
+def read_header(log_file) -> list:
+    """Return the (name, type code) pairs of the columns.
+
+    Parameters:
+    log_file -- file opened in the binary mode at its beginning.
+    """
+
+    magic, version, columns_count = HEADER.unpack(
+        log_file.read(HEADER.size))
+
+    if magic != MAGIC or version != VERSION:
+        raise OSError("Not a telemetry log.")
+
+    columns = []
+
+    for _ in range(columns_count):
+        length, type_code = COLUMN.unpack(log_file.read(COLUMN.size))
+        columns.append((log_file.read(length).decode("ascii"),
+                        type_code.decode("ascii")))
+
+    return columns
+
+
+def summarize(columns: dict, budget_ms: float = 0.0, top: int = 10,
+              cell_size_m: float = 20.0) -> str:
+    """Return the percentiles and the hotspots of a log as text.
+
+    Parameters:
+    columns -- arrays returned by the read.
+    budget_ms -- frame time counted as a missed frame when exceeded,
+                 zero skips the count.
+    top -- number of the listed worst frames and places.
+    cell_size_m -- size of the map cells the places are grouped by.
+    """
+
+    frame_ms = columns["frame_ms"].astype(np.float64)
+
+    if not len(frame_ms):
+        return "No frames.\n"
+
+    stage_names = [name for name in columns if name.startswith(STAGE_PREFIX)]
+    frames = columns["frame"]
+    gaps = np.diff(frames)
+    lines = ["{} frames, {} to {}, {} missing".format(
+        len(frames), frames[0], frames[-1],
+        int(np.maximum(gaps - 1, 0).sum()))]
+
+    if budget_ms:
+        over = frame_ms > budget_ms
+        lines.append("{} frames over {:.3f} ms ({:.2%})".format(
+            int(over.sum()), budget_ms, over.mean()))
+
+    lines.append("")
+    lines.append("{:>20} {:>9} {:>9} {:>9} {:>9} {:>7}".format(
+        "[ms]", "p50", "p95", "p99", "max", "share"))
+    total_stages_ms = sum(columns[name].sum() for name in stage_names)
+
+    for name, values in [("frame", frame_ms)] \
+            + [(name[len(STAGE_PREFIX):], columns[name])
+               for name in stage_names]:
+        p50, p95, p99 = np.percentile(values, (50, 95, 99))
+        share = "" if name == "frame" else "{:.1%}".format(
+            values.sum() / max(total_stages_ms, 1e-9))
+        lines.append("{:>20} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f} {:>7}"
+                     .format(name, p50, p95, p99, values.max(), share))
+
+    lines.append("")
+    lines.append("worst frames:")
+    lines.append("{:>10} {:>9} {:>20} {:>9} {:>9} {:>6} {:>10}".format(
+        "frame", "[ms]", "slowest stage", "x [m]", "y [m]", "clip",
+        "max pitch"))
+
+    stage_ms = np.stack([columns[name] for name in stage_names]) \
+        if stage_names else None
+
+    for index in np.argsort(frame_ms)[::-1][:top]:
+        slowest = "" if stage_ms is None else stage_names[
+            int(stage_ms[:, index].argmax())][len(STAGE_PREFIX):]
+        clip = int(columns["clip"][index])
+        lines.append(
+            "{:>10} {:>9.3f} {:>20} {:>9.1f} {:>9.1f} {:>6} {:>10.1f}"
+            .format(frames[index], frame_ms[index], slowest,
+                    columns["player_x_m"][index],
+                    columns["player_y_m"][index],
+                    CLIP_NAMES[clip] if clip < len(CLIP_NAMES) else clip,
+                    columns["camera_max_pitch_deg"][index]))
+
+    # Places by the p95 frame time, with enough frames to mean anything.
+    cells_x = np.floor(columns["player_x_m"] / cell_size_m).astype(np.int64)
+    cells_y = np.floor(columns["player_y_m"] / cell_size_m).astype(np.int64)
+    cells, cell_of_frame = np.unique(np.stack([cells_x, cells_y], axis=1),
+                                     axis=0, return_inverse=True)
+    cell_of_frame = cell_of_frame.reshape(-1)
+    order = np.argsort(cell_of_frame, kind="stable")
+    starts = np.searchsorted(cell_of_frame[order], np.arange(len(cells)))
+    places = []
+
+    for cell, cell_frames in zip(cells, np.split(order, starts[1:])):
+        if len(cell_frames) >= 30:
+            places.append((np.percentile(frame_ms[cell_frames], 95),
+                           frame_ms[cell_frames].mean(), len(cell_frames),
+                           cell))
+
+    lines.append("")
+    lines.append("slowest places ({:g} m cells):".format(cell_size_m))
+    lines.append("{:>10} {:>10} {:>9} {:>9} {:>9}".format(
+        "x [m]", "y [m]", "frames", "mean", "p95"))
+
+    for p95, mean, count, (cell_x, cell_y) in sorted(
+            places, key=lambda place: place[0], reverse=True)[:top]:
+        lines.append("{:>10.0f} {:>10.0f} {:>9} {:>9.3f} {:>9.3f}".format(
+            cell_x * cell_size_m, cell_y * cell_size_m, count, mean, p95))
+
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Summarize a telemetry log into the percentiles and "
+        "hotspots.")
+    parser.add_argument("log", help="file written by the --telemetry")
+    parser.add_argument("--budget-ms", type=float, default=0.0,
+                        help="count the frames over the budget")
+    parser.add_argument("--top", type=int, default=10,
+                        help="number of the worst frames and places")
+    parser.add_argument("--cell-size", type=float, default=20.0,
+                        help="size of the places in meters")
+    args = parser.parse_args()
+
+    sys.stdout.write(summarize(read(args.log), args.budget_ms, args.top,
+                               args.cell_size))
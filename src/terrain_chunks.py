@@ -0,0 +1,102 @@
+"""Quadtree of the terrain collision geometry."""
+
+import sys
+
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    sys.stderr.write("NumPy not found.\n")
+    exit()
+
+try:
+    from panda3d.core import CollideMask
+    from panda3d.core import CollisionNode
+    from panda3d.core import CollisionPolygon
+    from panda3d.core import NodePath
+    from panda3d.core import PandaNode
+    from panda3d.core import Point3
+except ModuleNotFoundError:
+    sys.stderr.write("Panda3d not found.\n")
+    exit()
+
+
+import collisions
+
+
+MAX_TRIANGLES_PER_CHUNK = 128
+MAX_DEPTH = 10
+
+
+def build(triangles: np.ndarray) -> NodePath:
+    """Split the triangles into chunks with own bounding volumes.
+
+    Every inner node covers one quarter of its parent area, so the
+    traverser culls whole branches by their bounds and tests a ray
+    only against triangles of the chunks under it. The cost depends on
+    the local detail and the tree depth, not the total map size.
+
+    Parameters:
+    triangles -- (count, 3, 3) array of points in the terrain space.
+    """
+
+    centroids = triangles[:, :, :2].mean(axis=1)
+    low = centroids.min(axis=0) if len(triangles) else np.zeros(2)
+    high = centroids.max(axis=0) if len(triangles) else np.zeros(2)
+
+    return NodePath(__build_node(triangles, centroids, low, high, 0))
+
+
+def __build_node(triangles: np.ndarray, centroids: np.ndarray,
+                 low: np.ndarray, high: np.ndarray,
+                 depth: int) -> PandaNode:
+    """Return a chunk or a quad of smaller chunks.
+
+    Parameters:
+    triangles -- triangles that belong to this node.
+    centroids -- XY centroids of the triangles.
+    low -- min. XY corner of the node's area.
+    high -- max. XY corner of the node's area.
+    depth -- distance from the root.
+    """
+
+    if len(triangles) <= MAX_TRIANGLES_PER_CHUNK or depth >= MAX_DEPTH:
+        return __build_chunk(triangles)
+
+    quad = PandaNode("terrain_quad")
+    middle = (low + high) / 2
+    east = centroids[:, 0] >= middle[0]
+    north = centroids[:, 1] >= middle[1]
+
+    for is_east in (False, True):
+        for is_north in (False, True):
+            selected = (east == is_east) & (north == is_north)
+
+            if not selected.any():
+                continue
+
+            quad.addChild(__build_node(
+                triangles[selected], centroids[selected],
+                np.where([is_east, is_north], middle, low),
+                np.where([is_east, is_north], high, middle), depth + 1))
+
+    return quad
+
+
+def __build_chunk(triangles: np.ndarray) -> CollisionNode:
+    """Return a leaf with the collision polygons.
+
+    Parameters:
+    triangles -- triangles of the chunk.
+    """
+
+    chunk = CollisionNode("terrain_chunk")
+    chunk.setIntoCollideMask(collisions.TERRAIN_MASK)
+    chunk.setFromCollideMask(CollideMask.allOff())
+
+    for triangle in triangles.tolist():
+        points = [Point3(*point) for point in triangle]
+
+        if CollisionPolygon.verifyPoints(*points):  # Not degenerated.
+            chunk.addSolid(CollisionPolygon(*points))
+
+    return chunk
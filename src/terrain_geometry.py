@@ -0,0 +1,59 @@
+"""Raw triangles extraction from loaded models."""
+
+import sys
+
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    sys.stderr.write("NumPy not found.\n")
+    exit()
+
+try:
+    from panda3d.core import GeomVertexReader
+    from panda3d.core import NodePath
+except ModuleNotFoundError:
+    sys.stderr.write("Panda3d not found.\n")
+    exit()
+
+
+def read_triangles(model: NodePath) -> np.ndarray:
+    """Return all model's triangles as a (count, 3, 3) array of points.
+
+    Points are expressed in the model's own space, the same that
+    surface points of collision entries are queried in.
+
+    Parameters:
+    model -- any loaded model, e.g. the terrain.
+    """
+
+    triangles = []
+    geom_nodes = list(model.findAllMatches("**/+GeomNode"))
+
+    if model.node().isGeomNode():
+        geom_nodes.append(model)
+
+    for geom_node in geom_nodes:
+        transform = geom_node.getMat(model)
+
+        for geom in geom_node.node().getGeoms():
+            reader = GeomVertexReader(geom.getVertexData(), "vertex")
+            points = []
+
+            while not reader.isAtEnd():
+                points.append(tuple(transform.xformPoint(reader.getData3())))
+            points = np.array(points, dtype=np.float64).reshape(-1, 3)
+
+            for primitive in geom.getPrimitives():
+                primitive = primitive.decompose()  # Strips to triangles.
+
+                if primitive.getNumVerticesPerPrimitive() != 3:
+                    continue  # Lines or points.
+
+                indices = [primitive.getVertex(idx)
+                           for idx in range(primitive.getNumVertices())]
+                triangles.append(points[np.array(indices, dtype=np.int64)
+                                        .reshape(-1, 3)])
+
+    if not triangles:
+        return np.zeros((0, 3, 3))
+    return np.concatenate(triangles)
@@ -0,0 +1,514 @@
+"""Terrain tiles streamed from the disk around the player.
+
+A tile set is a directory with a tiles.json description and a .npy
+height grid per tile. Neighbouring tiles share their edge samples, so
+the ground is continuous across the tile borders.
+"""
+
+import collections
+import json
+import math
+import os
+import queue
+import sys
+import threading
+
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    sys.stderr.write("NumPy not found.\n")
+    exit()
+
+try:
+    from panda3d.core import Geom
+    from panda3d.core import GeomNode
+    from panda3d.core import GeomTriangles
+    from panda3d.core import GeomVertexArrayFormat
+    from panda3d.core import GeomVertexData
+    from panda3d.core import GeomVertexFormat
+    from panda3d.core import InternalName
+    from panda3d.core import NodePath
+except ModuleNotFoundError:
+    sys.stderr.write("Panda3d not found.\n")
+    exit()
+
+
+from height_map import HeightMap
+
+
+DESCRIPTION_FILE = "tiles.json"
+TILE_FILE = "tile_{}_{}.npy"
+
+# Max. ring distance from the player's tile and the sample stride of the
+# tiles within it. Farther tiles use the last stride.
+DEFAULT_LOD_RINGS = ((1, 1), (2, 2), (None, 4))
+
+LOW_COLOR = np.array([0.27, 0.42, 0.2, 1.0])
+HIGH_COLOR = np.array([0.55, 0.5, 0.42, 1.0])
+COLOR_HEIGHT_M = 30.0  # Height of the HIGH_COLOR.
+SKIRT_DEPTH_M = 2.0  # Hides the cracks between different strides.
+
+
+class StreamedTerrain:
+    """Ring of the loaded tiles that follows the player.
+
+    Loading a tile and building its mesh happen in a background thread,
+    the frame only attaches a few finished tiles. Farther tiles have
+    coarser meshes. The number of the loaded tiles depends on the ring
+    radius, not the world size, so neither the memory nor the per-frame
+    cost grows with the world.
+
+    Ground queries work like the HeightMap ones, across the tile
+    borders, and return None over the tiles that aren't loaded yet.
+    """
+
+    MAX_ATTACHED_PER_FRAME = 2
+
+    def __init__(self, directory: str, parent: NodePath,
+                 radius_tiles: int = 3, lod_rings: tuple = DEFAULT_LOD_RINGS):
+        """Read the tile set description and start the loader thread.
+
+        Parameters:
+        directory -- tile set written by the write_tiles.
+        parent -- node the tiles are shown under.
+        radius_tiles -- ring distance of the loaded tiles from the
+                        player's one, tiles one more away are kept too.
+        lod_rings -- (max. ring distance, sample stride) pairs.
+        """
+
+        with open(os.path.join(directory, DESCRIPTION_FILE)) as json_file:
+            description = json.load(json_file)
+
+        self.tile_size_m = description["tile_size_m"]
+        self.cell_size_m = description["cell_size_m"]
+        self.origin_x_m = description["origin_x_m"]
+        self.origin_y_m = description["origin_y_m"]
+        self.tiles_x = description["tiles_x"]
+        self.tiles_y = description["tiles_y"]
+        self.width_m = self.tiles_x * self.tile_size_m
+        self.height_m = self.tiles_y * self.tile_size_m
+
+        self.tiles = {}  # (column, row): LoadedTile.
+        self.loaded_count = 0
+        self.unloaded_count = 0
+
+        self.__directory = directory
+        self.__parent = parent
+        self.__radius_tiles = radius_tiles
+        self.__lod_rings = lod_rings
+        self.__lod_shift = 0  # Rings the strides are coarsened nearer by.
+        self.__focus_tile = None
+        self.__wanted = {}  # (column, row): stride.
+        self.__requested = set()  # (column, row, stride) in the loader.
+        self.__requests = queue.Queue()
+        self.__results = collections.deque()
+
+        # Grids of the loaded tiles stacked for the batched queries. The
+        # tiles kept around the focus never need more slots.
+        self.__tile_cells = round(self.tile_size_m / self.cell_size_m)
+        slot_count = (2 * radius_tiles + 3)**2
+        self.__grids = np.full((slot_count, self.__tile_cells + 1,
+                                self.__tile_cells + 1), np.nan)
+        self.__slot_table = np.full((self.tiles_y + 2, self.tiles_x + 2), -1)
+        self.__free_slots = list(range(slot_count - 1, -1, -1))
+
+        self.__thread = threading.Thread(target=self.__load_tiles,
+                                         name="terrain_streaming",
+                                         daemon=True)
+        self.__thread.start()
+
+    def close(self):
+        """Stop the loader thread after the tile it is building.
+
+        The thread holds the streamed terrain, so this has to be called
+        explicitly rather than left to the garbage collector.
+        """
+
+        self.__requests.put(None)
+        self.__thread.join()
+
+    def height_at(self, x_m: float, y_m: float):
+        """Return the ground Z under a point or None if unknown.
+
+        Parameters:
+        x_m -- X coordinate in the terrain space.
+        y_m -- Y coordinate in the terrain space.
+        """
+
+        tile = self.tiles.get(self.__tile_of(x_m, y_m))
+
+        if tile is None:
+            return None
+        return tile.height_map.height_at(x_m, y_m)
+
+    def heights_at(self, x_m: np.ndarray, y_m: np.ndarray) -> np.ndarray:
+        """Return the ground Z under many points at once, NaN if unknown.
+
+        Parameters:
+        x_m -- X coordinates in the terrain space.
+        y_m -- Y coordinates in the terrain space, the same shape.
+        """
+
+        cells = self.__tile_cells
+        col_f = (np.asarray(x_m) - self.origin_x_m) / self.cell_size_m
+        row_f = (np.asarray(y_m) - self.origin_y_m) / self.cell_size_m
+
+        # The lookup table has a border of empty slots around the tiles.
+        tile_col = np.clip(np.floor(col_f / cells), -1, self.tiles_x)
+        tile_row = np.clip(np.floor(row_f / cells), -1, self.tiles_y)
+        slot = self.__slot_table[tile_row.astype(np.int64) + 1,
+                                 tile_col.astype(np.int64) + 1]
+
+        col_f -= tile_col * cells
+        row_f -= tile_row * cells
+        col = np.clip(col_f.astype(np.int64), 0, cells - 1)
+        row = np.clip(row_f.astype(np.int64), 0, cells - 1)
+        ratio_x = col_f - col
+        ratio_y = row_f - row
+
+        grids = self.__grids
+        z_m = (grids[slot, row, col] * (1 - ratio_x)
+               + grids[slot, row, col + 1] * ratio_x) * (1 - ratio_y) \
+            + (grids[slot, row + 1, col] * (1 - ratio_x)
+               + grids[slot, row + 1, col + 1] * ratio_x) * ratio_y
+
+        z_m[slot < 0] = np.nan
+        return z_m
+
+    def is_ready(self) -> bool:
+        """Tell if all the wanted tiles are shown."""
+
+        return self.__focus_tile is not None and all(
+            key in self.tiles and self.tiles[key].stride == stride
+            for key, stride in self.__wanted.items())
+
+    def set_lod_shift(self, rings: int):
+        """Use the coarser strides nearer to the player, e.g. under load.
+
+        Parameters:
+        rings -- how many rings nearer every stride starts, zero for the
+                 lod_rings given to the constructor.
+        """
+
+        if rings == self.__lod_shift:
+            return
+
+        self.__lod_shift = rings
+
+        if self.__focus_tile is not None:
+            self.__plan()
+
+    def update(self, focus_x_m: float, focus_y_m: float):
+        """Request the tiles around the focus and attach the loaded ones.
+
+        Parameters:
+        focus_x_m -- X coordinate of the player in the terrain space.
+        focus_y_m -- Y coordinate of the player in the terrain space.
+        """
+
+        focus_tile = self.__tile_of(focus_x_m, focus_y_m)
+
+        if focus_tile != self.__focus_tile:
+            self.__focus_tile = focus_tile
+            self.__plan()
+
+        for _ in range(self.MAX_ATTACHED_PER_FRAME):
+            if not self.__results:
+                break
+            self.__attach(*self.__results.popleft())
+
+    def __attach(self, key: tuple, stride: int, height_map: HeightMap,
+                 mesh: NodePath):
+        """Show a tile from the loader, unless it is no longer wanted.
+
+        Parameters:
+        key -- (column, row) of the tile.
+        stride -- sample stride of the mesh.
+        height_map -- ground queries of the tile.
+        mesh -- built tile geometry.
+        """
+
+        self.__requested.discard(key + (stride,))
+
+        if self.__wanted.get(key) != stride:
+            mesh.removeNode()
+            return
+
+        old_tile = self.tiles.get(key)
+
+        if old_tile is not None:
+            old_tile.mesh.removeNode()
+            slot = old_tile.slot
+        else:
+            slot = self.__free_slots.pop()
+            self.__grids[slot] = height_map.heights
+            self.__slot_table[key[1] + 1, key[0] + 1] = slot
+            self.loaded_count += 1
+
+        mesh.reparentTo(self.__parent)
+        self.tiles[key] = LoadedTile(height_map, mesh, stride, slot)
+
+    def __load_tiles(self):
+        """Read the tiles and build their meshes until stopped."""
+
+        while True:
+            request = self.__requests.get()
+
+            if request is None:
+                break
+
+            key, stride, height_map = request
+            origin_x_m = self.origin_x_m + key[0] * self.tile_size_m
+            origin_y_m = self.origin_y_m + key[1] * self.tile_size_m
+
+            if height_map is None:
+                height_map = HeightMap(
+                    np.load(os.path.join(self.__directory,
+                                         TILE_FILE.format(*key)))
+                    .astype(np.float64),
+                    origin_x_m, origin_y_m, self.cell_size_m)
+
+            mesh = build_tile_mesh(height_map.heights, origin_x_m,
+                                   origin_y_m, self.cell_size_m, stride)
+            mesh.setName("terrain_tile_{}_{}".format(*key))
+
+            self.__results.append((key, stride, height_map, mesh))
+
+    def __plan(self):
+        """Choose the tiles and strides around the focus tile."""
+
+        focus_column, focus_row = self.__focus_tile
+        self.__wanted = {}
+
+        for row in range(max(focus_row - self.__radius_tiles, 0),
+                         min(focus_row + self.__radius_tiles + 1,
+                             self.tiles_y)):
+            for column in range(max(focus_column - self.__radius_tiles, 0),
+                                min(focus_column + self.__radius_tiles + 1,
+                                    self.tiles_x)):
+                ring = max(abs(column - focus_column), abs(row - focus_row))
+                self.__wanted[column, row] = self.__stride_of(ring)
+
+        # Keep one more ring, so walking along a border doesn't reload.
+        for key in list(self.tiles):
+            ring = max(abs(key[0] - focus_column), abs(key[1] - focus_row))
+
+            if key in self.__wanted:
+                continue
+            elif ring <= self.__radius_tiles + 1:
+                self.__wanted[key] = self.tiles[key].stride
+            else:
+                self.__unload(key)
+
+        # The nearest tiles first.
+        for key, stride in sorted(
+                self.__wanted.items(),
+                key=lambda item: max(abs(item[0][0] - focus_column),
+                                     abs(item[0][1] - focus_row))):
+            tile = self.tiles.get(key)
+
+            if tile is not None and tile.stride == stride \
+                    or key + (stride,) in self.__requested:
+                continue
+
+            self.__requested.add(key + (stride,))
+            self.__requests.put((key, stride,
+                                 None if tile is None else tile.height_map))
+
+    def __stride_of(self, ring: int) -> int:
+        """Return the sample stride of a ring.
+
+        Parameters:
+        ring -- ring distance from the focus tile.
+        """
+
+        for max_ring, stride in self.__lod_rings:
+            if max_ring is None or ring + self.__lod_shift <= max_ring:
+                return stride
+        return self.__lod_rings[-1][1]
+
+    def __unload(self, key: tuple):
+        """Remove a tile and free its slot.
+
+        Parameters:
+        key -- (column, row) of the tile.
+        """
+
+        tile = self.tiles.pop(key)
+        tile.mesh.removeNode()
+
+        self.__slot_table[key[1] + 1, key[0] + 1] = -1
+        self.__free_slots.append(tile.slot)
+        self.unloaded_count += 1
+
+    def __tile_of(self, x_m: float, y_m: float) -> tuple:
+        """Return the (column, row) of the tile under a point.
+
+        Parameters:
+        x_m -- X coordinate in the terrain space.
+        y_m -- Y coordinate in the terrain space.
+        """
+
+        return (min(max(int(math.floor((x_m - self.origin_x_m)
+                                       / self.tile_size_m)), 0),
+                    self.tiles_x - 1),
+                min(max(int(math.floor((y_m - self.origin_y_m)
+                                       / self.tile_size_m)), 0),
+                    self.tiles_y - 1))
+
+
+class LoadedTile:
+    """Tile shown by the streamed terrain."""
+
+    def __init__(self, height_map: HeightMap, mesh: NodePath, stride: int,
+                 slot: int):
+        """Keep the parts of the tile.
+
+        Parameters:
+        height_map -- ground queries, its grid is reused by the stride
+                      changes.
+        mesh -- shown geometry.
+        stride -- sample stride of the mesh.
+        slot -- index of the grid in the batched queries.
+        """
+
+        self.height_map = height_map
+        self.slot = slot
+        self.mesh = mesh
+        self.stride = stride
+
+
+def build_tile_mesh(heights: np.ndarray, origin_x_m: float,
+                    origin_y_m: float, cell_size_m: float,
+                    stride: int = 1) -> NodePath:
+    """Return a colored triangle grid of every stride-th sample.
+
+    A skirt hanging down from the edges hides the cracks next to tiles
+    of other strides. Safe to call outside the main thread.
+
+    Parameters:
+    heights -- (rows, columns) grid, (size - 1) divisible by the stride.
+    origin_x_m -- X coordinate of the first column.
+    origin_y_m -- Y coordinate of the first row.
+    cell_size_m -- distance between neighbouring samples.
+    stride -- every how many samples a vertex is made.
+    """
+
+    grid = heights[::stride, ::stride]
+    rows, columns = grid.shape
+
+    x_m, y_m = np.meshgrid(origin_x_m + np.arange(columns) * cell_size_m
+                           * stride,
+                           origin_y_m + np.arange(rows) * cell_size_m
+                           * stride)
+
+    # Darker slopes, so the relief is visible without the lights.
+    slope_y, slope_x = np.gradient(grid, cell_size_m * stride)
+    shade = 1 / np.sqrt(1 + slope_x**2 + slope_y**2)
+    height_ratio = np.clip(grid / COLOR_HEIGHT_M, 0, 1)[..., None]
+    colors = LOW_COLOR + (HIGH_COLOR - LOW_COLOR) * height_ratio
+    colors[..., :3] *= shade[..., None]
+
+    vertices = np.concatenate([np.stack([x_m, y_m, grid], axis=-1),
+                               colors], axis=-1).reshape(-1, 7)
+
+    first = (np.arange(rows - 1)[:, None] * columns
+             + np.arange(columns - 1)[None, :]).ravel()
+    triangles = np.stack([first, first + 1, first + columns + 1,
+                          first, first + columns + 1, first + columns],
+                         axis=1).reshape(-1, 3)
+
+    # Edge vertices around the tile and their copies lowered by the skirt.
+    edge = np.concatenate([np.arange(columns),
+                           np.arange(1, rows) * columns + columns - 1,
+                           (rows - 1) * columns + np.arange(columns - 2,
+                                                            -1, -1),
+                           np.arange(rows - 2, 0, -1) * columns])
+    skirt = vertices[edge].copy()
+    skirt[:, 2] -= SKIRT_DEPTH_M
+    skirt_idx = len(vertices) + np.arange(len(edge))
+
+    edge_next = np.roll(edge, -1)
+    skirt_next = np.roll(skirt_idx, -1)
+
+    # Both windings, the skirt is seen from both sides.
+    skirt_triangles = np.concatenate([
+        np.stack([edge, skirt_idx, skirt_next], axis=1),
+        np.stack([edge, skirt_next, edge_next], axis=1),
+        np.stack([edge, skirt_next, skirt_idx], axis=1),
+        np.stack([edge, edge_next, skirt_next], axis=1)])
+
+    vertices = np.concatenate([vertices, skirt]).astype(np.float32)
+    triangles = np.concatenate([triangles, skirt_triangles]) \
+        .astype(np.uint32)
+
+    vertex_data = GeomVertexData("terrain_tile", __vertex_format(),
+                                 Geom.UHStatic)
+    vertex_data.uncleanSetNumRows(len(vertices))
+    memoryview(vertex_data.modifyArray(0)).cast('B')[:] = vertices.tobytes()
+
+    primitive = GeomTriangles(Geom.UHStatic)
+    primitive.setIndexType(Geom.NTUint32)
+    indices = primitive.modifyVertices()
+    indices.uncleanSetNumRows(triangles.size)
+    memoryview(indices).cast('B')[:] = triangles.tobytes()
+
+    geom = Geom(vertex_data)
+    geom.addPrimitive(primitive)
+    node = GeomNode("terrain_tile")
+    node.addGeom(geom)
+
+    return NodePath(node)
+
+
+def write_tiles(directory: str, heights: np.ndarray, tile_samples: int,
+                cell_size_m: float, origin_x_m: float = None,
+                origin_y_m: float = None):
+    """Split a big height grid into a tile set.
+
+    Parameters:
+    directory -- output directory, created if needed.
+    heights -- (rows, columns) grid, rows go along the Y axis, both
+               sizes are a multiple of (tile_samples - 1) plus one.
+    tile_samples -- samples per tile side, including the shared edge.
+    cell_size_m -- distance between neighbouring samples.
+    origin_x_m -- X of the first column, centered at zero by default.
+    origin_y_m -- Y of the first row, centered at zero by default.
+    """
+
+    cells = tile_samples - 1
+    tiles_y = (heights.shape[0] - 1) // cells
+    tiles_x = (heights.shape[1] - 1) // cells
+
+    if origin_x_m is None:
+        origin_x_m = -tiles_x * cells * cell_size_m / 2
+    if origin_y_m is None:
+        origin_y_m = -tiles_y * cells * cell_size_m / 2
+
+    os.makedirs(directory, exist_ok=True)
+
+    for row in range(tiles_y):
+        for column in range(tiles_x):
+            np.save(os.path.join(directory, TILE_FILE.format(column, row)),
+                    heights[row * cells:(row + 1) * cells + 1,
+                            column * cells:(column + 1) * cells + 1]
+                    .astype(np.float32))
+
+    with open(os.path.join(directory, DESCRIPTION_FILE), 'w') as json_file:
+        json.dump({"tile_size_m": cells * cell_size_m,
+                   "cell_size_m": cell_size_m,
+                   "origin_x_m": origin_x_m, "origin_y_m": origin_y_m,
+                   "tiles_x": tiles_x, "tiles_y": tiles_y},
+                  json_file, indent=1)
+
+
+def __vertex_format() -> GeomVertexFormat:
+    """Return the position and color format of the tile vertices."""
+
+    array_format = GeomVertexArrayFormat()
+    array_format.addColumn(InternalName.getVertex(), 3, Geom.NTFloat32,
+                           Geom.CPoint)
+    array_format.addColumn(InternalName.getColor(), 4, Geom.NTFloat32,
+                           Geom.CColor)
+
+    return GeomVertexFormat.registerFormat(array_format)
@@ -1,37 +1,49 @@
+from __future__ import annotations
+
 import math
 import sys
+import time
+from typing import TYPE_CHECKING
 
 try:
-    from direct.actor.Actor import Actor
-    from panda3d.core import CollisionHandlerQueue
-    from panda3d.core import CollideMask
-    from panda3d.core import CollisionNode
-    from panda3d.core import CollisionRay
-    from panda3d.core import CollisionSphere
-    from panda3d.core import CollisionTraverser
-    from panda3d.core import ModelRoot
     from panda3d.core import Vec3
 except ModuleNotFoundError:
     sys.stderr.write("Panda3d not found.\n")
     exit()
 
 
+from collisions import BOOM_PASS
+from collisions import Collisions
 import controls
 import rotation
 
+if TYPE_CHECKING:  # Annotations only, not worth importing at the start.
+    from direct.actor.Actor import Actor
+    from panda3d.core import ModelRoot
+
+    from height_map import HeightMap
+
 
 class TPPCamera:
     """As in the name.."""
 
-    def __init__(self):
+    BOOM_BUDGET_MS = 0.2  # Average time of the boom test per frame.
+
+    def __init__(self, collisions: Collisions):
         """Adjust the third-person perspective and camera collision
         models.
+
+        Parameters:
+        collisions -- shared terrain collisions service.
         """
 
         self.__DEFAULT_Y_OFFSET_M = 2.5
         self.__MIN_Y_OFFSET_M = 0.0
         self.__MIN_PITCH_DEG = -90  # Down.
         self.__max_pitch_deg = 0  # Up.
+        self.__BOOM_CLEARANCE_M = 0.3  # Sphere radius kept from the walls.
+        self.__BOOM_EPSILON_M = 1e-3  # Smaller moves reuse the last test.
+        self.__MAX_BOOM_SKIPPED_FRAMES = 4  # E.g. after a cold first test.
 
         self.__relative_offset_m = Vec3(1, self.__DEFAULT_Y_OFFSET_M, 1.7)
         self.__ROTATION_RADIUS_M = math.sqrt(
@@ -39,25 +51,73 @@ class TPPCamera:
             + self.__relative_offset_m.getZ()**2)
 
         base.camera.setPos(self.__relative_offset_m)
+        self.basis = rotation.Basis()  # Shared with the player movement.
         base.camLens.setFov(90)
 
-        self.coll_checker = CollisionTraverser()
-        self.coll_handler = CollisionHandlerQueue()
+        from panda3d.core import CollisionNode
+        from panda3d.core import CollisionRay
+        from panda3d.core import CollisionSphere
+
+        self.__collisions = collisions
 
         self.vertical_coll_ray = base.camera.attachNewNode(CollisionNode(
             "camera_coll_node"))
 
         # Look down straight on the terrain to check for collisions.
         self.vertical_coll_ray.node().addSolid(CollisionRay(0, 0, 0, 0, 0, -1))
-        self.vertical_coll_ray.node().setFromCollideMask(CollideMask.allOn())
+        self.__collisions.add_collider(self.vertical_coll_ray)
 
-        self.horizontal_coll_sphere = base.camera.attachNewNode(CollisionNode(
-            "camera_coll_node"))
+        # Swept along the boom from the player's head to the camera, so
+        # it lives in the world space, not under the camera.
+        self.horizontal_coll_sphere = base.render.attachNewNode(
+            CollisionNode("camera_boom_coll_node"))
 
         self.horizontal_coll_sphere.node().addSolid(
-            CollisionSphere(Vec3(0), 1))
-        self.horizontal_coll_sphere.node().setFromCollideMask(
-            CollideMask.allOn())
+            CollisionSphere(Vec3(0), self.__BOOM_CLEARANCE_M))
+        self.__collisions.add_collider(self.horizontal_coll_sphere,
+                                       BOOM_PASS, swept=True)
+
+        self.boom_stats = {"tests": 0, "reuses": 0, "skips": 0, "hits": 0,
+                           "time_s": 0.0}
+        self.boom_test_interval = 1  # Min. frames from a test to the next.
+        self.__boom_pivot_m = None
+        self.__boom_desired_m = None
+        self.__boom_pulled_in_m = None  # Last contact, None if clear.
+        self.__boom_frames_to_skip = 0
+
+    def avoid_occlusion(self, player_pos_m: Vec3):
+        """Pull the camera in along the boom if the terrain is in the way.
+
+        The sphere is swept from the pivot above the player to the
+        rotated camera, the nearest contact becomes the camera position.
+        When the boom hasn't moved, the last result is reused. A test
+        that exceeds the BOOM_BUDGET_MS makes the next frames reuse
+        it too, to keep the average cost within the budget.
+
+        Parameters:
+        player_pos_m -- current player position.
+        """
+
+        pivot_m = Vec3(player_pos_m)
+        pivot_m.setZ(pivot_m.getZ() + self.__relative_offset_m.getZ())
+        desired_m = base.camera.getPos()
+
+        if self.__boom_pivot_m is not None \
+                and pivot_m.almostEqual(self.__boom_pivot_m,
+                                        self.__BOOM_EPSILON_M) \
+                and desired_m.almostEqual(self.__boom_desired_m,
+                                          self.__BOOM_EPSILON_M):
+            self.boom_stats["reuses"] += 1
+
+        elif self.__boom_frames_to_skip > 0:
+            self.__boom_frames_to_skip -= 1
+            self.boom_stats["skips"] += 1
+
+        else:
+            self.__test_boom(pivot_m, desired_m)
+
+        if self.__boom_pulled_in_m is not None:
+            base.camera.setPos(self.__boom_pulled_in_m)
 
     def change_position(self, player_delta_vector_m: Vec3):
         """Relatively change the camera position.
@@ -72,104 +132,150 @@ class TPPCamera:
                            base.camera.getY() + player_delta_vector_m.getY(),
                            base.camera.getZ() + player_delta_vector_m.getZ())
 
-    def fly_over_terrain(self, player: Actor, terrain: ModelRoot):
+    def fly_over_terrain(self, player: Actor, terrain: ModelRoot,
+                         height_map: HeightMap = None):
         """Set the max_pitch_deg to block the camere if is near
         the terrain to prevent overlapping.
 
         Parameters:
         player -- player's model.
         terrain -- terrain's model.
+        height_map -- precomputed terrain heights, the ray is cast only
+                      where it doesn't know the ground, e.g. overhangs.
         """
 
         safety_angle_deg = 10
+        terrain_z = None
 
-        self.coll_checker.addCollider(self.vertical_coll_ray,
-                                      self.coll_handler)
-        self.coll_checker.traverse(terrain)
-        terrain_colls = list(self.coll_handler.getEntries())
+        if height_map is not None:
+            camera_pos = base.camera.getPos(terrain)
+            terrain_z = height_map.height_at(camera_pos.getX(),
+                                             camera_pos.getY())
 
-        if terrain_colls:
-            terrain_coll_z = terrain_colls[0].getSurfacePoint(terrain).getZ() \
-                - player.getZ() - self.__relative_offset_m.getZ()
+        if terrain_z is None:
+            terrain_z = self.__cast_vertical_ray(terrain)
+
+        if terrain_z is not None:
+            terrain_coll_z = terrain_z - player.getZ() \
+                - self.__relative_offset_m.getZ()
 
             negative_max_pitch_radians = math.atan2(
                 terrain_coll_z, self.__relative_offset_m.getY())
 
             self.__max_pitch_deg = -math.degrees(negative_max_pitch_radians) \
                                    - safety_angle_deg
-        self.coll_checker.clearColliders()
 
-    def rotate(self, player_delta_vector_m: Vec3):
-        """Rotate the camera relatively to the player using the magical
-        trigonometry.
+    def follow(self, player_pos_m: Vec3):
+        """Place the camera around the player using the magical
+        trigonometry and the basis set by the rotate.
 
         Parameters:
-        player_delta_vector_m -- 3D vector that describes how
-                                 the player has moved in the last
-                                 frame.
+        player_pos_m -- rendered player position.
         """
 
-        base.camera.setH(-controls.mouse_pos['x']
-                         * controls.MOUSE_SENSITIVITY_DEG)
+        # Sideways by the X offset, behind and above by the Y offset.
+        camera_pos = player_pos_m \
+            + self.basis.right * self.__relative_offset_m.getX() \
+            - self.basis.forward * (self.__relative_offset_m.getY()
+                                    * self.basis.pitch_cos)
 
-        controls.limit_mouse_pos(self.__MIN_PITCH_DEG, self.__max_pitch_deg)
+        camera_pos.setZ(camera_pos.getZ() + self.__relative_offset_m.getZ()
+                        - self.basis.pitch_sin
+                        * self.__relative_offset_m.getY())
 
-        if controls.mouse_pos['y'] * controls.MOUSE_SENSITIVITY_DEG \
-                < self.__MIN_PITCH_DEG:
-            base.camera.setP(self.__MIN_PITCH_DEG)
+        base.camera.setPos(camera_pos)
 
-        elif controls.mouse_pos['y'] * controls.MOUSE_SENSITIVITY_DEG \
-                > self.__max_pitch_deg:
-            base.camera.setP(self.__max_pitch_deg)
+    def __cast_vertical_ray(self, terrain: ModelRoot):
+        """Return the terrain Z under the camera found by the ray or None.
 
-        else:
-            base.camera.setP(controls.mouse_pos['y']
-                             * controls.MOUSE_SENSITIVITY_DEG)
+        Parameters:
+        terrain -- terrain's model.
+        """
+
+        terrain_colls = self.__collisions.entries(self.vertical_coll_ray)
+
+        if terrain_colls:
+            return terrain_colls[0].getSurfacePoint(terrain).getZ()
+        return None
+
+    def __test_boom(self, pivot_m: Vec3, desired_m: Vec3):
+        """Sweep the sphere along the boom and remember the contact.
+
+        Parameters:
+        pivot_m -- boom start, above the player.
+        desired_m -- boom end, where the camera would be without walls.
+        """
+
+        start_s = time.perf_counter()
+
+        self.horizontal_coll_sphere.setPos(pivot_m)
+        self.horizontal_coll_sphere.setFluidPos(desired_m)
+        boom_colls = self.__collisions.entries(self.horizontal_coll_sphere)
+
+        self.__boom_pulled_in_m = None
+
+        if boom_colls:
+            self.__boom_pulled_in_m = boom_colls[0].getContactPos(base.render)
+            self.boom_stats["hits"] += 1
 
-        camera_yaw_deg = base.camera.getH()
-        camera_yaw_rad = math.radians(camera_yaw_deg)
-        camera_yaw_quarter = rotation.get_angle_quarter(camera_yaw_deg)
+        self.__boom_pivot_m = pivot_m
+        self.__boom_desired_m = desired_m
 
-        pos_x_of_x_offset_m = 0
-        pos_y_of_x_offset_m = 0
+        elapsed_s = time.perf_counter() - start_s
+        self.boom_stats["tests"] += 1
+        self.boom_stats["time_s"] += elapsed_s
 
-        if camera_yaw_quarter == 1 or 2:
-            pos_x_of_x_offset_m = math.cos(camera_yaw_rad) \
-                * self.__relative_offset_m.getX()
+        self.__boom_frames_to_skip = max(
+            self.boom_test_interval - 1,
+            min(self.__MAX_BOOM_SKIPPED_FRAMES,
+                math.ceil(elapsed_s * 1e3 / self.BOOM_BUDGET_MS) - 1))
 
-            pos_y_of_x_offset_m = math.sin(camera_yaw_rad) \
-                * self.__relative_offset_m.getX()
+    def load_state(self, state: tuple):
+        """Set a state returned by the save_state and turn the camera.
 
-        elif camera_yaw_quarter == 3:
-            angle_rad = math.radians(camera_yaw_deg - 90)
+        Parameters:
+        state -- saved values.
+        """
 
-            pos_x_of_x_offset_m = -math.sin(angle_rad) \
-                * self.__relative_offset_m.getX()
+        (mouse_x, mouse_y, offset_x_m, offset_y_m, offset_z_m,
+         self.__max_pitch_deg) = state
 
-            pos_y_of_x_offset_m = math.cos(angle_rad) \
-                * self.__relative_offset_m.getX()
+        controls.set_mouse_pos(mouse_x, mouse_y)  # The pointer too.
+        self.__relative_offset_m.set(offset_x_m, offset_y_m, offset_z_m)
+        self.__boom_pivot_m = None  # Tested again at the restored pose.
+        self.__boom_pulled_in_m = None
+        self.__boom_frames_to_skip = 0
+        self.rotate()
 
-        elif camera_yaw_quarter == 4:
-            angle_rad = math.radians(camera_yaw_deg - 180)
+    def save_state(self) -> tuple:
+        """Return the mouse position, boom offset and pitch limit."""
 
-            pos_x_of_x_offset_m = -math.cos(angle_rad) \
-                * self.__relative_offset_m.getX()
+        return (controls.mouse_pos['x'], controls.mouse_pos['y'],
+                self.__relative_offset_m.getX(),
+                self.__relative_offset_m.getY(),
+                self.__relative_offset_m.getZ(), self.__max_pitch_deg)
 
-            pos_y_of_x_offset_m = -math.sin(angle_rad) \
-                * self.__relative_offset_m.getX()
+    def rotate(self):
+        """Turn the camera following the mouse.
 
-        camera_pitch_rad = math.radians(base.camera.getP())
+        Updates the basis that the player moves along.
+        """
 
-        # Pitch cosinus - looking down.
-        x = player_delta_vector_m.getX() + pos_x_of_x_offset_m \
-            + (math.sin(camera_yaw_rad) * self.__relative_offset_m.getY()
-               * math.cos(camera_pitch_rad))
+        base.camera.setH(-controls.mouse_pos['x']
+                         * controls.MOUSE_SENSITIVITY_DEG)
 
-        y = player_delta_vector_m.getY() + pos_y_of_x_offset_m \
-            + (math.cos(camera_yaw_rad) * -self.__relative_offset_m.getY()
-               * math.cos(camera_pitch_rad))
+        controls.limit_mouse_pos(self.__MIN_PITCH_DEG, self.__max_pitch_deg)
 
-        z = player_delta_vector_m.getZ() + self.__relative_offset_m.getZ() \
-            + (math.sin(-camera_pitch_rad) * self.__relative_offset_m.getY())
+        if controls.mouse_pos['y'] * controls.MOUSE_SENSITIVITY_DEG \
+                < self.__MIN_PITCH_DEG:
+            base.camera.setP(self.__MIN_PITCH_DEG)
+
+        elif controls.mouse_pos['y'] * controls.MOUSE_SENSITIVITY_DEG \
+                > self.__max_pitch_deg:
+            base.camera.setP(self.__max_pitch_deg)
+
+        else:
+            base.camera.setP(controls.mouse_pos['y']
+                             * controls.MOUSE_SENSITIVITY_DEG)
 
-        base.camera.setPos(x, y, z)
+        self.basis.update(base.camera.getH(), base.camera.getP())
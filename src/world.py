@@ -1,29 +1,256 @@
-from player import Player
+import sys
+import threading
+import time
+
+try:
+    from direct.task.Task import Task
+    from panda3d.core import CollideMask
+except ModuleNotFoundError:
+    sys.stderr.write("Panda3d not found.\n")
+    exit()
+
+
+import asset_cache
 
 
 class World:
-    """Just player and terrain inside."""
+    """Just player and terrain inside.
 
-    def __init__(self):
-        """Load an environment."""
+    The models are loaded by the Panda3D async loader, all at once, and
+    the terrain collision data is built in a separate thread, so the
+    main loop keeps running meanwhile. A large terrain can be streamed
+    from the tiles around the player instead.
+    """
 
-        try:
-            self.terrain = base.loader.loadModel("../assets/terrain.egg")
-            self.player = Player()
-            self.player.setZ(1)  # Set higher to "fall" on the terrain.
-        except OSError:  # Error during a model/texture loading.
-            raise
+    ASSETS = {"terrain": "../assets/terrain.egg",
+              "player": "../assets/ralph",
+              "walk": "../assets/ralph-walk",
+              "run": "../assets/ralph-run"}
 
-        self.__render()
+    def __init__(self, on_ready, on_progress=None, tiles_dir: str = None,
+                 collision_tolerance_m: float = 0.1):
+        """Start loading an environment.
+
+        Parameters:
+        on_ready -- called without arguments when everything is loaded
+                    and rendered.
+        on_progress -- called with the loaded fraction and the name of
+                       the finished step.
+        tiles_dir -- terrain tile set to stream instead of the terrain
+                     model, see the terrain_streaming.
+        collision_tolerance_m -- max. height error of the simplified
+                                 terrain collision mesh.
+        """
+
+        self.terrain = None
+        self.player = None
+        self.height_map = None
+        self.terrain_collision = None
+        self.load_time_s = None
+        self.streamed_terrain = None
+        self.collision_triangle_count = 0
+
+        self.__on_ready = on_ready
+        self.__on_progress = on_progress
+        self.__collision_tolerance_m = collision_tolerance_m
+        self.__models = {}
+        self.__cached_paths = {}  # Asset name: .bam to convert it to.
+        self.__steps_done = 0
+        self.__terrain_data = None
+        self.__terrain_thread = None
+        self.__start_s = time.perf_counter()
+
+        assets = dict(self.ASSETS)
+
+        if tiles_dir is not None:
+            del assets["terrain"]
+            self.__stream_terrain(tiles_dir)
+
+        self.__STEPS_COUNT = len(assets) + 1  # And the terrain data.
+
+        for name, path in assets.items():
+            load_path, self.__cached_paths[name] = asset_cache.lookup(path)
+            base.loader.loadModel(load_path, callback=self.__store_model,
+                                  extraArgs=[name, load_path])
 
     def __del__(self):
         """Clean the environment."""
 
+        del self.terrain_collision
+        del self.streamed_terrain
+        del self.height_map
         del self.player
         del self.terrain
 
+    def create_actor(self):
+        """Return a new actor of the loaded player model and animations."""
+
+        from direct.actor.Actor import Actor
+
+        return Actor(self.__models["player"],
+                     {"walk": self.__models["walk"],
+                      "run": self.__models["run"]})
+
+    def __build_terrain_data(self, terrain):
+        """Precompute the heights and the collision chunks.
+
+        The collision chunks hold the simplified triangles, baked once
+        per terrain asset and tolerance and cached. Runs in the loading
+        thread, the terrain isn't rendered yet.
+
+        Parameters:
+        terrain -- loaded terrain model.
+        """
+
+        # Imported here to overlap the NumPy import with the loading.
+        import collision_mesh
+        from height_map import HeightMap
+        import terrain_chunks
+        import terrain_geometry
+
+        triangles = terrain_geometry.read_triangles(terrain)
+        height_map = HeightMap.from_triangles(triangles)
+        collision_triangles = collision_mesh.load_or_bake(
+            self.ASSETS["terrain"], triangles, height_map,
+            self.__collision_tolerance_m)
+
+        self.collision_triangle_count = len(collision_triangles)
+        self.__terrain_data = (height_map,
+                               terrain_chunks.build(collision_triangles))
+
+    def __create_player(self):
+        """Assemble the actor from the loaded model and animations."""
+
+        from player import Player  # Imports the Actor after the requests.
+
+        try:
+            self.player = Player(self.__models["player"],
+                                 {"walk": self.__models["walk"],
+                                  "run": self.__models["run"]})
+        except OSError:  # Error during a model/texture loading.
+            raise
+
+        self.player.setZ(1)  # Set higher to "fall" on the terrain.
+
+    def __finish_step(self, name: str):
+        """Report the progress and finish the loading after all steps.
+
+        Parameters:
+        name -- finished step.
+        """
+
+        self.__steps_done += 1
+
+        if self.__on_progress is not None:
+            self.__on_progress(self.__steps_done / self.__STEPS_COUNT, name)
+
+        if self.__steps_done < self.__STEPS_COUNT:
+            return
+
+        self.height_map, self.terrain_collision = self.__terrain_data
+        self.__render()
+        self.load_time_s = time.perf_counter() - self.__start_s
+        self.__on_ready()
+
     def __render(self):
         """Show the world."""
 
         self.terrain.reparentTo(base.render)
+
+        # Only the collision chunks are hit, never the render geometry.
+        self.terrain.setCollideMask(CollideMask.allOff())
+        self.terrain_collision.reparentTo(self.terrain)
         self.player.reparentTo(self.terrain)
+
+    def __store_model(self, model, name: str, path: str):
+        """Keep the model loaded in the background.
+
+        Parameters:
+        model -- loaded model, None if failed.
+        name -- asset name from the ASSETS.
+        path -- asset file.
+        """
+
+        if model is None:
+            raise OSError("Could not load model file: " + path)
+
+        self.__models[name] = model
+
+        if self.__cached_paths[name] is not None:  # First load.
+            asset_cache.store(model, self.__cached_paths[name])
+
+        if name == "terrain":
+            self.terrain = model
+            self.__terrain_thread = threading.Thread(
+                target=self.__build_terrain_data, args=(model,),
+                name="terrain_data", daemon=True)
+            self.__terrain_thread.start()
+            base.taskMgr.add(self.__wait_for_terrain_data,
+                             "__wait_for_terrain_data")
+
+        elif all(asset in self.__models
+                 for asset in ("player", "walk", "run")):
+            self.__create_player()
+
+        self.__finish_step(name)
+
+    def __stream_terrain(self, tiles_dir: str):
+        """Replace the terrain model with the tiles loaded around the
+        player.
+
+        The player's start tiles are loaded before the world is ready.
+        The movable area is set to the tile set extent.
+
+        Parameters:
+        tiles_dir -- terrain tile set.
+        """
+
+        from panda3d.core import NodePath
+
+        import invisible_border
+        from terrain_streaming import StreamedTerrain
+
+        self.terrain = NodePath("streamed_terrain")
+        self.terrain_collision = NodePath("terrain_collision")  # Empty.
+        self.streamed_terrain = StreamedTerrain(tiles_dir, self.terrain)
+        self.__terrain_data = (self.streamed_terrain, self.terrain_collision)
+
+        invisible_border.MOVABLE_AREA_METERS = {
+            "width": self.streamed_terrain.width_m,
+            "height": self.streamed_terrain.height_m}
+
+        base.taskMgr.add(self.__wait_for_terrain_tiles,
+                         "__wait_for_terrain_tiles")
+
+    def __wait_for_terrain_data(self, task: Task) -> Task:
+        """Poll the loading thread between frames.
+
+        Parameters:
+        task -- task form a task manager that is also returned to loop
+                the function.
+        """
+
+        if self.__terrain_thread.is_alive():
+            return Task.cont
+
+        if self.__terrain_data is None:  # The thread has failed.
+            raise OSError("Could not build the terrain collisions.")
+
+        self.__finish_step("terrain_data")
+        return Task.done
+
+    def __wait_for_terrain_tiles(self, task: Task) -> Task:
+        """Stream the tiles around the start point until all are shown.
+
+        Parameters:
+        task -- task form a task manager that is also returned to loop
+                the function.
+        """
+
+        self.streamed_terrain.update(0, 0)
+
+        if not self.streamed_terrain.is_ready():
+            return Task.cont
+
+        self.__finish_step("terrain_tiles")
+        return Task.done